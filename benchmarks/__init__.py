@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the datavalidation package. Run them with::
+
+	python -m benchmarks --help
+"""
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Runs the benchmarks of the datavalidation package.
+
+Example usage::
+
+	python -m benchmarks
+	python -m benchmarks --stage solve_equation --engine compiled --repeat 50
+	python -m benchmarks --json results.json
+
+	# performance regression gate, see the baseline module
+	python -m benchmarks --save-baseline
+	python -m benchmarks --compare --threshold 0.1
+
+With --compare, it exits with 1 if a tracked metric regressed and with 2 if this machine has no baseline.
+"""
+
+
+import sys
+import json
+import logging
+import argparse
+
+from datavalidation.core.config import set_up_logging
+
+# set logging before importing datavalidation so the benchmarks do not flood the log file
+set_up_logging(use_test_config=True)
+logging.getLogger().setLevel(logging.WARNING)
+
+
+from benchmarks.baseline import save_baseline, load_baseline, compare_results, format_comparison, \
+	run_import_benchmark, get_machine_fingerprint, BASELINE_FILE
+from benchmarks.data import get_benchmark_geometries, TEST_DATA_PATH
+from benchmarks.runner import run_benchmark, format_results
+from benchmarks.stages import get_stages
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks of the datavalidation package")
+	parser.add_argument("--stage", action="append", default=[],
+		help="only run the stages whose name contains this text (can be repeated)")
+	parser.add_argument("--repeat", type=int, default=20, help="maximum calls of each stage, default is 20")
+	parser.add_argument("--max-time", type=float, default=10, help="maximum seconds per stage, default is 10")
+	parser.add_argument("--engine", default=None, help="solver engine used by solve_equation")
+	parser.add_argument("--count", type=int, default=10, help="number of generated geometries, default is 10")
+	parser.add_argument("--seed", type=int, default=0, help="seed of the generated geometries, default is 0")
+	parser.add_argument("--data", default=TEST_DATA_PATH, help="folder with the JSON fixtures")
+	parser.add_argument("--no-memory", action="store_true", help="do not measure allocations")
+	parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+	parser.add_argument("--save-baseline", nargs="?", const=BASELINE_FILE, default=None, metavar="FILE",
+		help="save the results as the baseline of this machine")
+	parser.add_argument("--compare", nargs="?", const=BASELINE_FILE, default=None, metavar="FILE",
+		help="compare the results with the baseline of this machine, failing if a tracked metric regressed")
+	parser.add_argument("--threshold", type=float, default=0.1,
+		help="relative change after which a tracked metric has regressed, default is 0.1")
+	parser.add_argument("--track", action="append", default=None, metavar="NAME:METRIC",
+		help="benchmark name pattern and metric to compare (can be repeated), default is baseline.TRACKED_METRICS")
+	args = parser.parse_args(argv)
+
+	geometry_list = get_benchmark_geometries(args.count, args.seed, args.data)
+	result_list = []
+
+	for name, function, setup in get_stages(geometry_list, args.engine):
+		if len(args.stage) > 0 and not any(stage in name for stage in args.stage):
+			continue
+
+		result = run_benchmark(name, function, setup, args.repeat, args.max_time, not args.no_memory)
+		result_list.append(result)
+		print(format_results([result]).splitlines()[-1] if len(result_list) > 1 else format_results([result]))
+		sys.stdout.flush()
+
+	if len(args.stage) == 0 or any(stage in "import_time" for stage in args.stage):
+		result = run_import_benchmark(repeat=min(args.repeat, 5))
+		result_list.append(result)
+		print(format_results([result]).splitlines()[-1])
+
+	if args.json is not None:
+		with open(args.json, "w") as json_file:
+			json.dump(result_list, json_file, indent=4)
+
+	if args.save_baseline is not None:
+		save_baseline(result_list, args.save_baseline)
+		print("Baseline of machine '{}' saved to '{}'".format(get_machine_fingerprint()['key'], args.save_baseline))
+
+	if args.compare is not None:
+		baseline = load_baseline(args.compare)
+
+		if baseline is None:
+			# a regression gate that compares nothing must not pass
+			print("ERROR: no baseline for machine '{}' in '{}', save one with --save-baseline first".format(
+				get_machine_fingerprint()['key'], args.compare), file=sys.stderr)
+			return 2
+
+		tracked = [tuple(track.rsplit(":", 1)) for track in args.track] if args.track is not None else None
+		comparison_list = compare_results(result_list, baseline, tracked, args.threshold)
+		print(format_comparison(comparison_list))
+
+		if any(comparison['regressed'] for comparison in comparison_list):
+			return 1
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
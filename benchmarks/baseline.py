@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+baseline
+----------------------------------
+
+Module that saves benchmark results as baselines keyed by a fingerprint of the machine, and compares new results
+against them to catch performance regressions before a release::
+
+	# on the reference machine, from a known good commit
+	python -m benchmarks --save-baseline
+
+	# before releasing, fails if a tracked metric regressed more than 10%
+	python -m benchmarks --compare --threshold 0.1
+
+Timings are only comparable on the same machine, so results are compared against the baseline of the machine that
+runs them.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import sys
+import json
+import math
+import time
+import fnmatch
+import hashlib
+import logging
+import platform
+import subprocess
+import multiprocessing
+
+from benchmarks.runner import summarise_timings
+
+
+# default file with the baselines of every machine
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# metrics compared by default: (benchmark name pattern, metric)
+TRACKED_METRICS = [
+	("solve_equation[[]*:chainstay]", "p50"),
+	("request_validate_bike_geometry", "p50"),
+	("request_validate_bike_geometry", "ops_per_second"),
+	("import_time", "p50")
+]
+
+# metrics where a higher value is better, a lower value is better for the rest
+HIGHER_IS_BETTER = ["ops_per_second"]
+
+
+def get_machine_fingerprint() -> dict:
+	"""
+	Gets a fingerprint of the machine and Python interpreter running the benchmarks.
+
+	:return: dict with the machine details and their "key"
+	"""
+	machine = {
+		"system": platform.system(),
+		"machine": platform.machine(),
+		"processor": platform.processor(),
+		"cpu_count": multiprocessing.cpu_count(),
+		"python": platform.python_implementation() + " " + platform.python_version()
+	}
+	machine['key'] = hashlib.sha1(json.dumps(machine, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+	return machine
+
+
+def save_baseline(result_list: list, filepath: str = BASELINE_FILE, fingerprint: dict = None) -> dict:
+	"""
+	Saves benchmark results as the baseline of a machine, replacing its previous baseline and keeping those of the
+	other machines.
+
+	:param result_list: list of benchmark results (see runner.run_benchmark())
+	:param filepath: path of the baselines file, default is BASELINE_FILE
+	:param fingerprint: fingerprint of the machine, default is None for the current machine
+	:return: the baseline saved
+	"""
+	fingerprint = fingerprint if fingerprint is not None else get_machine_fingerprint()
+	baselines = _read_baselines(filepath)
+
+	baseline = {
+		"machine": fingerprint,
+		"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"results": {result['name']: result for result in result_list}
+	}
+	baselines[fingerprint['key']] = baseline
+
+	with open(filepath, "w") as baseline_file:
+		json.dump(baselines, baseline_file, indent=4, sort_keys=True)
+
+	logging.info("Baseline of machine '{}' saved to '{}'".format(fingerprint['key'], filepath))
+	return baseline
+
+
+def load_baseline(filepath: str = BASELINE_FILE, fingerprint: dict = None):
+	"""
+	Loads the baseline of a machine.
+
+	:param filepath: path of the baselines file, default is BASELINE_FILE
+	:param fingerprint: fingerprint of the machine, default is None for the current machine
+	:return: baseline dict or None if the machine has no baseline
+	"""
+	fingerprint = fingerprint if fingerprint is not None else get_machine_fingerprint()
+
+	return _read_baselines(filepath).get(fingerprint['key'])
+
+
+def compare_results(result_list: list, baseline: dict, tracked: list = None, threshold: float = 0.1) -> list:
+	"""
+	Compares benchmark results with a baseline.
+
+	:param result_list: list of benchmark results (see runner.run_benchmark())
+	:param baseline: baseline dict from load_baseline()
+	:param tracked: list of tuples (benchmark name pattern, metric) to compare, default is TRACKED_METRICS
+	:param threshold: relative change after which a metric has regressed, default is 0.1 (10%)
+	:return: list of dicts with the name, metric, baseline and current values, relative change and whether it regressed
+		(a benchmark with errors or a value that is not finite, e.g. NaN when every call failed, always regressed)
+	"""
+	tracked = tracked if tracked is not None else TRACKED_METRICS
+	comparison_list = []
+
+	for result in result_list:
+		baseline_result = baseline['results'].get(result['name'])
+		if baseline_result is None:
+			continue
+
+		for pattern, metric in tracked:
+			if not fnmatch.fnmatchcase(result['name'], pattern) or metric not in result or metric not in baseline_result:
+				continue
+
+			current, previous = result[metric], baseline_result[metric]
+			change = (current - previous) / previous if previous != 0 else 0.0
+
+			if result.get("errors", 0) > 0 or not math.isfinite(current):
+				regressed = True
+			else:
+				regressed = change < -threshold if metric in HIGHER_IS_BETTER else change > threshold
+
+			comparison_list.append({
+				"name": result['name'],
+				"metric": metric,
+				"baseline": previous,
+				"current": current,
+				"change": change,
+				"errors": result.get("errors", 0),
+				"regressed": regressed
+			})
+
+	return comparison_list
+
+
+def format_comparison(comparison_list: list) -> str:
+	"""
+	Formats a comparison as a table.
+
+	:param comparison_list: list of dicts returned by compare_results()
+	:return: table as a string
+	"""
+	header = "{:<48} {:>16} {:>14} {:>14} {:>9}".format("benchmark", "metric", "baseline", "current", "change")
+	lines = [header, "-" * len(header)]
+
+	for comparison in comparison_list:
+		lines.append("{:<48} {:>16} {:>14.6g} {:>14.6g} {:>+8.1%}{}".format(
+			comparison['name'][:48], comparison['metric'], comparison['baseline'], comparison['current'],
+			comparison['change'], "  REGRESSED" if comparison['regressed'] else "") +
+			(" ({} errors)".format(comparison['errors']) if comparison.get("errors", 0) > 0 else ""))
+
+	return "\n".join(lines)
+
+
+def run_import_benchmark(module: str = "datavalidation.datavalidation", repeat: int = 5) -> dict:
+	"""
+	Benchmarks the time to import a module in a new interpreter, so nothing is already imported.
+
+	:param module: name of the module, default is "datavalidation.datavalidation"
+	:param repeat: number of imports, default is 5
+	:return: dict with the results, like runner.run_benchmark()
+	"""
+	code = "import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)".format(module)
+	timings = []
+	errors = 0
+
+	for _ in range(repeat):
+		process = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+			cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), universal_newlines=True)
+
+		try:
+			timings.append(float(process.stdout.strip().splitlines()[-1]))
+		except (ValueError, IndexError):
+			errors += 1
+			logging.debug("Import of '{}' failed: {}".format(module, process.stderr))
+
+	if len(timings) == 0:
+		timings = [float("nan")]
+
+	return {
+		"name": "import_time",
+		**summarise_timings(timings),
+		"errors": errors
+	}
+
+
+def _read_baselines(filepath: str) -> dict:
+	"""
+	Reads the baselines file.
+
+	:param filepath: path of the baselines file
+	:return: dict with the baseline of each machine, {} if the file does not exist
+	"""
+	if not os.path.exists(filepath):
+		return {}
+
+	with open(filepath) as baseline_file:
+		return json.load(baseline_file)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+data
+----------------------------------
+
+Module that provides the bike geometries used by the benchmarks: the fixtures of the tests plus generated ones.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import json
+import logging
+
+from benchmarks import generator
+
+
+# folder with the JSON fixtures of the tests
+TEST_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "_data")
+
+
+def load_fixture_geometries(path: str = TEST_DATA_PATH) -> list:
+	"""
+	Loads the bike geometries of the JSON fixtures in a folder. Fixtures can be requests (with a list of
+	"geometries") or dicts of parameters.
+
+	:param path: folder with the JSON fixtures, default is the tests/_data folder
+	:return: list of bike geometry dicts, [] if the folder does not exist
+	"""
+	geometry_list = []
+
+	if not os.path.isdir(path):
+		logging.warning("Fixture folder '{}' not found, using only generated geometries".format(path))
+		return geometry_list
+
+	for filename in sorted(os.listdir(path)):
+		if not filename.endswith(".json"):
+			continue
+
+		with open(os.path.join(path, filename)) as json_file:
+			content = json.load(json_file)
+
+		if isinstance(content, dict) and "geometries" in content:
+			geometry_list.extend(content['geometries'])
+		elif isinstance(content, dict):
+			geometry_list.append(to_geometry_dict(content))
+
+	return geometry_list
+
+
+def generate_geometries(count: int, seed: int = 0) -> list:
+	"""
+	Generates consistent bike geometries with some faults injected (see the generator module).
+
+	:param count: number of geometries to generate
+	:param seed: seed of the random generator, default is 0
+	:return: list of bike geometry dicts
+	"""
+	return list(generator.generate_geometries(count, seed))
+
+
+def get_benchmark_geometries(count: int = 10, seed: int = 0, path: str = TEST_DATA_PATH) -> list:
+	"""
+	Gets the bike geometries used by the benchmarks: the fixtures plus `count` generated geometries.
+
+	:param count: number of generated geometries, default is 10
+	:param seed: seed of the random generator, default is 0
+	:param path: folder with the JSON fixtures, default is the tests/_data folder
+	:return: list of bike geometry dicts
+	"""
+	return load_fixture_geometries(path) + generate_geometries(count, seed)
+
+
+def to_geometry_dict(parameters: dict) -> dict:
+	"""
+	Converts a dict of parameters to a bike geometry dict.
+
+	:param parameters: dict of parameter names and values
+	:return: bike geometry dict
+	"""
+	return {"parameter_list": [{"p": name, "v": str(value)} for name, value in parameters.items()]}
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+generator
+----------------------------------
+
+Module that generates synthetic bike geometries for load and scale testing, without using production data.
+
+The independent parameters are sampled from plausible ranges and the rest are derived through VALIDATION_FORMULAE,
+so the geometries are mathematically consistent. Then, controlled faults are injected (digit swaps, inch values,
+comma decimals, ranges and missing fields) and recorded in the "ground_truth" field of each geometry.
+
+Example usage::
+
+	# 1M geometries, one per line
+	python -m benchmarks.generator 1000000 --output geometries.ndjson --format ndjson --fault-rate 0.2 --workers 8
+
+	# a request with 50 geometries
+	python -m benchmarks.generator 50 --output request.json
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import sys
+import json
+import random
+import logging
+import argparse
+import multiprocessing
+
+from datavalidation.validation.compiled import get_residual_function
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+# ranges from which the independent parameters are sampled
+SAMPLING_RANGES = {
+	"reach": (340, 520),
+	"stack": (500, 680),
+	"seat_angle": (72, 76),
+	"head_angle": (63, 74),
+	"head_tube": (90, 200),
+	"bb_drop": (30, 80),
+	"chainstay": (400, 460),
+	"fork_rake": (35, 55)
+}
+
+# plausible ranges of the derived parameters, used to pick the right solution and to discard implausible geometries
+DERIVED_RANGES = {
+	"top_tube": (450, 720),
+	"seat_tube_length_eff": (450, 800),
+	"fork_length": (300, 650),
+	"front_centre": (500, 950),
+	"wheelbase": (900, 1400)
+}
+
+# parameters in degrees, the rest are in millimetres
+ANGLE_PARAMETERS = ["head_angle", "seat_angle"]
+
+# faults that can be injected, see inject_fault()
+FAULT_TYPES = ["digit_swap", "inches", "comma_decimal", "range", "missing"]
+
+INCHES_TO_MM = 25.4
+
+# number of geometries generated with the same seed, see generate_geometries()
+CHUNK_SIZE = 10000
+
+# number of points of the grid used to bracket the solutions of a formula, and bisection steps to refine them
+_GRID_POINTS = 48
+_BISECTION_STEPS = 40
+
+
+def generate_consistent_parameters(generator: random.Random, max_attempts: int = 100) -> dict:
+	"""
+	Generates the values of a mathematically consistent bike geometry.
+
+	:param generator: random generator
+	:param max_attempts: maximum number of samples before giving up, default is 100
+	:return: dict of parameter names and float values
+	:raise RuntimeError: raised if no consistent geometry was found after max_attempts
+	"""
+	for _ in range(max_attempts):
+		values = {name: generator.uniform(*value_range) for name, value_range in SAMPLING_RANGES.items()}
+
+		if derive_parameters(values):
+			return values
+
+	raise RuntimeError("Could not generate a consistent geometry after {} attempts".format(max_attempts))
+
+
+def derive_parameters(values: dict) -> bool:
+	"""
+	Derives the missing parameters of DERIVED_RANGES through VALIDATION_FORMULAE, in place. It repeatedly solves the
+	formulae that have a single unknown parameter until all of them are known.
+
+	:param values: dict of parameter names and float values, modified in place
+	:return: bool, True if all the derived parameters have a plausible value
+	"""
+	changed = True
+
+	while changed:
+		changed = False
+
+		for formula in VALIDATION_FORMULAE:
+			unknown = [param for param in formula['parameters'] if param not in values]
+
+			if len(unknown) == 1 and unknown[0] in DERIVED_RANGES:
+				solution = solve_for_parameter(formula, unknown[0], values)
+				if solution is None:
+					return False
+
+				values[unknown[0]] = solution
+				changed = True
+
+	return all(name in values for name in DERIVED_RANGES)
+
+
+def solve_for_parameter(formula: dict, parameter_name: str, values: dict):
+	"""
+	Solves a formula for a parameter numerically within its plausible range (see DERIVED_RANGES). The range is
+	scanned to bracket the solutions, which are refined by bisection. If there are several, it returns the closest to
+	the middle of the range.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the parameter to solve the formula for
+	:param values: dict with the values of the rest of the parameters of the formula
+	:return: float solution or None if there is none in the range
+	"""
+	residual = get_residual_function(formula)
+	low, high = DERIVED_RANGES[parameter_name]
+	arguments = {param: values[param] for param in formula['parameters'] if param != parameter_name}
+
+	def evaluate(x):
+		try:
+			result = residual(**arguments, **{parameter_name: x})
+		except (ValueError, ZeroDivisionError):
+			return None
+		return result if not isinstance(result, complex) else None
+
+	step = (high - low) / _GRID_POINTS
+	solutions = []
+	previous_x, previous_y = low, evaluate(low)
+
+	for i in range(1, _GRID_POINTS + 1):
+		x = low + i * step
+		y = evaluate(x)
+
+		if y is not None and previous_y is not None and (y == 0 or (previous_y < 0) != (y < 0)):
+			solutions.append(_bisect(evaluate, previous_x, x, previous_y))
+
+		previous_x, previous_y = x, y
+
+	if len(solutions) == 0:
+		return None
+
+	middle = (low + high) / 2
+	return min(solutions, key=lambda s: abs(s - middle))
+
+
+def inject_fault(value: float, parameter_name: str, fault: str, generator: random.Random):
+	"""
+	Gets the string value of a parameter with a fault injected.
+
+	:param value: true value of the parameter
+	:param parameter_name: name of the parameter
+	:param fault: type of fault, one of FAULT_TYPES
+	:param generator: random generator
+	:return: faulty value as a string
+	"""
+	if fault == "digit_swap":
+		digits = list(str(int(round(value))))
+		# swap two adjacent digits that are different, e.g. 604 -> 064
+		positions = [i for i in range(len(digits) - 1) if digits[i] != digits[i + 1]]
+		if len(positions) > 0:
+			i = generator.choice(positions)
+			digits[i], digits[i + 1] = digits[i + 1], digits[i]
+		return "".join(digits)
+
+	elif fault == "inches":
+		return "{:.2f}".format(value / INCHES_TO_MM)
+
+	elif fault == "comma_decimal":
+		return "{:.1f}".format(value).replace(".", ",")
+
+	elif fault == "range":
+		return "{}/{}".format(int(round(value)), int(round(value)) + generator.choice([1, 2, 5]))
+
+	elif fault == "missing":
+		return ""
+
+	raise ValueError("Fault type not recognised: '{}', it must be one of {}".format(fault, FAULT_TYPES))
+
+
+def generate_geometry(generator: random.Random, fault_rate: float = 0.1, missing_rate: float = 0.1) -> dict:
+	"""
+	Generates a bike geometry dict with faults injected and its ground truth.
+
+	:param generator: random generator
+	:param fault_rate: probability of injecting a fault (other than missing) in each parameter, default is 0.1
+	:param missing_rate: probability of a parameter being missing, default is 0.1
+	:return: bike geometry dict with a "ground_truth" field
+	"""
+	values = generate_consistent_parameters(generator)
+	parameter_list = []
+	faults = {}
+
+	for name, value in values.items():
+		chance = generator.random()
+
+		if chance < missing_rate:
+			fault = "missing"
+		elif chance < missing_rate + fault_rate:
+			fault = generator.choice([fault for fault in FAULT_TYPES if fault != "missing" and
+				not (fault == "inches" and name in ANGLE_PARAMETERS)])
+		else:
+			fault = None
+
+		if fault is None:
+			parameter_list.append({"p": name, "v": "{:.1f}".format(value)})
+		else:
+			faults[name] = fault
+			parameter_list.append({"p": name, "v": inject_fault(value, name, fault, generator)})
+
+	return {
+		"parameter_list": parameter_list,
+		"ground_truth": {
+			"parameters": {name: round(value, 3) for name, value in values.items()},
+			"faults": faults
+		}
+	}
+
+
+def generate_geometries(count: int, seed: int = 0, fault_rate: float = 0.1, missing_rate: float = 0.1,
+		workers: int = 1):
+	"""
+	Generator of bike geometry dicts, see generate_geometry().
+
+	Geometries are generated in chunks of CHUNK_SIZE, each one with its own seed, so the result is the same regardless
+	of the number of worker processes.
+
+	:param count: number of geometries
+	:param seed: seed of the random generator, default is 0
+	:param fault_rate: probability of injecting a fault in each parameter, default is 0.1
+	:param missing_rate: probability of a parameter being missing, default is 0.1
+	:param workers: number of processes generating chunks in parallel, default is 1
+	:return: generator of bike geometry dicts
+	"""
+	chunks = [(min(CHUNK_SIZE, count - start), seed * 1000003 + i, fault_rate, missing_rate)
+		for i, start in enumerate(range(0, count, CHUNK_SIZE))]
+
+	if workers > 1:
+		with multiprocessing.Pool(workers) as pool:
+			for chunk in pool.imap(_generate_chunk, chunks):
+				yield from chunk
+
+	else:
+		for chunk in chunks:
+			yield from _generate_chunk(chunk)
+
+
+def write_geometries(output, geometries, output_format: str = "json"):
+	"""
+	Writes bike geometries to a file as a request JSON or as NDJSON (one geometry per line). The geometries are
+	streamed, so it can write millions of them with bounded memory.
+
+	:param output: file object
+	:param geometries: iterable of bike geometry dicts
+	:param output_format: "json" for a request or "ndjson", default is "json"
+	:return: number of geometries written
+	"""
+	count = 0
+
+	if output_format == "json":
+		output.write('{"geometries": [\n')
+
+	for geometry in geometries:
+		if output_format == "json" and count > 0:
+			output.write(",\n")
+
+		output.write(json.dumps(geometry))
+
+		if output_format == "ndjson":
+			output.write("\n")
+
+		count += 1
+
+	if output_format == "json":
+		output.write("\n]}\n")
+
+	return count
+
+
+def _generate_chunk(arguments: tuple) -> list:
+	"""
+	Helper function of generate_geometries() that generates a chunk of geometries.
+
+	:param arguments: tuple (count, seed, fault_rate, missing_rate)
+	:return: list of bike geometry dicts
+	"""
+	count, seed, fault_rate, missing_rate = arguments
+	generator = random.Random(seed)
+
+	return [generate_geometry(generator, fault_rate, missing_rate) for _ in range(count)]
+
+
+def _bisect(function, low: float, high: float, low_value: float) -> float:
+	"""
+	Refines the solution of a function between two points where its sign changes.
+
+	:param function: function to solve
+	:param low: lower point
+	:param high: higher point
+	:param low_value: value of the function at the lower point
+	:return: float solution
+	"""
+	for _ in range(_BISECTION_STEPS):
+		middle = (low + high) / 2
+		middle_value = function(middle)
+
+		if middle_value is None or middle_value == 0:
+			return middle
+
+		if (middle_value < 0) == (low_value < 0):
+			low, low_value = middle, middle_value
+		else:
+			high = middle
+
+	return (low + high) / 2
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(prog="python -m benchmarks.generator", description="Generates bike geometries")
+	parser.add_argument("count", type=int, help="number of geometries to generate")
+	parser.add_argument("--output", default=None, help="output file, default is the standard output")
+	parser.add_argument("--format", choices=["json", "ndjson"], default="json", help="request JSON or NDJSON")
+	parser.add_argument("--seed", type=int, default=0, help="seed of the random generator, default is 0")
+	parser.add_argument("--fault-rate", type=float, default=0.1, help="probability of a fault in each parameter")
+	parser.add_argument("--missing-rate", type=float, default=0.1, help="probability of a missing parameter")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes generating geometries")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING)
+	output_file = open(args.output, "w") if args.output is not None else sys.stdout
+
+	try:
+		write_geometries(output_file, generate_geometries(args.count, args.seed, args.fault_rate, args.missing_rate,
+			args.workers),
+			args.format)
+	finally:
+		if args.output is not None:
+			output_file.close()
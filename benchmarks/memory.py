@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+memory
+----------------------------------
+
+Module with the memory benchmarks of the validation pipeline, based on tracemalloc:
+
+- The peak and retained memory of each stage of the validation of a geometry (building the BikeGeometry and its
+  GeometryParameters, normalisation, validation and to_dict), split by the code that allocated it.
+- The growth of memory over many sequential validations, to find what makes long-lived workers creep (e.g. class
+  level dicts or the global cache of sympy).
+
+Example usage::
+
+	python -m benchmarks.memory --geometries 5
+	python -m benchmarks.memory --growth 100000 --sample-every 1000 --no-trace --engine compiled
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import gc
+import sys
+import copy
+import json
+import logging
+import argparse
+import itertools
+import tracemalloc
+
+from datavalidation.core.config import set_up_logging
+from datavalidation.validation.cache import get_sympy_cache_size, get_rss
+
+
+# groups in which the allocations are split, by the path of the file that allocated them (first match wins)
+ALLOCATION_GROUPS = [
+	("BikeGeometry", os.path.join("datavalidation", "core", "bikegeometry.py")),
+	("GeometryParameter", os.path.join("datavalidation", "core", "geometryparameter.py")),
+	("datavalidation", os.sep + "datavalidation" + os.sep),
+	("sympy", os.sep + "sympy" + os.sep)
+]
+
+# number of allocation sites reported in the growth benchmark
+TOP_ALLOCATION_SITES = 10
+
+
+def measure_geometry_memory(geometry: dict) -> dict:
+	"""
+	Measures the memory allocated by each stage of the validation of a geometry. The objects of each stage are kept
+	alive until the end, so the retained memory of a stage is what it adds to the final validated geometry.
+
+	Note that the peak of each stage is only measured separately in Python 3.9 or later, before it is the peak since
+	the first stage.
+
+	:param geometry: bike geometry dict
+	:return: dict with the results of each stage: peak bytes, retained bytes, retained bytes by allocation group and
+		error (None if the stage did not raise an exception)
+	"""
+	# datavalidation is imported in the functions, so main() can set up the logging before it does
+	from datavalidation.core import BikeGeometry
+	from datavalidation.normalisation import normalise_bike_geometry
+	from datavalidation.validation import validate_bike_geometry
+
+	geometry = copy.deepcopy(geometry)
+	objects = {}
+
+	stages = [
+		("BikeGeometry", lambda: objects.setdefault("bike_geometry", BikeGeometry(geometry))),
+		("normalise_bike_geometry", lambda: normalise_bike_geometry(objects['bike_geometry'])),
+		("validate_bike_geometry", lambda: validate_bike_geometry(objects['bike_geometry'])),
+		("to_dict", lambda: objects.setdefault("output", objects['bike_geometry'].to_dict()))
+	]
+
+	already_tracing = tracemalloc.is_tracing()
+	if not already_tracing:
+		tracemalloc.start()
+
+	results = {}
+
+	try:
+		for name, stage in stages:
+			if "bike_geometry" not in objects and name != "BikeGeometry":
+				break
+
+			gc.collect()
+			if hasattr(tracemalloc, "reset_peak"):
+				tracemalloc.reset_peak()
+
+			before_snapshot = tracemalloc.take_snapshot()
+			before = tracemalloc.get_traced_memory()[0]
+			error = None
+
+			try:
+				stage()
+			except Exception as e:
+				error = "{}: {}".format(type(e).__name__, e)
+
+			current, peak = tracemalloc.get_traced_memory()
+			after_snapshot = tracemalloc.take_snapshot()
+
+			results[name] = {
+				"peak_bytes": peak - before,
+				"retained_bytes": current - before,
+				"retained_by_group": group_allocations(after_snapshot.compare_to(before_snapshot, "filename")),
+				"error": error
+			}
+
+	finally:
+		if not already_tracing:
+			tracemalloc.stop()
+
+	return results
+
+
+def measure_growth(geometry_list: list, count: int = 100000, sample_every: int = 1000, trace: bool = True,
+		engine: str = None) -> dict:
+	"""
+	Measures the growth of memory over sequential validations of geometries (cycling through the list).
+
+	Each geometry is validated once before the first sample. With `trace`, the memory is measured with tracemalloc (which slows down the validations) and the allocation sites
+	that grew the most are reported. The resident set size (RSS) is always measured.
+
+	:param geometry_list: list of bike geometry dicts
+	:param count: number of validations, default is 100000
+	:param sample_every: validations between samples, default is 1000
+	:param trace: whether to trace the allocations with tracemalloc, default is True
+	:param engine: solver engine used during the validations, default is None for the current engine
+	:return: dict with the samples, the growth per 1000 validations and the top growing allocation sites
+	"""
+	from datavalidation import datavalidation
+	from datavalidation.validation import equations
+
+	previous_engine = equations.get_solver_engine()
+	if engine is not None:
+		equations.set_solver_engine(engine)
+
+	# validate each geometry once before the first sample, so lazy imports and caches do not count as growth
+	for geometry in geometry_list:
+		try:
+			datavalidation.validate_bike_geometry(copy.deepcopy(geometry))
+		except Exception:
+			pass
+
+	if trace and not tracemalloc.is_tracing():
+		tracemalloc.start()
+
+	geometries = itertools.cycle(geometry_list)
+	samples = []
+	errors = 0
+	first_snapshot = None
+
+	try:
+		for i in range(count + 1):
+			if i % sample_every == 0 or i == count:
+				gc.collect()
+				samples.append(_take_sample(i, trace))
+
+				if trace and first_snapshot is None:
+					first_snapshot = tracemalloc.take_snapshot()
+
+			if i == count:
+				break
+
+			try:
+				datavalidation.validate_bike_geometry(copy.deepcopy(next(geometries)))
+			except Exception as e:
+				errors += 1
+				logging.debug("Validation {} raised an exception: {}".format(i, e))
+
+		top_sites = []
+		if trace:
+			top_sites = [str(stat) for stat in tracemalloc.take_snapshot().compare_to(first_snapshot, "lineno")
+				if stat.size_diff > 0][:TOP_ALLOCATION_SITES]
+
+	finally:
+		if trace:
+			tracemalloc.stop()
+		equations.set_solver_engine(previous_engine)
+
+	return {
+		"validations": count,
+		"errors": errors,
+		"samples": samples,
+		"growth_per_1000": {
+			key: (samples[-1][key] - samples[0][key]) * 1000 / count if count > 0 and samples[0][key] is not None
+				else None
+			for key in ["traced_bytes", "rss_bytes", "sympy_cache_entries"]
+		},
+		"top_growing_sites": top_sites
+	}
+
+
+def group_allocations(statistic_diff_list: list) -> dict:
+	"""
+	Sums the size differences of tracemalloc statistics by ALLOCATION_GROUPS.
+
+	:param statistic_diff_list: list of tracemalloc.StatisticDiff grouped by filename
+	:return: dict with the bytes of each group (plus "other")
+	"""
+	groups = {name: 0 for name, _ in ALLOCATION_GROUPS}
+	groups['other'] = 0
+
+	for stat in statistic_diff_list:
+		filename = stat.traceback[0].filename
+		group = next((name for name, path in ALLOCATION_GROUPS if path in filename), "other")
+		groups[group] += stat.size_diff
+
+	return groups
+
+
+def _take_sample(validations: int, trace: bool) -> dict:
+	"""
+	Helper function of measure_growth() that measures the memory after some validations.
+
+	:param validations: number of validations so far
+	:param trace: whether tracemalloc is tracing
+	:return: dict with the sample
+	"""
+	from datavalidation.core import BikeGeometry, GeometryParameter
+
+	return {
+		"validations": validations,
+		"traced_bytes": tracemalloc.get_traced_memory()[0] if trace else None,
+		"rss_bytes": get_rss(),
+		"sympy_cache_entries": get_sympy_cache_size(),
+		# these class level dicts should never grow, as instances have their own
+		"class_dicts": {
+			"BikeGeometry._parameters": len(BikeGeometry._parameters),
+			"BikeGeometry._extra_values": len(BikeGeometry._extra_values),
+			"GeometryParameter._extra_values": len(GeometryParameter._extra_values)
+		}
+	}
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m benchmarks.memory", description="Memory benchmarks")
+	parser.add_argument("--geometries", type=int, default=5, help="geometries measured stage by stage, default is 5")
+	parser.add_argument("--growth", type=int, default=0, help="sequential validations of the growth benchmark")
+	parser.add_argument("--sample-every", type=int, default=1000, help="validations between growth samples")
+	parser.add_argument("--no-trace", action="store_true", help="only measure the RSS in the growth benchmark")
+	parser.add_argument("--engine", default=None, help="solver engine used in the growth benchmark")
+	parser.add_argument("--count", type=int, default=10, help="number of generated geometries, default is 10")
+	parser.add_argument("--seed", type=int, default=0, help="seed of the generated geometries, default is 0")
+	parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+	args = parser.parse_args(argv)
+
+	set_up_logging(use_test_config=True)
+	logging.getLogger().setLevel(logging.WARNING)
+
+	from benchmarks.data import get_benchmark_geometries
+	geometry_list = get_benchmark_geometries(args.count, args.seed)
+	report = {"geometries": [], "growth": None}
+
+	for geometry in geometry_list[:args.geometries]:
+		stages = measure_geometry_memory(geometry)
+		report['geometries'].append(stages)
+
+		print("{:<28} {:>12} {:>14}  {}".format("stage", "peak KiB", "retained KiB", "retained by group KiB"))
+		for name, stage in stages.items():
+			print("{:<28} {:>12.1f} {:>14.1f}  {}{}".format(name, stage['peak_bytes'] / 1024,
+				stage['retained_bytes'] / 1024, ", ".join("{} {:.1f}".format(group, size / 1024)
+					for group, size in stage['retained_by_group'].items() if size != 0),
+				"  ({})".format(stage['error']) if stage['error'] is not None else ""))
+		print()
+
+	if args.growth > 0:
+		growth = measure_growth(geometry_list, args.growth, args.sample_every, not args.no_trace, args.engine)
+		report['growth'] = growth
+
+		print("{} validations ({} errors), growth per 1000 validations: {}".format(
+			growth['validations'], growth['errors'], growth['growth_per_1000']))
+		print("class level dicts: {}".format(growth['samples'][-1]['class_dicts']))
+		for site in growth['top_growing_sites']:
+			print("  " + site)
+
+	if args.json is not None:
+		with open(args.json, "w") as json_file:
+			json.dump(report, json_file, indent=4)
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
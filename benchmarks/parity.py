@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+parity
+----------------------------------
+
+Module that checks that the alternative solver engines (see equations.SOLVER_ENGINES) give the same results as the
+sympy engine, so faster solving paths can be shipped safely. For the same geometries, it reports:
+
+- For each formula and unknown: the maximum absolute and relative differences of the solutions, the solution sets
+  that do not match and the speedup.
+- For the whole validation: the differences in the confidence of the geometries and their parameters, and the
+  `invalid` flags that changed. The fast residual tier (see validate.validate_by_residuals()) is disabled, so only
+  the engines are compared.
+- For the fast residual tier: the same differences between validating with it and solving the formulae.
+
+Example usage::
+
+	python -m benchmarks.parity --snapshot datavalidation/snapshot.json --count 50
+
+It exits with 1 if any `invalid` flag changed, with an engine or with the fast residual tier.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+
+from datavalidation.core.config import set_up_logging
+
+# set logging before importing datavalidation so the benchmarks do not flood the log file
+set_up_logging(use_test_config=True)
+logging.getLogger().setLevel(logging.WARNING)
+
+
+from datavalidation import datavalidation
+from datavalidation.core import BikeGeometry
+from datavalidation.normalisation import normalise_bike_geometry
+from datavalidation.validation import compiled, equations, validate
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+from benchmarks.data import get_benchmark_geometries, TEST_DATA_PATH
+
+
+# engine used as the reference
+REFERENCE_ENGINE = "sympy"
+
+# maximum number of changed `invalid` flags listed per engine
+MAX_LISTED_MISMATCHES = 20
+
+
+def compare_formulae(geometry_list: list, engines: list = None, only: list = None) -> list:
+	"""
+	Solves every formula for every unknown with the reference engine and the alternative engines, for each geometry
+	that has the rest of the parameters of the formula, and compares the solutions (without geometry constraints).
+
+	:param geometry_list: list of bike geometry dicts
+	:param engines: list of engines to compare, default is None for every engine other than the reference
+	:param only: list of texts, only the formulae whose label ("index:unknown") contains one of them are compared,
+		default is None for all of them
+	:return: list of dicts, one per formula, unknown and engine
+	"""
+	engines = engines if engines is not None else [e for e in equations.SOLVER_ENGINES if e != REFERENCE_ENGINE]
+	bike_geometry_list = []
+
+	for geometry in geometry_list:
+		bike_geometry = BikeGeometry(copy.deepcopy(geometry))
+		normalise_bike_geometry(bike_geometry)
+		bike_geometry_list.append(bike_geometry)
+
+	rows = []
+
+	for i, formula in enumerate(VALIDATION_FORMULAE):
+		for parameter_name in formula['parameters']:
+			label = "{}:{}".format(i, parameter_name)
+			if only is not None and not any(text in label for text in only):
+				continue
+
+			cases = [bike_geometry for bike_geometry in bike_geometry_list if all(
+				_is_number(bike_geometry.get_parameter_value(param))
+				for param in formula['parameters'] if param != parameter_name)]
+
+			reference_solutions, reference_time = _solve_all(formula, parameter_name, cases, REFERENCE_ENGINE)
+
+			for engine in engines:
+				solutions, engine_time = _solve_all(formula, parameter_name, cases, engine)
+				row = {
+					"formula": label,
+					"engine": engine,
+					"compiled": compiled.has_compiled_solution(formula, parameter_name),
+					"cases": len(cases),
+					"mismatches": 0,
+					"max_abs_diff": 0.0,
+					"max_rel_diff": 0.0,
+					"reference_time": reference_time,
+					"time": engine_time,
+					"speedup": reference_time / engine_time if engine_time > 0 else None
+				}
+
+				for reference, result in zip(reference_solutions, solutions):
+					if len(reference) != len(result):
+						row['mismatches'] += 1
+						continue
+
+					for reference_value, value in zip(reference, result):
+						difference = abs(reference_value - value)
+						row['max_abs_diff'] = max(row['max_abs_diff'], difference)
+						if reference_value != 0:
+							row['max_rel_diff'] = max(row['max_rel_diff'], difference / abs(reference_value))
+
+				rows.append(row)
+
+	return rows
+
+
+def compare_validations(geometry_list: list, engines: list = None) -> list:
+	"""
+	Validates each geometry with the reference engine and the alternative engines and compares the outcomes.
+
+	:param geometry_list: list of bike geometry dicts
+	:param engines: list of engines to compare, default is None for every engine other than the reference
+	:return: list of dicts, one per engine
+	"""
+	engines = engines if engines is not None else [e for e in equations.SOLVER_ENGINES if e != REFERENCE_ENGINE]
+	reference_results, reference_time = _validate_all(geometry_list, REFERENCE_ENGINE)
+	rows = []
+
+	for engine in engines:
+		results, engine_time = _validate_all(geometry_list, engine)
+		row = {
+			"engine": engine,
+			"geometries": len(geometry_list),
+			"error_mismatches": 0,
+			"max_confidence_delta": 0.0,
+			"max_parameter_confidence_delta": 0.0,
+			"invalid_mismatches": 0,
+			"invalid_mismatch_list": [],
+			"reference_time": reference_time,
+			"time": engine_time,
+			"speedup": reference_time / engine_time if engine_time > 0 else None
+		}
+
+		_compare_results(reference_results, results, row)
+		rows.append(row)
+
+	return rows
+
+
+def compare_residual_tier(geometry_list: list, tolerance: float = validate.RESIDUAL_TOLERANCE) -> list:
+	"""
+	Validates each geometry with the fast residual tier (see validate.validate_by_residuals()) and by solving the
+	formulae, with the current engine, and compares the outcomes.
+
+	:param geometry_list: list of bike geometry dicts
+	:param tolerance: tolerance of the residual tier, default is RESIDUAL_TOLERANCE
+	:return: list with a dict like those of compare_validations(), with "residuals" as engine
+	"""
+	engine = equations.get_solver_engine()
+	reference_results, reference_time = _validate_all(geometry_list, engine)
+	results, tier_time = _validate_all(geometry_list, engine, tolerance)
+	row = {
+		"engine": "residuals",
+		"tolerance": tolerance,
+		"geometries": len(geometry_list),
+		"error_mismatches": 0,
+		"max_confidence_delta": 0.0,
+		"max_parameter_confidence_delta": 0.0,
+		"invalid_mismatches": 0,
+		"invalid_mismatch_list": [],
+		"reference_time": reference_time,
+		"time": tier_time,
+		"speedup": reference_time / tier_time if tier_time > 0 else None
+	}
+
+	_compare_results(reference_results, results, row)
+
+	return [row]
+
+
+def format_report(formula_rows: list, validation_rows: list) -> str:
+	"""
+	Formats the results of compare_formulae(), compare_validations() and compare_residual_tier() as tables.
+
+	:param formula_rows: list of dicts returned by compare_formulae()
+	:param validation_rows: list of dicts returned by compare_validations() and compare_residual_tier()
+	:return: report as a string
+	"""
+	header = "{:<28} {:>10} {:>9} {:>6} {:>11} {:>12} {:>12} {:>9}".format(
+		"formula", "engine", "compiled", "cases", "mismatches", "max abs", "max rel", "speedup")
+	lines = [header, "-" * len(header)]
+
+	for row in formula_rows:
+		lines.append("{:<28} {:>10} {:>9} {:>6} {:>11} {:>12.3g} {:>12.3g} {:>9}".format(
+			row['formula'][:28], row['engine'], "yes" if row['compiled'] else "no", row['cases'], row['mismatches'],
+			row['max_abs_diff'], row['max_rel_diff'],
+			"{:.1f}x".format(row['speedup']) if row['speedup'] is not None else "-"))
+
+	lines.append("")
+
+	for row in validation_rows:
+		lines.append("{engine}: {geometries} geometries, {invalid_mismatches} invalid flags changed, "
+			"{error_mismatches} exception mismatches, max confidence delta {max_confidence_delta:.3g} (geometry) "
+			"{max_parameter_confidence_delta:.3g} (parameter)".format(**row) + (", speedup {:.1f}x".format(
+				row['speedup']) if row['speedup'] is not None else ""))
+
+		for mismatch in row['invalid_mismatch_list']:
+			lines.append("    " + mismatch)
+
+	return "\n".join(lines)
+
+
+def _compare_results(reference_results: list, results: list, row: dict):
+	"""
+	Helper function that compares the validated geometries of compare_validations() and compare_residual_tier() and
+	updates the counters and maximum deltas of the row.
+
+	:param reference_results: list of validated geometry dicts, or exception names, used as reference
+	:param results: list of validated geometry dicts, or exception names
+	:param row: dict of the comparison
+	:return: None
+	"""
+	for g, (reference, result) in enumerate(zip(reference_results, results)):
+		if isinstance(reference, str) or isinstance(result, str):
+			# the validation raised an exception with at least one engine
+			row['error_mismatches'] += int(reference != result)
+			continue
+
+		row['max_confidence_delta'] = max(row['max_confidence_delta'],
+			abs(reference.get("confidence", 0) - result.get("confidence", 0)))
+		mismatches = [] if reference.get("invalid") == result.get("invalid") else ["geometry"]
+
+		reference_parameters = {param['p']: param for param in reference['parameter_list']}
+		for param in result['parameter_list']:
+			reference_param = reference_parameters.get(param['p'], {})
+			row['max_parameter_confidence_delta'] = max(row['max_parameter_confidence_delta'],
+				abs(reference_param.get("confidence", 0) - param.get("confidence", 0)))
+
+			if reference_param.get("invalid") != param.get("invalid"):
+				mismatches.append(param['p'])
+
+		row['invalid_mismatches'] += len(mismatches)
+		for name in mismatches:
+			if len(row['invalid_mismatch_list']) < MAX_LISTED_MISMATCHES:
+				row['invalid_mismatch_list'].append("geometry {}: {}".format(g, name))
+
+
+def _solve_all(formula: dict, parameter_name: str, bike_geometry_list: list, engine: str) -> tuple:
+	"""
+	Helper function that solves a formula for each BikeGeometry with an engine.
+
+	:param formula: formula dict
+	:param parameter_name: name of the unknown
+	:param bike_geometry_list: list of normalised BikeGeometry
+	:param engine: name of the engine
+	:return: tuple (list of sorted lists of float solutions, elapsed seconds)
+	"""
+	solutions = []
+	start_time = time.perf_counter()
+
+	for bike_geometry in bike_geometry_list:
+		solutions.append(equations.solve_equation(formula, parameter_name, bike_geometry, force_constraints=False,
+			engine=engine))
+
+	elapsed = time.perf_counter() - start_time
+
+	return [sorted(float(value) for value in solution_list) for solution_list in solutions], elapsed
+
+
+def _validate_all(geometry_list: list, engine: str, residual_tolerance: float = None) -> tuple:
+	"""
+	Helper function that validates each geometry with an engine.
+
+	:param geometry_list: list of bike geometry dicts
+	:param engine: name of the engine
+	:param residual_tolerance: tolerance of the fast residual tier, default is None to disable it so only the
+		engines are compared
+	:return: tuple (list of validated geometry dicts, or exception names, elapsed seconds)
+	"""
+	previous_engine = equations.get_solver_engine()
+	previous_tolerance = validate.get_residual_tolerance()
+	equations.set_solver_engine(engine)
+	validate.set_residual_tolerance(residual_tolerance)
+	results = []
+	start_time = time.perf_counter()
+
+	try:
+		for geometry in geometry_list:
+			try:
+				results.append(datavalidation.validate_bike_geometry(copy.deepcopy(geometry)))
+			except Exception as e:
+				results.append(type(e).__name__)
+	finally:
+		equations.set_solver_engine(previous_engine)
+		validate.set_residual_tolerance(previous_tolerance)
+
+	return results, time.perf_counter() - start_time
+
+
+def _is_number(value) -> bool:
+	"""
+	Checks if the value of a parameter can be used to solve a formula.
+
+	:param value: value of a GeometryParameter
+	:return: bool
+	"""
+	if isinstance(value, list):
+		return len(value) > 0 and _is_number(value[0])
+
+	if value is None or isinstance(value, bool):
+		return False
+
+	# values can still be numeric strings after the normalisation
+	try:
+		float(value)
+		return True
+	except (TypeError, ValueError):
+		return False
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m benchmarks.parity", description="Parity of the solver engines")
+	parser.add_argument("--engine", action="append", default=None, help="engine to compare (can be repeated)")
+	parser.add_argument("--formula", action="append", default=None,
+		help="only compare the formulae whose label (index:unknown) contains this text (can be repeated)")
+	parser.add_argument("--no-validation", action="store_true", help="only compare the formulae")
+	parser.add_argument("--no-residuals", action="store_true", help="do not compare the fast residual tier")
+	parser.add_argument("--residual-tolerance", type=float, default=validate.RESIDUAL_TOLERANCE,
+		help="tolerance of the fast residual tier, default is {}".format(validate.RESIDUAL_TOLERANCE))
+	parser.add_argument("--snapshot", default=None, help="load the compiled solutions from this snapshot file")
+	parser.add_argument("--count", type=int, default=10, help="number of generated geometries, default is 10")
+	parser.add_argument("--seed", type=int, default=0, help="seed of the generated geometries, default is 0")
+	parser.add_argument("--data", default=TEST_DATA_PATH, help="folder with the JSON fixtures")
+	parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+	args = parser.parse_args(argv)
+
+	if args.snapshot is not None:
+		from datavalidation.validation.snapshot import load_snapshot
+		load_snapshot(args.snapshot)
+
+	geometry_list = get_benchmark_geometries(args.count, args.seed, args.data)
+	formula_rows = compare_formulae(geometry_list, args.engine, args.formula)
+	validation_rows = compare_validations(geometry_list, args.engine) if not args.no_validation else []
+
+	if not args.no_validation and not args.no_residuals:
+		validation_rows += compare_residual_tier(geometry_list, args.residual_tolerance)
+
+	print(format_report(formula_rows, validation_rows))
+
+	if args.json is not None:
+		with open(args.json, "w") as json_file:
+			json.dump({"formulae": formula_rows, "validations": validation_rows}, json_file, indent=4)
+
+	return 1 if any(row['invalid_mismatches'] > 0 for row in validation_rows) else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
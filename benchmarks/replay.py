@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+replay
+----------------------------------
+
+Module that replays a corpus of captured requests (see datavalidation.service.capture) through
+request_validate_bike_geometry() at a given concurrency. It reports the throughput and latency distribution, and it
+can save the responses and diff them against a baseline run, so optimisations can be benchmarked on the real traffic
+mix while catching changes of behaviour.
+
+Example usage::
+
+	# baseline run
+	python -m benchmarks.replay capture/ --concurrency 4 --processes --output baseline.ndjson.gz
+
+	# after a change
+	python -m benchmarks.replay capture/ --concurrency 4 --processes --baseline baseline.ndjson.gz
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import sys
+import copy
+import gzip
+import json
+import time
+import logging
+import argparse
+import concurrent.futures
+
+from datavalidation.core.config import set_up_logging
+from datavalidation.service.capture import read_capture
+from benchmarks.runner import summarise_timings
+
+
+# maximum number of differences reported per response
+MAX_DIFFERENCES = 10
+
+
+def replay(request_list: list, concurrency: int = 1, processes: bool = False) -> tuple:
+	"""
+	Replays a list of requests through request_validate_bike_geometry(). The requests are not modified.
+
+	Threads share the GIL, so use processes to measure the throughput of several server workers.
+
+	:param request_list: list of request dicts
+	:param concurrency: number of requests validated at the same time, default is 1
+	:param processes: whether to use processes instead of threads, default is False
+	:return: tuple (list of result dicts in the order of the requests, elapsed seconds)
+	"""
+	executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+	start_time = time.perf_counter()
+
+	with executor_class(max_workers=concurrency) as executor:
+		result_list = list(executor.map(_replay_request, request_list))
+
+	return result_list, time.perf_counter() - start_time
+
+
+def summarise_replay(request_list: list, result_list: list, elapsed: float) -> dict:
+	"""
+	Summarises a replay.
+
+	:param request_list: list of request dicts replayed
+	:param result_list: list of result dicts from replay()
+	:param elapsed: elapsed seconds of the replay
+	:return: dict with the throughput, the latency distribution (in seconds) and the errors
+	"""
+	geometries = sum(len(request.get('geometries', [])) for request in request_list)
+
+	return {
+		"requests": len(result_list),
+		"geometries": geometries,
+		"errors": sum(result['error'] is not None for result in result_list),
+		"elapsed": elapsed,
+		"requests_per_second": len(result_list) / elapsed if elapsed > 0 else float("inf"),
+		"geometries_per_second": geometries / elapsed if elapsed > 0 else float("inf"),
+		"latency": summarise_timings([result['latency'] for result in result_list]) if len(result_list) > 0 else {}
+	}
+
+
+def diff_responses(response, baseline, tolerance: float = 1e-6, path: str = "") -> list:
+	"""
+	Gets the differences between a response and its baseline. Numbers are compared with a relative tolerance.
+
+	:param response: response (any JSON value)
+	:param baseline: baseline response (any JSON value)
+	:param tolerance: relative tolerance of the numbers, default is 1e-6
+	:param path: path of the values, used in the recursion
+	:return: list of differences as strings, [] if they are the same
+	"""
+	if isinstance(response, dict) and isinstance(baseline, dict):
+		differences = []
+		for key in sorted(set(response.keys()) | set(baseline.keys()), key=str):
+			key_path = "{}.{}".format(path, key) if path else str(key)
+			if key not in response:
+				differences.append("{}: missing".format(key_path))
+			elif key not in baseline:
+				differences.append("{}: not in baseline".format(key_path))
+			else:
+				differences.extend(diff_responses(response[key], baseline[key], tolerance, key_path))
+		return differences
+
+	if isinstance(response, list) and isinstance(baseline, list):
+		if len(response) != len(baseline):
+			return ["{}: length {} != {}".format(path, len(response), len(baseline))]
+
+		differences = []
+		for i, (value, baseline_value) in enumerate(zip(response, baseline)):
+			differences.extend(diff_responses(value, baseline_value, tolerance, "{}[{}]".format(path, i)))
+		return differences
+
+	if isinstance(response, (int, float)) and isinstance(baseline, (int, float)) and \
+			not isinstance(response, bool) and not isinstance(baseline, bool):
+		if abs(response - baseline) <= tolerance * max(abs(response), abs(baseline)):
+			return []
+
+	elif response == baseline:
+		return []
+
+	return ["{}: {!r} != {!r}".format(path, response, baseline)]
+
+
+def compare_with_baseline(result_list: list, baseline_list: list, tolerance: float = 1e-6) -> dict:
+	"""
+	Compares the results of a replay with those of a baseline run, request by request.
+
+	:param result_list: list of result dicts from replay()
+	:param baseline_list: list of result dicts of the baseline (e.g. from load_results())
+	:param tolerance: relative tolerance of the numbers, default is 1e-6
+	:return: dict with the number of requests compared and different, and the differences of each different request
+	"""
+	different = {}
+
+	for i, (result, baseline) in enumerate(zip(result_list, baseline_list)):
+		differences = diff_responses({"response": result['response'], "error": result['error']},
+			{"response": baseline['response'], "error": baseline['error']}, tolerance)
+
+		if len(differences) > 0:
+			different[i] = differences[:MAX_DIFFERENCES]
+
+	if len(result_list) != len(baseline_list):
+		logging.warning("Replay has {} requests but the baseline has {}".format(len(result_list), len(baseline_list)))
+
+	return {
+		"compared": min(len(result_list), len(baseline_list)),
+		"different": len(different),
+		"differences": different
+	}
+
+
+def save_results(filepath: str, result_list: list):
+	"""
+	Saves the responses and errors of a replay to a gzip-compressed NDJSON file.
+
+	:param filepath: path of the file
+	:param result_list: list of result dicts from replay()
+	:return: None
+	"""
+	with gzip.open(filepath, "wt", encoding="utf-8") as results_file:
+		for result in result_list:
+			results_file.write(json.dumps({"response": result['response'], "error": result['error']}) + "\n")
+
+
+def load_results(filepath: str) -> list:
+	"""
+	Loads the responses and errors of a replay saved with save_results().
+
+	:param filepath: path of the file
+	:return: list of result dicts
+	"""
+	with gzip.open(filepath, "rt", encoding="utf-8") as results_file:
+		return [json.loads(line) for line in results_file]
+
+
+def _replay_request(request_content: dict) -> dict:
+	"""
+	Helper function of replay() that validates a request and times it.
+
+	:param request_content: request dict
+	:return: dict with the latency in seconds, the response (None if it failed) and the error (None if it did not)
+	"""
+	from datavalidation.datavalidation import request_validate_bike_geometry
+
+	request_content = copy.deepcopy(request_content)
+	response = error = None
+	start_time = time.perf_counter()
+
+	try:
+		response = request_validate_bike_geometry(request_content)
+	except Exception as e:
+		error = "{}: {}".format(type(e).__name__, e)
+
+	return {"latency": time.perf_counter() - start_time, "response": response, "error": error}
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m benchmarks.replay", description="Replays captured requests")
+	parser.add_argument("capture", help="capture file or folder")
+	parser.add_argument("--concurrency", type=int, default=1, help="requests validated at the same time, default is 1")
+	parser.add_argument("--processes", action="store_true", help="use processes instead of threads")
+	parser.add_argument("--limit", type=int, default=None, help="maximum number of requests replayed")
+	parser.add_argument("--output", default=None, help="save the responses to this file (.ndjson.gz)")
+	parser.add_argument("--baseline", default=None, help="diff the responses against this file from --output")
+	parser.add_argument("--tolerance", type=float, default=1e-6, help="relative tolerance of the numbers in the diff")
+	parser.add_argument("--json", default=None, help="also write the report to this JSON file")
+	args = parser.parse_args(argv)
+
+	set_up_logging(use_test_config=True)
+	logging.getLogger().setLevel(logging.WARNING)
+
+	request_list = []
+	for request in read_capture(args.capture):
+		if args.limit is not None and len(request_list) >= args.limit:
+			break
+		request_list.append(request)
+
+	result_list, elapsed = replay(request_list, args.concurrency, args.processes)
+	report = summarise_replay(request_list, result_list, elapsed)
+
+	print("{requests} requests ({geometries} geometries, {errors} errors) in {elapsed:.2f}s: "
+		"{requests_per_second:.2f} requests/s, {geometries_per_second:.2f} geometries/s".format(**report))
+	if len(result_list) > 0:
+		print("latency ms: mean {:.3f}, p50 {:.3f}, p95 {:.3f}, p99 {:.3f}, max {:.3f}".format(
+			*[report['latency'][key] * 1000 for key in ["mean", "p50", "p95", "p99", "max"]]))
+
+	if args.output is not None:
+		save_results(args.output, result_list)
+
+	exit_code = 0
+
+	if args.baseline is not None:
+		report['baseline'] = compare_with_baseline(result_list, load_results(args.baseline), args.tolerance)
+		print("{different} of {compared} responses differ from the baseline".format(**report['baseline']))
+
+		for i, differences in report['baseline']['differences'].items():
+			print("  request {}:\n    {}".format(i, "\n    ".join(differences)))
+
+		exit_code = 1 if report['baseline']['different'] > 0 else 0
+
+	if args.json is not None:
+		with open(args.json, "w") as json_file:
+			json.dump(report, json_file, indent=4)
+
+	return exit_code
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+runner
+----------------------------------
+
+Module that times the benchmark stages and reports their throughput, latency percentiles and memory allocations.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import math
+import time
+import logging
+import tracemalloc
+
+
+def run_benchmark(name: str, function, setup=None, repeat: int = 20, max_time: float = 10,
+		measure_memory: bool = True) -> dict:
+	"""
+	Runs a benchmark: it calls `function(*setup())` up to `repeat` times (or until `max_time` seconds have passed, at
+	least once) and reports the timings. The setup is not timed.
+
+	Memory is measured in a separate run with tracemalloc, as tracing allocations slows down the timed runs.
+
+	:param name: name of the benchmark
+	:param function: function to benchmark
+	:param setup: function that returns the tuple of arguments of each call, default is None for no arguments
+	:param repeat: maximum number of timed calls, default is 20
+	:param max_time: maximum time in seconds spent in the timed calls, default is 10
+	:param measure_memory: whether to measure the allocations of a call, default is True
+	:return: dict with the results
+	"""
+	setup = setup if setup is not None else tuple
+	timings = []
+	errors = 0
+	start_time = time.perf_counter()
+
+	while len(timings) < repeat and (len(timings) == 0 or time.perf_counter() - start_time < max_time):
+		arguments = setup()
+
+		call_start = time.perf_counter()
+		try:
+			function(*arguments)
+		except Exception as e:
+			errors += 1
+			logging.debug("Benchmark '{}' raised an exception: {}".format(name, e))
+		timings.append(time.perf_counter() - call_start)
+
+	result = {
+		"name": name,
+		**summarise_timings(timings),
+		"errors": errors
+	}
+
+	if measure_memory:
+		result.update(measure_allocations(function, setup()))
+
+	return result
+
+
+def summarise_timings(timings: list) -> dict:
+	"""
+	Summarises a list of timings.
+
+	:param timings: list of timings in seconds
+	:return: dict with the number of calls, ops/s, mean and percentiles (in seconds)
+	"""
+	total = sum(timings)
+
+	return {
+		"calls": len(timings),
+		"ops_per_second": len(timings) / total if total > 0 else float("inf"),
+		"mean": total / len(timings),
+		"p50": get_percentile(timings, 50),
+		"p95": get_percentile(timings, 95),
+		"p99": get_percentile(timings, 99),
+		"max": max(timings)
+	}
+
+
+def get_percentile(values: list, percentile: float) -> float:
+	"""
+	Gets a percentile of a list of values with the nearest-rank method.
+
+	:param values: list of numbers
+	:param percentile: percentile from 0 to 100
+	:return: value of the percentile
+	"""
+	ordered = sorted(values)
+	rank = max(0, min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1))
+
+	return ordered[rank]
+
+
+def measure_allocations(function, arguments: tuple) -> dict:
+	"""
+	Measures the memory allocated by one call of a function with tracemalloc.
+
+	:param function: function to call
+	:param arguments: tuple of arguments
+	:return: dict with the peak bytes allocated during the call and the bytes still allocated after it
+	"""
+	already_tracing = tracemalloc.is_tracing()
+	if not already_tracing:
+		tracemalloc.start()
+
+	tracemalloc.clear_traces()
+	before = tracemalloc.get_traced_memory()[0]
+
+	try:
+		function(*arguments)
+	except Exception:
+		pass
+
+	current, peak = tracemalloc.get_traced_memory()
+
+	if not already_tracing:
+		tracemalloc.stop()
+
+	return {
+		"alloc_peak_bytes": peak - before,
+		"alloc_retained_bytes": current - before
+	}
+
+
+def format_results(result_list: list) -> str:
+	"""
+	Formats a list of benchmark results as a table.
+
+	:param result_list: list of dicts returned by run_benchmark()
+	:return: table as a string
+	"""
+	header = "{:<48} {:>6} {:>12} {:>10} {:>10} {:>10} {:>12} {:>7}".format(
+		"benchmark", "calls", "ops/s", "p50 ms", "p95 ms", "p99 ms", "peak KiB", "errors")
+	lines = [header, "-" * len(header)]
+
+	for result in result_list:
+		lines.append("{:<48} {:>6} {:>12.2f} {:>10.3f} {:>10.3f} {:>10.3f} {:>12} {:>7}".format(
+			result['name'][:48], result['calls'], result['ops_per_second'], result['p50'] * 1000,
+			result['p95'] * 1000, result['p99'] * 1000,
+			"{:.1f}".format(result['alloc_peak_bytes'] / 1024) if "alloc_peak_bytes" in result else "-",
+			result['errors']))
+
+	return "\n".join(lines)
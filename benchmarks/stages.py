@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+stages
+----------------------------------
+
+Module with the benchmarks of each stage of the validation pipeline, from building the GeometryParameters to the full
+request. Each stage is a tuple (name, function, setup) that can be given to runner.run_benchmark().
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import copy
+import itertools
+
+from datavalidation import datavalidation
+from datavalidation.core import BikeGeometry, GeometryParameter
+from datavalidation.core.constants import VALIDATABLE_PARAMETER_LIST
+from datavalidation.normalisation import normalise_bike_geometry
+from datavalidation.validation import validate_bike_geometry
+from datavalidation.validation.equations import get_equations, solve_equation
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+def get_stages(geometry_list: list, engine: str = None) -> list:
+	"""
+	Gets the benchmarks of all the stages of the pipeline for a list of bike geometries. Each call of a stage uses the
+	next geometry of the list.
+
+	:param geometry_list: list of bike geometry dicts
+	:param engine: solver engine used by solve_equation(), default is None for the current engine
+	:return: list of tuples (name, function, setup)
+	"""
+	geometries = itertools.cycle(geometry_list)
+
+	def next_geometry():
+		return copy.deepcopy(next(geometries))
+
+	def new_bike_geometry():
+		return BikeGeometry(next_geometry())
+
+	def normalised_bike_geometry():
+		bike_geometry = new_bike_geometry()
+		normalise_bike_geometry(bike_geometry)
+		return bike_geometry
+
+	def validated_bike_geometry():
+		bike_geometry = normalised_bike_geometry()
+		try:
+			validate_bike_geometry(bike_geometry)
+		except Exception:
+			# the benchmark of to_dict() can still run with a partially validated geometry
+			pass
+		return bike_geometry
+
+	stages = [
+		("GeometryParameter", _build_parameters, lambda: (next_geometry(), )),
+		("BikeGeometry", BikeGeometry, lambda: (next_geometry(), )),
+		("normalise_bike_geometry", normalise_bike_geometry, lambda: (new_bike_geometry(), )),
+		("get_equations", _get_all_equations, lambda: (normalised_bike_geometry(), ))
+	]
+
+	for i, formula in enumerate(VALIDATION_FORMULAE):
+		for parameter_name in formula['parameters']:
+			stages.append((
+				"solve_equation[{}:{}]".format(i, parameter_name),
+				lambda bike_geometry, formula=formula, parameter_name=parameter_name:
+					solve_equation(formula, parameter_name, bike_geometry, engine=engine),
+				lambda: (normalised_bike_geometry(), )
+			))
+
+	stages.extend([
+		("validate_bike_geometry", validate_bike_geometry, lambda: (normalised_bike_geometry(), )),
+		("to_dict", lambda bike_geometry: bike_geometry.to_dict(), lambda: (validated_bike_geometry(), )),
+		("request_validate_bike_geometry", datavalidation.request_validate_bike_geometry,
+			lambda: ({"geometries": [next_geometry()]}, ))
+	])
+
+	return stages
+
+
+def _build_parameters(geometry: dict) -> list:
+	"""
+	Builds the GeometryParameters of a bike geometry dict.
+
+	:param geometry: bike geometry dict
+	:return: list of GeometryParameter
+	"""
+	return [GeometryParameter.from_dict(parameter) for parameter in geometry['parameter_list']]
+
+
+def _get_all_equations(bike_geometry: BikeGeometry) -> list:
+	"""
+	Gets the equations of all the validatable parameters, filtered by the parameters of the BikeGeometry.
+
+	:param bike_geometry: BikeGeometry
+	:return: list of lists of equations
+	"""
+	parameter_list = bike_geometry.get_parameter_list()
+
+	return [get_equations(name, parameter_list) for name in VALIDATABLE_PARAMETER_LIST]
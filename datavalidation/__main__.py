@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Command line interface of the datavalidation package.
+
+Example usage::
+
+	# profile the validation of a request (see the profiling module)
+	datavalidation profile request.json --repeat 5
+	python -m datavalidation profile request.json --pstats profile.pstats --collapsed profile.collapsed
+
+	# recompute the geometry statistics from dumps of geometries (see the geometrystatistics module)
+	datavalidation statistics dump1.jsonl dump2.jsonl --workers 2 -o statistics.json
+
+	# derive the formulae that calculate chained parameters in one step (see the derived module)
+	datavalidation derive --eliminations 2 -o derived.json
+"""
+
+
+import sys
+import json
+import logging
+import argparse
+
+from datavalidation.core.config import set_up_logging
+
+
+def profile_command(args) -> int:
+	# imported here so the logging is set up before datavalidation sets it up
+	from datavalidation.profiling import run_profile
+
+	with open(args.request) as request_file:
+		request_content = json.load(request_file)
+
+	print(run_profile(request_content, args.repeat, args.top, args.pstats, args.collapsed, not args.no_sampling,
+		args.interval))
+
+	return 0
+
+
+def statistics_command(args) -> int:
+	from datavalidation.validation.geometrystatistics import compute_statistics
+
+	result = compute_statistics(args.filepath, args.output, args.state, args.merge, args.parameter, args.workers,
+		args.k, args.seed)
+
+	print("{} geometries, statistics of {} parameters".format(result.geometries, len(result.moments)))
+	return 0
+
+
+def derive_command(args) -> int:
+	from datavalidation.validation.derived import DERIVED_FILE, derive_formulae, save_derived_file
+
+	derived_list = derive_formulae(eliminations=args.eliminations, timeout=args.timeout)
+	save_derived_file(args.output if args.output is not None else DERIVED_FILE, derived_list)
+
+	print("{} derived formulae, {} compiled solutions".format(
+		len(derived_list), sum(len(derived['solutions']) for derived in derived_list)))
+	return 0
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="datavalidation", description="Validation of bike geometries")
+	subparsers = parser.add_subparsers(dest="command")
+
+	profile_parser = subparsers.add_parser("profile", help="profile the validation of a request JSON file")
+	profile_parser.add_argument("request", help="request JSON file")
+	profile_parser.add_argument("--repeat", type=int, default=1, help="times the request is validated, default is 1")
+	profile_parser.add_argument("--top", type=int, default=10, help="functions shown per module, default is 10")
+	profile_parser.add_argument("--pstats", default="profile.pstats",
+		help="file where the cProfile stats are saved, default is profile.pstats")
+	profile_parser.add_argument("--collapsed", default="profile.collapsed",
+		help="file where the collapsed stacks are saved, default is profile.collapsed")
+	profile_parser.add_argument("--no-sampling", action="store_true",
+		help="do not run the sampling profiler (no collapsed stacks)")
+	profile_parser.add_argument("--interval", type=float, default=0.001,
+		help="seconds between samples of the sampling profiler, default is 0.001")
+	profile_parser.set_defaults(function=profile_command)
+
+	statistics_parser = subparsers.add_parser("statistics",
+		help="recompute the geometry statistics from dumps of bike geometries")
+	statistics_parser.add_argument("filepath", nargs="+", help="JSON lines or CSV dumps (or states with --merge)")
+	statistics_parser.add_argument("-o", "--output", default=None,
+		help="statistics file to write, default is the one of the package unless --state is given")
+	statistics_parser.add_argument("--state", default=None, help="file to write the state of the accumulator to merge it")
+	statistics_parser.add_argument("--merge", action="store_true", help="merge the states given instead of reading dumps")
+	statistics_parser.add_argument("--parameter", action="append", default=None,
+		help="only compute the statistics of this parameter (can be repeated)")
+	statistics_parser.add_argument("--workers", type=int, default=1, help="processes reading the dumps, default is 1")
+	statistics_parser.add_argument("--k", type=int, default=200, help="size of the quantile sketches, default is 200")
+	statistics_parser.add_argument("--seed", type=int, default=0, help="seed of the quantile sketches, default is 0")
+	statistics_parser.set_defaults(function=statistics_command)
+
+	derive_parser = subparsers.add_parser("derive",
+		help="derive the formulae that calculate chained parameters in one step")
+	derive_parser.add_argument("-o", "--output", default=None,
+		help="derived file to write, default is the one of the package")
+	derive_parser.add_argument("--eliminations", type=int, default=1,
+		help="maximum number of parameters eliminated in each derived formula, default is 1")
+	derive_parser.add_argument("--timeout", type=float, default=60,
+		help="maximum time in seconds of each elimination and each solution, default is 60")
+	derive_parser.set_defaults(function=derive_command)
+
+	args = parser.parse_args(argv)
+
+	if args.command is None:
+		parser.print_help()
+		return 1
+
+	set_up_logging(use_test_config=True)
+	logging.getLogger().setLevel(logging.WARNING)
+
+	return args.function(args)
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -113,8 +113,9 @@ class BikeGeometry:
 
 	def __init__(self, json_dict: dict):
 		# this makes sure that the parameters are None to start with, to avoid Python messing with the objects at run-time
-		for key in self._parameters.keys():
-			self._parameters[key] = None
+		# each BikeGeometry gets its own dicts, so BikeGeometries can be validated at the same time in different threads
+		self._parameters = dict.fromkeys(BikeGeometry._parameters.keys())
+		self._extra_values = {}
 
 		self._from_json(json_dict)
 
@@ -205,6 +206,14 @@ class BikeGeometry:
 		return [key for key in self._parameters.keys()
 			if self._is_parameter_empty(key) and key in VALIDATABLE_PARAMETER_LIST]
 
+	def get_parameter_threshold(self) -> float:
+		"""
+		Gets the parameter threshold of this BikeGeometry. Parameters with a confidence below it are invalid.
+
+		:return: float between 0 and 1
+		"""
+		return self._PARAMETER_THRESHOLD
+
 	def get_confidence_score(self):
 		"""
 		Gets the confidence score of this BikeGeometry. It is None if no validation has been performed on this
@@ -49,6 +49,8 @@ class GeometryParameter:
 	_calculated_value = None
 	_type = str
 	_confidence = None
+	_range_confidence = None
+	_suggestions = None
 	_extra_values = {}
 
 	def __init__(self, name: str, value, extra_values: dict = None):
@@ -183,6 +185,25 @@ class GeometryParameter:
 		"""
 		return self._confidence
 
+	@property
+	def range_confidence(self) -> list:
+		"""
+		Gets the confidence score of each value of the range of the GeometryParameter, if its value is a range.
+
+		:return: list of float confidence scores, in the order of the values of the range, or None
+		"""
+		return self._range_confidence
+
+	@property
+	def suggestions(self) -> list:
+		"""
+		Gets the suggested corrections of the value of the GeometryParameter, if it was found invalid.
+
+		:return: list of dicts with the value ("v"), the kind of edit ("edit") and the residual of the formulae with it
+			("residual"), or None
+		"""
+		return self._suggestions
+
 	def set_normalised_value(self, new_value):
 		"""
 		Sets the value of the GeometryParameter after normalising its value.
@@ -261,6 +282,27 @@ class GeometryParameter:
 						self.name, self.confidence))
 					self._confidence = 0 if self.confidence < 0 else 1
 
+	def set_range_confidence(self, confidence_list: list):
+		"""
+		Sets the confidence score of each value of the range of the GeometryParameter. Like set_confidence(), it does not
+		change them once the GeometryParameter has a calculated value.
+
+		:param confidence_list: list of confidence values, in the order of the values of the range
+		:return: None
+		"""
+		if self._range_confidence is None or self.calculated_value is None:
+			self._range_confidence = [min(max(confidence, 0), 1) for confidence in confidence_list]
+
+	def set_suggestions(self, suggestion_list: list):
+		"""
+		Sets the suggested corrections of the value of the GeometryParameter (see the corrections module).
+
+		:param suggestion_list: list of dicts with the value ("v"), the kind of edit ("edit") and the residual ("residual"),
+			from the best to the worst
+		:return: None
+		"""
+		self._suggestions = suggestion_list if len(suggestion_list) > 0 else None
+
 	def is_number(self) -> bool:
 		"""
 		Checks if the GeometryParameter is a number type (float or int, but not a string or unknown).
@@ -300,6 +342,13 @@ class GeometryParameter:
 		if self.confidence is not None:
 			json_dict['confidence'] = self.confidence
 
+		if self.range_confidence is not None:
+			json_dict['range_confidence'] = self.range_confidence
+
+		if self.suggestions is not None:
+			json_dict['suggestions'] = [dict(suggestion, v=self._format_parameter_value(suggestion['v']))
+				if string_values else dict(suggestion) for suggestion in self.suggestions]
+
 		return json_dict
 
 	def _resolve_type(self):
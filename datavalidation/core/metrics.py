@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+metrics
+----------------------------------
+
+Module with low-overhead in-process metrics (counters, gauges and histograms with labels) that can be exported in the
+Prometheus text format. The validation pipeline records in them the time spent in each stage, the fixed-point
+iterations, and the time, solutions and errors of each formula and unknown. The pipeline only records them once they
+are enabled with set_enabled(True), e.g. by the flask wrapper.
+
+Example usage::
+
+	>> SOLVE_SECONDS = get_histogram("datavalidation_solve_seconds", "Time solving equations", ["formula", "unknown"])
+	>> SOLVE_SECONDS.observe(0.01, ("0", "reach"))
+	>> print(export_prometheus())
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import time
+import bisect
+import threading
+import functools
+
+
+# default buckets of the histograms, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# content type of the Prometheus text format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# all the metrics created with get_counter(), get_gauge() or get_histogram(), keyed by name
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+# disabled by default, so the library does not pay for the metrics unless a service reports them (e.g. the flask
+# wrapper)
+_enabled = False
+
+
+class Counter:
+	"""
+	A Counter is a value that only increases, with an optional set of labels.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	"""
+
+	def __init__(self, name: str, description: str, label_names: list = None):
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names) if label_names is not None else ()
+
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def inc(self, amount: float = 1, labels: tuple = ()):
+		"""
+		Increases the counter.
+
+		:param amount: amount to increase, default is 1
+		:param labels: tuple with the values of the labels, in the order of label_names
+		:return: None
+		"""
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+	def get(self, labels: tuple = ()) -> float:
+		"""
+		Gets the value of the counter.
+
+		:param labels: tuple with the values of the labels
+		:return: value, 0 if it has not been increased yet
+		"""
+		return self._values.get(labels, 0)
+
+	def reset(self):
+		"""
+		Resets the counter for all the labels.
+
+		:return: None
+		"""
+		with self._lock:
+			self._values.clear()
+
+	def export(self) -> list:
+		"""
+		Exports the counter in the Prometheus text format.
+
+		:return: list of lines
+		"""
+		lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} counter".format(self.name)]
+
+		with self._lock:
+			for labels, value in sorted(self._values.items()):
+				lines.append("{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value)))
+
+		return lines
+
+
+class Gauge:
+	"""
+	A Gauge is a value that can go up and down, with an optional set of labels.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	"""
+
+	def __init__(self, name: str, description: str, label_names: list = None):
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names) if label_names is not None else ()
+
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def set(self, value: float, labels: tuple = ()):
+		"""
+		Sets the value of the gauge.
+
+		:param value: new value
+		:param labels: tuple with the values of the labels, in the order of label_names
+		:return: None
+		"""
+		with self._lock:
+			self._values[labels] = value
+
+	def get(self, labels: tuple = ()) -> float:
+		"""
+		Gets the value of the gauge.
+
+		:param labels: tuple with the values of the labels
+		:return: value, 0 if it has not been set yet
+		"""
+		return self._values.get(labels, 0)
+
+	def reset(self):
+		"""
+		Resets the gauge for all the labels.
+
+		:return: None
+		"""
+		with self._lock:
+			self._values.clear()
+
+	def export(self) -> list:
+		"""
+		Exports the gauge in the Prometheus text format.
+
+		:return: list of lines
+		"""
+		lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} gauge".format(self.name)]
+
+		with self._lock:
+			for labels, value in sorted(self._values.items()):
+				lines.append("{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value)))
+
+		return lines
+
+
+class Histogram:
+	"""
+	A Histogram counts observations in buckets, with an optional set of labels. It also keeps their count and sum.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	:param buckets: upper bounds of the buckets, default is DEFAULT_BUCKETS
+	"""
+
+	def __init__(self, name: str, description: str, label_names: list = None, buckets: tuple = DEFAULT_BUCKETS):
+		self.name = name
+		self.description = description
+		self.label_names = tuple(label_names) if label_names is not None else ()
+		self.buckets = tuple(sorted(buckets))
+
+		# for each labels, a list with the counts of each bucket (plus +Inf), the count and the sum
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def observe(self, value: float, labels: tuple = ()):
+		"""
+		Records an observation.
+
+		:param value: observed value
+		:param labels: tuple with the values of the labels, in the order of label_names
+		:return: None
+		"""
+		index = bisect.bisect_left(self.buckets, value)
+
+		with self._lock:
+			try:
+				values = self._values[labels]
+			except KeyError:
+				values = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+
+			values[0][index] += 1
+			values[1] += 1
+			values[2] += value
+
+	def get_count(self, labels: tuple = ()) -> int:
+		"""
+		Gets the number of observations.
+
+		:param labels: tuple with the values of the labels
+		:return: count, 0 if nothing has been observed yet
+		"""
+		return self._values[labels][1] if labels in self._values else 0
+
+	def get_sum(self, labels: tuple = ()) -> float:
+		"""
+		Gets the sum of the observations.
+
+		:param labels: tuple with the values of the labels
+		:return: sum, 0 if nothing has been observed yet
+		"""
+		return self._values[labels][2] if labels in self._values else 0.0
+
+	def reset(self):
+		"""
+		Resets the histogram for all the labels.
+
+		:return: None
+		"""
+		with self._lock:
+			self._values.clear()
+
+	def export(self) -> list:
+		"""
+		Exports the histogram in the Prometheus text format.
+
+		:return: list of lines
+		"""
+		lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} histogram".format(self.name)]
+
+		with self._lock:
+			for labels, (bucket_counts, count, total) in sorted(self._values.items()):
+				cumulative = 0
+				for upper_bound, bucket_count in zip(self.buckets + ("+Inf", ), bucket_counts):
+					cumulative += bucket_count
+					lines.append("{}_bucket{} {}".format(self.name, _format_labels(
+						self.label_names + ("le", ), labels + (_format_value(upper_bound), )), cumulative))
+
+				lines.append("{}_count{} {}".format(self.name, _format_labels(self.label_names, labels), count))
+				lines.append("{}_sum{} {}".format(self.name, _format_labels(self.label_names, labels),
+					_format_value(total)))
+
+		return lines
+
+
+def get_counter(name: str, description: str, label_names: list = None) -> Counter:
+	"""
+	Gets a Counter from the registry, creating it if it does not exist.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	:return: Counter
+	"""
+	return _get_metric(Counter, name, description, label_names)
+
+
+def get_gauge(name: str, description: str, label_names: list = None) -> Gauge:
+	"""
+	Gets a Gauge from the registry, creating it if it does not exist.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	:return: Gauge
+	"""
+	return _get_metric(Gauge, name, description, label_names)
+
+
+def get_histogram(name: str, description: str, label_names: list = None, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+	"""
+	Gets a Histogram from the registry, creating it if it does not exist.
+
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names, default is None for no labels
+	:param buckets: upper bounds of the buckets, default is DEFAULT_BUCKETS
+	:return: Histogram
+	"""
+	return _get_metric(Histogram, name, description, label_names, buckets)
+
+
+def export_prometheus() -> str:
+	"""
+	Exports all the metrics of the registry in the Prometheus text format.
+
+	:return: string
+	"""
+	lines = []
+
+	for name in sorted(_REGISTRY.keys()):
+		lines.extend(_REGISTRY[name].export())
+
+	return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+	"""
+	Resets all the metrics of the registry.
+
+	:return: None
+	"""
+	for metric in _REGISTRY.values():
+		metric.reset()
+
+
+def set_enabled(enabled: bool):
+	"""
+	Enables or disables recording the metrics of the validation pipeline.
+
+	:param enabled: True to record metrics
+	:return: None
+	"""
+	global _enabled
+	_enabled = enabled
+
+
+def is_enabled() -> bool:
+	"""
+	Checks if the metrics of the validation pipeline are being recorded.
+
+	:return: bool
+	"""
+	return _enabled
+
+
+def timed(stage: str):
+	"""
+	Decorator that records the time spent in a function in the "datavalidation_stage_seconds" histogram.
+
+	:param stage: name of the stage, used as label
+	:return: decorator
+	"""
+	labels = (stage, )
+
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not _enabled:
+				return function(*args, **kwargs)
+
+			start_time = time.perf_counter()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				STAGE_SECONDS.observe(time.perf_counter() - start_time, labels)
+
+		return wrapper
+
+	return decorator
+
+
+def _get_metric(metric_class, name: str, description: str, label_names: list = None, *args):
+	"""
+	Helper function that gets a metric from the registry, creating it if it does not exist.
+
+	:param metric_class: Counter, Gauge or Histogram
+	:param name: name of the metric
+	:param description: description of the metric
+	:param label_names: list of label names
+	:return: metric
+	:raise ValueError: raised if a metric with the same name but another type already exists
+	"""
+	with _REGISTRY_LOCK:
+		if name not in _REGISTRY:
+			_REGISTRY[name] = metric_class(name, description, label_names, *args)
+
+		elif not isinstance(_REGISTRY[name], metric_class):
+			raise ValueError("Metric '{}' already exists with type {}".format(name, type(_REGISTRY[name]).__name__))
+
+		return _REGISTRY[name]
+
+
+def _format_labels(label_names: tuple, labels: tuple) -> str:
+	"""
+	Formats the labels of a metric, e.g. {formula="0",unknown="reach"}.
+
+	:param label_names: tuple of label names
+	:param labels: tuple of label values
+	:return: string, empty if there are no labels
+	"""
+	if len(label_names) == 0:
+		return ""
+
+	return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+		for name, value in zip(label_names, labels)) + "}"
+
+
+def _format_value(value) -> str:
+	"""
+	Formats a value of a metric.
+
+	:param value: number or "+Inf"
+	:return: string
+	"""
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value)) if abs(value) < 1e15 else repr(value)
+
+	return str(value)
+
+
+# metrics of the validation pipeline
+STAGE_SECONDS = get_histogram("datavalidation_stage_seconds", "Time spent in each stage of the pipeline", ["stage"])
+FIXED_POINT_ITERATIONS = get_histogram("datavalidation_fixed_point_iterations",
+	"Iterations of calculate_missing_parameters() per geometry", buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+SOLVE_SECONDS = get_histogram("datavalidation_solve_seconds", "Time solving each formula for each unknown",
+	["formula", "unknown"])
+SOLVE_SOLUTIONS = get_histogram("datavalidation_solve_solutions", "Solutions found for each formula and unknown",
+	["formula", "unknown"], buckets=(0, 1, 2, 3, 4, 8))
+SOLVE_ERRORS = get_counter("datavalidation_solve_errors_total",
+	"Exceptions raised by sympy solving each formula for each unknown", ["formula", "unknown"])
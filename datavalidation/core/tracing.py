@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+tracing
+----------------------------------
+
+Module with an opt-in tracer that records nested spans of the validation pipeline (each geometry, the normalisation,
+each pass calculating the missing parameters, and each call to get_equations(), solve_equation() and
+filter_by_constraints() with its arguments). The spans are saved as a Chrome trace JSON file, which can be opened in
+chrome://tracing or https://ui.perfetto.dev.
+
+When no tracer is active, the traced functions only check a flag before running as usual.
+
+Example usage::
+
+	>> request_validate_bike_geometry(request_content, trace_file="trace.json")
+
+	# or from the command line
+	python -m datavalidation.core.tracing request.json trace.json
+
+Note that the tracer is global to the process, so concurrent requests validated while it is active are recorded too
+(each one in its own thread row).
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import sys
+import json
+import time
+import inspect
+import logging
+import argparse
+import functools
+import threading
+import contextlib
+
+
+# maximum length of the arguments and results recorded in the spans
+MAX_ARGUMENT_LENGTH = 200
+
+# the tracer recording spans, None when tracing is off
+_tracer = None
+
+
+class Tracer:
+	"""
+	A Tracer records spans as Chrome trace "complete" events.
+	"""
+
+	def __init__(self):
+		self.events = []
+		self._start_time = time.perf_counter()
+		self._pid = os.getpid()
+		self._lock = threading.Lock()
+
+	def add_span(self, name: str, start_time: float, end_time: float, arguments: dict = None):
+		"""
+		Adds a span to the trace.
+
+		:param name: name of the span
+		:param start_time: start time from time.perf_counter()
+		:param end_time: end time from time.perf_counter()
+		:param arguments: dict with the arguments of the span, default is None
+		:return: None
+		"""
+		event = {
+			"name": name,
+			"ph": "X",
+			# timestamps and durations are in microseconds
+			"ts": (start_time - self._start_time) * 1e6,
+			"dur": (end_time - start_time) * 1e6,
+			"pid": self._pid,
+			"tid": threading.get_ident(),
+			"args": arguments if arguments is not None else {}
+		}
+
+		with self._lock:
+			self.events.append(event)
+
+	@contextlib.contextmanager
+	def span(self, name: str, arguments: dict = None):
+		"""
+		Context manager that records a span while the context is running.
+
+		:param name: name of the span
+		:param arguments: dict with the arguments of the span, default is None
+		"""
+		start_time = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add_span(name, start_time, time.perf_counter(), arguments)
+
+	def to_dict(self) -> dict:
+		"""
+		Gets the trace in the Chrome trace format.
+
+		:return: dict, ready to be serialised as JSON
+		"""
+		with self._lock:
+			return {"traceEvents": sorted(self.events, key=lambda e: e['ts']), "displayTimeUnit": "ms"}
+
+	def save(self, filepath: str):
+		"""
+		Saves the trace to a JSON file.
+
+		:param filepath: path of the trace file
+		:return: None
+		"""
+		with open(filepath, "w") as trace_file:
+			json.dump(self.to_dict(), trace_file)
+
+		logging.info("Trace with {} spans saved to '{}'".format(len(self.events), filepath))
+
+
+@contextlib.contextmanager
+def tracing(filepath: str = None):
+	"""
+	Context manager that records the spans of the traced functions while the context is running.
+
+	:param filepath: path of the trace file written when the context exits, default is None to not write it
+	:raise RuntimeError: raised if a tracer is already active
+	"""
+	global _tracer
+
+	if _tracer is not None:
+		raise RuntimeError("A tracer is already active, only one trace can be recorded at a time")
+
+	tracer = Tracer()
+	_tracer = tracer
+
+	try:
+		yield tracer
+	finally:
+		_tracer = None
+
+		if filepath is not None:
+			tracer.save(filepath)
+
+
+def is_tracing() -> bool:
+	"""
+	Checks if a tracer is active.
+
+	:return: bool
+	"""
+	return _tracer is not None
+
+
+def traced(name: str = None):
+	"""
+	Decorator that records a span with the arguments and the result of each call to a function while a tracer is
+	active.
+
+	:param name: name of the spans, default is None to use "module.function"
+	:return: decorator
+	"""
+	def decorator(function):
+		span_name = name if name is not None else "{}.{}".format(function.__module__.rsplit(".", 1)[-1],
+			function.__name__)
+		signature = inspect.signature(function)
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			tracer = _tracer
+			if tracer is None:
+				return function(*args, **kwargs)
+
+			arguments = {key: _format_argument(value) for key, value in
+				signature.bind(*args, **kwargs).arguments.items()}
+			start_time = time.perf_counter()
+			result = None
+
+			try:
+				result = function(*args, **kwargs)
+				return result
+			finally:
+				arguments["result"] = _format_argument(result)
+				tracer.add_span(span_name, start_time, time.perf_counter(), arguments)
+
+		return wrapper
+
+	return decorator
+
+
+def _format_argument(value) -> str:
+	"""
+	Formats an argument or a result of a traced function to be recorded in a span.
+
+	:param value: any value
+	:return: string, trimmed to MAX_ARGUMENT_LENGTH
+	"""
+	if isinstance(value, list) and len(value) > 0 and hasattr(value[0], "normalised_value"):
+		# list of GeometryParameters
+		text = str([param.name for param in value])
+
+	elif hasattr(value, "normalised_value"):
+		# GeometryParameter
+		text = "{}={}".format(value.name, value.value)
+
+	elif hasattr(value, "get_parameter_list"):
+		# BikeGeometry
+		text = "BikeGeometry({} parameters)".format(len(value.get_parameter_list()))
+
+	elif isinstance(value, dict) and "equation" in value:
+		# formula
+		text = value['equation']
+
+	else:
+		text = repr(value)
+
+	return text if len(text) <= MAX_ARGUMENT_LENGTH else text[:MAX_ARGUMENT_LENGTH - 3] + "..."
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(prog="python -m datavalidation.core.tracing",
+		description="Validates a request and saves a Chrome trace of it")
+	parser.add_argument("request", help="request JSON file")
+	parser.add_argument("trace", help="trace file to write")
+	args = parser.parse_args()
+
+	from datavalidation.datavalidation import request_validate_bike_geometry
+
+	with open(args.request) as request_file:
+		request_validate_bike_geometry(json.load(request_file), trace_file=args.trace)
+
+	print("Trace saved to '{}'".format(args.trace), file=sys.stdout)
@@ -16,7 +16,10 @@ import logging
 # from .core import BikeGeometry, set_up_logging
 import datavalidation.core as dvcore
 import datavalidation.core.config as dvconfig
+import datavalidation.core.metrics as dvmetrics
+import datavalidation.core.tracing as dvtracing
 import datavalidation.validation as validation
+import datavalidation.validation.registry as registry
 import datavalidation.normalisation as normalisation
 
 
@@ -24,7 +27,8 @@ import datavalidation.normalisation as normalisation
 dvconfig.set_up_logging()
 
 
-def request_validate_bike_geometry(request_content: dict) -> dict:
+@dvtracing.traced()
+def request_validate_bike_geometry(request_content: dict, trace_file: str = None) -> dict:
 	"""
 	Request to validate a bike geometry.
 
@@ -55,11 +59,21 @@ def request_validate_bike_geometry(request_content: dict) -> dict:
 	Check the `usage` document for more information.
 
 	:param request_content: content of the request as a dict
-	:return: request response as a dict
+	:param trace_file: path of a Chrome trace file to record the validation of this request in (see the tracing
+		module), default is None to not trace it
+	:return: request response as a dict, with the version of the registry used to validate it ("registry_version")
 	"""
+	if trace_file is not None:
+		with dvtracing.tracing(trace_file):
+			return request_validate_bike_geometry(request_content)
+
 	logging.info("Received validate_bike_geometry request")
 
-	request_content['geometries'] = validate_bike_geometry_list(request_content['geometries'])
+	# the registry is not reloaded in the middle of the request, so all its geometries use the same version
+	with registry.using_registry() as registry_version:
+		request_content['geometries'] = _validate_bike_geometry_list(request_content['geometries'], registry_version)
+
+	request_content['registry_version'] = registry_version
 
 	# return correctly formatted request
 	logging.info("Responding to validate_bike_geometry request")
@@ -92,12 +106,24 @@ def validate_bike_geometry_list(bike_geometry_list: list) -> list:
 		]
 
 	:param bike_geometry_list: list of bike geometry dicts
+	:return: list of bike geometry dicts validated, all with the same version of the registry
+	"""
+	with registry.using_registry() as registry_version:
+		return _validate_bike_geometry_list(bike_geometry_list, registry_version)
+
+
+def _validate_bike_geometry_list(bike_geometry_list: list, registry_version: str) -> list:
+	"""
+	Helper function that validates a list of bike geometries while holding the registry.
+
+	:param bike_geometry_list: list of bike geometry dicts
+	:param registry_version: version of the registry held
 	:return: list of bike geometry dicts validated
 	"""
 	validated_geometry_list = []
 	# for each bike geometry, normalise it and validate
 	for geometry in bike_geometry_list:
-		validated_geometry = validate_bike_geometry(geometry)
+		validated_geometry = _validate_bike_geometry(geometry, registry_version)
 
 		# add it to list in dict format
 		validated_geometry_list.append(validated_geometry)
@@ -126,6 +152,21 @@ def validate_bike_geometry(bike_geometry_dict: dict) -> dict:
 		}
 
 	:param bike_geometry_dict: bike geometry dict
+	:return: bike geometry dict, with the version of the registry used to validate it ("registry_version")
+	"""
+	# the registry is not reloaded in the middle of the validation of a geometry
+	with registry.using_registry() as registry_version:
+		return _validate_bike_geometry(bike_geometry_dict, registry_version)
+
+
+@dvtracing.traced("datavalidation.validate_bike_geometry")
+@dvmetrics.timed("validate_bike_geometry")
+def _validate_bike_geometry(bike_geometry_dict: dict, registry_version: str) -> dict:
+	"""
+	Helper function that validates a bike geometry while holding the registry.
+
+	:param bike_geometry_dict: bike geometry dict
+	:param registry_version: version of the registry held
 	:return: bike geometry dict
 	"""
 	bike_geometry = dvcore.BikeGeometry(bike_geometry_dict)
@@ -138,6 +179,7 @@ def validate_bike_geometry(bike_geometry_dict: dict) -> dict:
 
 	# return correctly formatted request
 	bike_dict = bike_geometry.to_dict()
+	bike_dict['registry_version'] = registry_version
 	logging.debug("Validated bike geometry dump: {}".format(bike_dict))
 
 	return bike_dict
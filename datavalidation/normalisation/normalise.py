@@ -15,9 +15,13 @@ import logging
 
 from ..core import BikeGeometry
 from ..core import GeometryParameter
+from ..core.metrics import timed
+from ..core.tracing import traced
 from .number import normalise_number
 
 
+@traced()
+@timed("normalise_bike_geometry")
 def normalise_bike_geometry(bike_geometry: BikeGeometry):
 	"""
 	Normalises the GeometryParameters inside a BikeGeometry.
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+profiling
+----------------------------------
+
+Module to profile the validation of a request, e.g. a slow customer payload. The request is validated N times under
+cProfile, whose functions are grouped by the module of the package they belong to (core, normalisation, validation,
+sympy...). Optionally, it is also validated under a sampling profiler that records the call stacks, which are saved
+as collapsed stacks for flame graphs (e.g. flamegraph.pl or speedscope).
+
+Example usage::
+
+	datavalidation profile request.json --repeat 5 --pstats profile.pstats --collapsed profile.collapsed
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import sys
+import copy
+import time
+import pstats
+import cProfile
+import threading
+import collections
+
+from datavalidation import datavalidation
+
+
+# groups of functions, by the path of the file that defines them (first match wins)
+FUNCTION_GROUPS = [
+	("core", os.path.join("datavalidation", "core") + os.sep),
+	("normalisation", os.path.join("datavalidation", "normalisation") + os.sep),
+	("validation", os.path.join("datavalidation", "validation") + os.sep),
+	("service", os.path.join("datavalidation", "service") + os.sep),
+	("datavalidation", "datavalidation" + os.sep),
+	("sympy", os.sep + "sympy" + os.sep)
+]
+
+# default interval of the sampling profiler, in seconds
+SAMPLING_INTERVAL = 0.001
+
+
+def profile_request(request_content: dict, repeat: int = 1) -> tuple:
+	"""
+	Profiles the validation of a request with cProfile. Exceptions raised by the validation are profiled too.
+
+	:param request_content: content of the request as a dict, it is not modified
+	:param repeat: number of times the request is validated, default is 1
+	:return: tuple (pstats.Stats, list of exceptions raised)
+	"""
+	profiler = cProfile.Profile()
+	errors = []
+
+	for _ in range(repeat):
+		request = copy.deepcopy(request_content)
+
+		profiler.enable()
+		try:
+			datavalidation.request_validate_bike_geometry(request)
+		except Exception as e:
+			errors.append(e)
+		finally:
+			profiler.disable()
+
+	return pstats.Stats(profiler), errors
+
+
+def sample_request(request_content: dict, repeat: int = 1, interval: float = SAMPLING_INTERVAL) -> collections.Counter:
+	"""
+	Profiles the validation of a request with a sampling profiler: a thread records the call stack of the validation
+	every `interval` seconds.
+
+	:param request_content: content of the request as a dict, it is not modified
+	:param repeat: number of times the request is validated, default is 1
+	:param interval: seconds between samples, default is SAMPLING_INTERVAL
+	:return: Counter of collapsed stacks ("root;...;leaf") and their number of samples
+	"""
+	stacks = collections.Counter()
+	thread_id = threading.get_ident()
+	done = threading.Event()
+
+	def sample():
+		while not done.wait(interval):
+			frame = sys._current_frames().get(thread_id)
+			stack = []
+
+			while frame is not None:
+				stack.append(get_frame_name(frame.f_code))
+				frame = frame.f_back
+
+			if len(stack) > 0:
+				stacks[";".join(reversed(stack))] += 1
+
+	sampler = threading.Thread(target=sample, name="datavalidation-sampler", daemon=True)
+	sampler.start()
+
+	try:
+		for _ in range(repeat):
+			try:
+				datavalidation.request_validate_bike_geometry(copy.deepcopy(request_content))
+			except Exception:
+				# profile_request() already reports the exceptions
+				pass
+	finally:
+		done.set()
+		sampler.join()
+
+	return stacks
+
+
+def group_functions(stats: pstats.Stats) -> dict:
+	"""
+	Groups the functions of a profile by FUNCTION_GROUPS.
+
+	:param stats: pstats.Stats
+	:return: dict with a list of tuples (function, calls, total time, cumulative time) for each group, sorted by total
+		time
+	"""
+	groups = collections.defaultdict(list)
+
+	for (filename, line, name), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+		group = get_function_group(filename)
+		groups[group].append(("{}:{}({})".format(_get_short_filename(filename), line, name), calls, total_time,
+			cumulative_time))
+
+	return {group: sorted(function_list, key=lambda f: f[2], reverse=True) for group, function_list in groups.items()}
+
+
+def format_groups(groups: dict, top: int = 10) -> str:
+	"""
+	Formats the functions of a profile grouped with group_functions(), showing the total time of each group and its
+	top functions.
+
+	:param groups: dict returned by group_functions()
+	:param top: number of functions shown per group, default is 10
+	:return: report as a string
+	"""
+	group_times = {group: sum(f[2] for f in function_list) for group, function_list in groups.items()}
+	total_time = sum(group_times.values()) or 1
+	lines = []
+
+	for group in sorted(groups.keys(), key=lambda g: group_times[g], reverse=True):
+		lines.append("{} - {:.3f}s ({:.1%})".format(group, group_times[group], group_times[group] / total_time))
+		lines.append("    {:>10} {:>10} {:>10}  {}".format("calls", "tottime", "cumtime", "function"))
+
+		for function, calls, function_time, cumulative_time in groups[group][:top]:
+			lines.append("    {:>10} {:>10.4f} {:>10.4f}  {}".format(calls, function_time, cumulative_time, function))
+
+		lines.append("")
+
+	return "\n".join(lines)
+
+
+def save_collapsed_stacks(filepath: str, stacks: collections.Counter):
+	"""
+	Saves collapsed stacks, one per line ("root;...;leaf count"), ready for flamegraph.pl or speedscope.
+
+	:param filepath: path of the file
+	:param stacks: Counter returned by sample_request()
+	:return: None
+	"""
+	with open(filepath, "w") as collapsed_file:
+		for stack, count in sorted(stacks.items()):
+			collapsed_file.write("{} {}\n".format(stack, count))
+
+
+def get_function_group(filename: str) -> str:
+	"""
+	Gets the group of a function (see FUNCTION_GROUPS) from the file that defines it.
+
+	:param filename: path of the file
+	:return: name of the group, "other" if it does not belong to any
+	"""
+	return next((group for group, path in FUNCTION_GROUPS if path in filename), "other")
+
+
+def get_frame_name(code) -> str:
+	"""
+	Gets the name of a frame in the collapsed stacks, e.g. "validate.py:validate_bike_geometry".
+
+	:param code: code object of the frame
+	:return: name
+	"""
+	return "{}:{}".format(_get_short_filename(code.co_filename), code.co_name)
+
+
+def run_profile(request_content: dict, repeat: int = 1, top: int = 10, pstats_file: str = None,
+		collapsed_file: str = None, sampling: bool = True, interval: float = SAMPLING_INTERVAL) -> str:
+	"""
+	Profiles a request with cProfile and, optionally, with the sampling profiler. See the `profile` command.
+
+	:param request_content: content of the request as a dict, it is not modified
+	:param repeat: number of times the request is validated by each profiler, default is 1
+	:param top: number of functions shown per group, default is 10
+	:param pstats_file: path where the cProfile stats are saved, default is None to not save them
+	:param collapsed_file: path where the collapsed stacks are saved, default is None to not save them
+	:param sampling: whether to run the sampling profiler, default is True
+	:param interval: seconds between samples of the sampling profiler, default is SAMPLING_INTERVAL
+	:return: report as a string
+	"""
+	start_time = time.perf_counter()
+	stats, errors = profile_request(request_content, repeat)
+
+	lines = ["Validated the request {} time(s) in {:.3f}s under cProfile".format(
+		repeat, time.perf_counter() - start_time)]
+
+	if len(errors) > 0:
+		lines.append("{} validation(s) raised an exception, the last one was {}: {}".format(
+			len(errors), type(errors[-1]).__name__, errors[-1]))
+
+	lines.append("")
+	lines.append(format_groups(group_functions(stats), top))
+
+	if pstats_file is not None:
+		stats.dump_stats(pstats_file)
+		lines.append("cProfile stats saved to '{}'".format(pstats_file))
+
+	if sampling:
+		stacks = sample_request(request_content, repeat, interval)
+		lines.append("Sampling profiler took {} samples".format(sum(stacks.values())))
+
+		if collapsed_file is not None:
+			save_collapsed_stacks(collapsed_file, stacks)
+			lines.append("Collapsed stacks saved to '{}'".format(collapsed_file))
+
+	return "\n".join(lines)
+
+
+def _get_short_filename(filename: str) -> str:
+	"""
+	Gets the name of a file relative to its package, e.g. "validation/equations.py" or "sympy/core/basic.py".
+
+	:param filename: path of the file
+	:return: short filename
+	"""
+	for package in ["datavalidation", "sympy"]:
+		index = filename.rfind(os.sep + package + os.sep)
+		if index >= 0:
+			return filename[index + 1:]
+
+	return os.path.basename(filename)
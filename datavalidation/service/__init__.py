@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+from .coalescer import RequestCoalescer
+from .admission import AdmissionController, RequestRejected
+from .lanes import PriorityRunner, PRIORITY_CLASSES
+from .capture import RequestCapture, read_capture
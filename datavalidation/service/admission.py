@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+admission
+----------------------------------
+
+Module with the admission control of the service layer. It limits the size of the requests and the number of
+geometries being validated at the same time, rejecting requests quickly (before any BikeGeometry is built) instead
+of letting them pile up under bursts.
+
+Requests are rejected with:
+
+- 413 if the request is too large (too many bytes or geometries), retrying it will not help.
+- 429 if the queue of requests waiting to be validated is full.
+- 503 if the request waited in the queue for too long.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import time
+import logging
+import threading
+import contextlib
+
+
+class RequestRejected(Exception):
+	"""
+	Exception raised when a request is rejected by the AdmissionController.
+
+	:param message: reason of the rejection
+	:param status_code: HTTP status code to respond with
+	:param retry_after: seconds after which the client can retry, None if retrying will not help
+	"""
+
+	def __init__(self, message: str, status_code: int, retry_after: int = None):
+		super().__init__(message)
+		self.status_code = status_code
+		self.retry_after = retry_after
+
+
+class AdmissionController:
+	"""
+	An AdmissionController admits requests while the number of geometries in flight is below a limit. Requests above
+	the limit wait in a bounded queue for a limited time.
+
+	Example usage::
+
+		>> admission = AdmissionController(max_in_flight_geometries=100)
+		>> admission.check_request_size(content_length)
+		>> content = json.loads(body)
+		>> with admission.admit(len(content['geometries'])):
+		...     request_validate_bike_geometry(content)
+
+	:param max_request_bytes: maximum size of the body of a request, default is 1 MB
+	:param max_geometries_per_request: maximum number of geometries in a request, default is 100
+	:param max_in_flight_geometries: maximum number of geometries being validated at the same time, default is 100
+	:param max_queue_depth: maximum number of requests waiting to be admitted, default is 64
+	:param queue_timeout: maximum time in seconds that a request waits to be admitted, default is 5
+	:param retry_after: seconds that clients are told to wait before retrying a rejected request, default is 1
+	"""
+
+	def __init__(self, max_request_bytes: int = 1048576, max_geometries_per_request: int = 100,
+			max_in_flight_geometries: int = 100, max_queue_depth: int = 64, queue_timeout: float = 5,
+			retry_after: int = 1):
+		self._max_request_bytes = max_request_bytes
+		self._max_geometries_per_request = max_geometries_per_request
+		self._max_in_flight_geometries = max_in_flight_geometries
+		self._max_queue_depth = max_queue_depth
+		self._queue_timeout = queue_timeout
+		self._retry_after = retry_after
+
+		self._condition = threading.Condition()
+		self._in_flight_geometries = 0
+		self._queue_depth = 0
+
+		# metrics
+		self._admitted = 0
+		self._rejected = {413: 0, 429: 0, 503: 0}
+		self._queue_wait_count = 0
+		self._queue_wait_sum = 0.0
+		self._queue_wait_max = 0.0
+
+	def check_request_size(self, content_length: int):
+		"""
+		Checks the size of the body of a request before parsing it.
+
+		:param content_length: size of the body in bytes, None if unknown
+		:return: None
+		:raise RequestRejected: raised with 413 if the request is too large
+		"""
+		if content_length is not None and content_length > self._max_request_bytes:
+			self._reject("Request too large ({} bytes, maximum is {})".format(
+				content_length, self._max_request_bytes), 413)
+
+	@contextlib.contextmanager
+	def admit(self, geometry_count: int):
+		"""
+		Context manager that admits a request with a number of geometries, waiting in the queue if needed. The
+		geometries are released when the context exits.
+
+		:param geometry_count: number of geometries in the request
+		:raise RequestRejected: raised if the request has too many geometries, the queue is full or the request waited
+			too long in the queue
+		"""
+		self._acquire(geometry_count)
+
+		try:
+			yield
+		finally:
+			self._release(geometry_count)
+
+	def get_metrics(self) -> dict:
+		"""
+		Gets the metrics of the AdmissionController.
+
+		:return: dict with the metrics
+		"""
+		with self._condition:
+			return {
+				"in_flight_geometries": self._in_flight_geometries,
+				"queue_depth": self._queue_depth,
+				"admitted": self._admitted,
+				"rejected": dict(self._rejected),
+				"queue_wait_seconds_count": self._queue_wait_count,
+				"queue_wait_seconds_sum": self._queue_wait_sum,
+				"queue_wait_seconds_max": self._queue_wait_max
+			}
+
+	def _acquire(self, geometry_count: int):
+		"""
+		Acquires room for the geometries of a request. See admit().
+
+		:param geometry_count: number of geometries in the request
+		:return: None
+		:raise RequestRejected: see admit()
+		"""
+		if geometry_count > self._max_geometries_per_request:
+			self._reject("Too many geometries in the request ({}, maximum is {})".format(
+				geometry_count, self._max_geometries_per_request), 413)
+
+		# a request larger than the in-flight limit is allowed alone, otherwise it would never be admitted
+		needed = min(geometry_count, self._max_in_flight_geometries)
+		start_time = time.perf_counter()
+
+		with self._condition:
+			if self._in_flight_geometries + needed > self._max_in_flight_geometries:
+				if self._queue_depth >= self._max_queue_depth:
+					self._reject("Too many requests waiting to be validated", 429)
+
+				self._queue_depth += 1
+				try:
+					admitted = self._condition.wait_for(
+						lambda: self._in_flight_geometries + needed <= self._max_in_flight_geometries,
+						timeout=self._queue_timeout)
+				finally:
+					self._queue_depth -= 1
+
+				if not admitted:
+					self._reject("Request waited more than {}s to be validated".format(self._queue_timeout), 503)
+
+			self._in_flight_geometries += needed
+			self._admitted += 1
+
+			wait_time = time.perf_counter() - start_time
+			self._queue_wait_count += 1
+			self._queue_wait_sum += wait_time
+			self._queue_wait_max = max(self._queue_wait_max, wait_time)
+
+	def _release(self, geometry_count: int):
+		"""
+		Releases the geometries of a request acquired with _acquire().
+
+		:param geometry_count: number of geometries in the request
+		:return: None
+		"""
+		with self._condition:
+			self._in_flight_geometries -= min(geometry_count, self._max_in_flight_geometries)
+			self._condition.notify_all()
+
+	def _reject(self, message: str, status_code: int):
+		"""
+		Rejects a request, counting it in the metrics.
+
+		:param message: reason of the rejection
+		:param status_code: HTTP status code
+		:return: None
+		:raise RequestRejected: always
+		"""
+		# the lock of the condition is reentrant, so this can be called while holding it
+		with self._condition:
+			self._rejected[status_code] += 1
+
+		logging.warning("Request rejected with {}: {}".format(status_code, message))
+		raise RequestRejected(message, status_code, self._retry_after if status_code != 413 else None)
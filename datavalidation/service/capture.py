@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+capture
+----------------------------------
+
+Module with the request capture of the service layer. It records a sample of the incoming requests to a rotating
+gzip-compressed NDJSON file, so production traffic can be replayed later (see benchmarks.replay).
+
+Each line of the capture is a JSON object with the time the request was received and its content::
+
+	{"time": 1561234567.123, "request": {"geometries": [ ... ]}}
+
+Each process writes to its own subfolder (named after its pid), so several server workers can capture requests to
+the same folder. read_capture() merges them back in the order they were received. Each process also samples with its
+own random generator, so workers forked from a preloaded app do not sample the same requests.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import gzip
+import json
+import time
+import heapq
+import random
+import logging
+import threading
+
+
+# name of the file being written, rotated files get a number before the extension (e.g. capture.1.ndjson.gz)
+CAPTURE_FILENAME = "capture.ndjson.gz"
+
+
+class RequestCapture:
+	"""
+	A RequestCapture records a random sample of requests. When the current file reaches `max_bytes` (of uncompressed
+	data), it is rotated and the oldest file is deleted once there are more than `backup_count` rotated files.
+
+	Example usage::
+
+		>> capture = RequestCapture("capture", sample_rate=0.01)
+		>> capture.sample(request_content)
+		>> capture.close()
+
+	:param directory: folder where the capture files are written (in a subfolder per process), it is created if it
+		does not exist
+	:param sample_rate: probability of recording each request (0 to 1), default is 0.01
+	:param max_bytes: uncompressed size after which the file is rotated, default is 10 MB
+	:param backup_count: maximum number of rotated files kept, default is 5
+	:param seed: seed of the random sampling, combined with the pid of each process so forked workers do not sample
+		the same requests, default is None
+	"""
+
+	def __init__(self, directory: str, sample_rate: float = 0.01, max_bytes: int = 10485760, backup_count: int = 5,
+			seed: int = None):
+		self._directory = directory
+		self._sample_rate = sample_rate
+		self._max_bytes = max_bytes
+		self._backup_count = backup_count
+		self._seed = seed
+		# created in the process that samples, after the server workers have been forked
+		self._random = None
+		self._random_pid = None
+
+		self._file = None
+		self._file_directory = None
+		self._written_bytes = 0
+		self._lock = threading.Lock()
+
+		self.captured = 0
+
+	def sample(self, request_content: dict) -> bool:
+		"""
+		Records a request with a probability of `sample_rate`. The request is serialised straight away, so it can be
+		modified after calling this function (e.g. when validating it).
+
+		Errors writing the file are logged, they never reach the caller.
+
+		:param request_content: content of the request as a dict
+		:return: bool, True if the request was recorded
+		"""
+		if self._sample_rate <= 0 or self._get_random().random() >= self._sample_rate:
+			return False
+
+		try:
+			line = (json.dumps({"time": time.time(), "request": request_content}) + "\n").encode("utf-8")
+
+			with self._lock:
+				if self._file is not None and self._written_bytes + len(line) > self._max_bytes:
+					self._rotate()
+
+				if self._file is None:
+					# the subfolder is chosen when the file is opened, after the server workers have been forked
+					self._file_directory = os.path.join(self._directory, str(os.getpid()))
+					os.makedirs(self._file_directory, exist_ok=True)
+					self._file = gzip.open(get_capture_path(self._file_directory), "ab")
+					self._written_bytes = 0
+
+				self._file.write(line)
+				# flush the compressed stream so the file can be read while it is being written
+				self._file.flush()
+				self._written_bytes += len(line)
+				self.captured += 1
+
+		except Exception as e:
+			logging.error("Request could not be captured: {}".format(e))
+			return False
+
+		return True
+
+	def close(self):
+		"""
+		Closes the current capture file.
+
+		:return: None
+		"""
+		with self._lock:
+			if self._file is not None:
+				self._file.close()
+				self._file = None
+
+	def _get_random(self) -> random.Random:
+		"""
+		Gets the random generator of the sampling of this process, creating it if the process has not sampled yet.
+
+		:return: random.Random
+		"""
+		pid = os.getpid()
+
+		if self._random_pid != pid:
+			# with no seed, it is seeded from the OS in each process
+			self._random = random.Random("{}:{}".format(self._seed, pid) if self._seed is not None else None)
+			self._random_pid = pid
+
+		return self._random
+
+	def _rotate(self):
+		"""
+		Rotates the capture files: capture.ndjson.gz becomes capture.1.ndjson.gz, capture.1 becomes capture.2 and so
+		on. Must be called holding the lock.
+
+		:return: None
+		"""
+		self._file.close()
+		self._file = None
+
+		# the oldest file is overwritten by the next one
+		for i in range(self._backup_count, 0, -1):
+			source = get_capture_path(self._file_directory, i - 1)
+			if os.path.exists(source):
+				os.replace(source, get_capture_path(self._file_directory, i))
+
+		if self._backup_count == 0:
+			os.remove(get_capture_path(self._file_directory))
+
+
+def get_capture_path(directory: str, index: int = 0) -> str:
+	"""
+	Gets the path of a capture file.
+
+	:param directory: folder of the capture files
+	:param index: 0 for the file being written, 1 or higher for the rotated files (higher is older), default is 0
+	:return: path
+	"""
+	if index == 0:
+		return os.path.join(directory, CAPTURE_FILENAME)
+
+	name, extension = CAPTURE_FILENAME.split(".", 1)
+	return os.path.join(directory, "{}.{}.{}".format(name, index, extension))
+
+
+def read_capture(path: str):
+	"""
+	Generator of the requests recorded in a capture file or folder. The capture files of a folder and its subfolders
+	(one per process, see RequestCapture) are merged in the order the requests were received.
+
+	Truncated lines (e.g. from a file still being written) are skipped.
+
+	:param path: capture file or folder of capture files
+	:return: generator of request dicts
+	"""
+	if os.path.isdir(path):
+		folder_list = [path] + [os.path.join(path, name) for name in sorted(os.listdir(path))
+			if os.path.isdir(os.path.join(path, name))]
+		record_iterators = [_read_capture_folder(folder) for folder in folder_list]
+	else:
+		record_iterators = [_read_capture_file(path)]
+
+	for record in heapq.merge(*record_iterators, key=lambda r: r.get('time', 0)):
+		yield record['request']
+
+
+def _read_capture_folder(directory: str):
+	"""
+	Helper function of read_capture() that reads the capture files of a folder, from the oldest rotated file to the
+	current one.
+
+	:param directory: folder of the capture files
+	:return: generator of record dicts
+	"""
+	index = 0
+	while os.path.exists(get_capture_path(directory, index + 1)):
+		index += 1
+
+	for i in range(index, -1, -1):
+		if os.path.exists(get_capture_path(directory, i)):
+			yield from _read_capture_file(get_capture_path(directory, i))
+
+
+def _read_capture_file(filepath: str):
+	"""
+	Helper function of read_capture() that reads a capture file.
+
+	:param filepath: path of the capture file, compressed if it ends with .gz
+	:return: generator of record dicts
+	"""
+	opener = gzip.open if filepath.endswith(".gz") else open
+
+	with opener(filepath, "rt", encoding="utf-8") as capture_file:
+		try:
+			for line in capture_file:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					logging.warning("Skipping a malformed line of the capture file '{}'".format(filepath))
+					continue
+
+				if "request" in record:
+					yield record
+
+		except EOFError:
+			# the compressed stream ended abruptly, keep what was read
+			logging.warning("Capture file '{}' is truncated".format(filepath))
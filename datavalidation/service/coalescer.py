@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+coalescer
+----------------------------------
+
+Module with the request coalescer of the service layer. It collects the geometries of concurrent requests for a short
+window of time and validates them in batches, giving each caller back its own geometries.
+
+The geometries of a batch are validated with a single call of the handler, so the registry is held once and the
+overhead of each call (logging, tracing and holding the registry) is shared by all the requests of the batch, which
+all use the same version of the registry. All the batches are validated in a single thread, so the BikeGeometries of
+different requests are never validated at the same time. It is disabled by default.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import time
+import queue
+import logging
+import threading
+
+from datavalidation import datavalidation
+from datavalidation.validation import registry
+
+
+class RequestCoalescer:
+	"""
+	A RequestCoalescer collects the bike geometries submitted by concurrent callers and validates them in batches.
+
+	A batch is validated when `window` seconds have passed since its first request arrived or when it has
+	`max_batch_size` geometries, whatever happens first. Therefore, the latency added to a request is bounded by the
+	window plus the time to validate the rest of its batch. The geometries of the batch are validated together and each
+	caller gets back its own slice. If the batch fails, each of its requests is validated again separately, so a
+	failing request does not affect the others.
+
+	Example usage::
+
+		>> coalescer = RequestCoalescer(window=0.002, max_batch_size=32)
+		>> coalescer.start()
+		# from any thread
+		>> coalescer.request_validate_bike_geometry(request_content)
+		{ "geometries": [ ... ] }
+
+	:param window: maximum time in seconds to wait for more requests before validating a batch, default is 0.002
+	:param max_batch_size: maximum number of geometries in a batch, default is 32
+	:param handler: function that validates a list of geometries, default is datavalidation.validate_bike_geometry_list
+	:param timeout: maximum time in seconds that a caller waits for its result, default is 30
+	"""
+
+	def __init__(self, window: float = 0.002, max_batch_size: int = 32, handler=None, timeout: float = 30):
+		self._window = window
+		self._max_batch_size = max_batch_size
+		self._timeout = timeout
+		self._handler = handler if handler is not None else datavalidation.validate_bike_geometry_list
+
+		self._queue = queue.Queue()
+		self._thread = None
+		self._running = False
+		self._lock = threading.Lock()
+
+		# statistics of the batches validated
+		self.batch_count = 0
+		self.geometry_count = 0
+
+	def start(self):
+		"""
+		Starts the thread that validates the batches. It does nothing if it is already running, so it is safe to call
+		it before every request.
+
+		:return: None
+		"""
+		if self._running:
+			return
+
+		with self._lock:
+			if not self._running:
+				self._running = True
+				self._thread = threading.Thread(target=self._run, name="RequestCoalescer", daemon=True)
+				self._thread.start()
+
+	def stop(self):
+		"""
+		Stops the thread that validates the batches after validating the requests already submitted.
+
+		:return: None
+		"""
+		with self._lock:
+			if not self._running:
+				return
+
+			self._running = False
+
+		# wake up the thread in case it is waiting for requests
+		self._queue.put(None)
+		self._thread.join()
+
+	def submit(self, bike_geometry_list: list) -> list:
+		"""
+		Submits a list of bike geometries to be validated in the next batch and waits for the result.
+
+		:param bike_geometry_list: list of bike geometry dicts
+		:return: list of bike geometry dicts validated
+		:raise RuntimeError: raised if the RequestCoalescer is not running or it stopped before validating them
+		:raise TimeoutError: raised if the geometries are not validated within the timeout
+		:raise Exception: raises whatever the handler raised when validating these geometries
+		"""
+		return self._submit(bike_geometry_list).result
+
+	def request_validate_bike_geometry(self, request_content: dict) -> dict:
+		"""
+		Coalesced version of datavalidation.request_validate_bike_geometry().
+
+		:param request_content: content of the request as a dict
+		:return: request response as a dict, with the version of the registry used to validate it ("registry_version")
+		"""
+		logging.info("Received coalesced validate_bike_geometry request")
+
+		pending = self._submit(request_content['geometries'])
+		request_content['geometries'] = pending.result
+		request_content['registry_version'] = pending.registry_version
+
+		return request_content
+
+	def _submit(self, bike_geometry_list: list):
+		"""
+		Submits a list of bike geometries to be validated in the next batch and waits for the result. See submit().
+
+		:param bike_geometry_list: list of bike geometry dicts
+		:return: _PendingRequest validated
+		"""
+		pending = _PendingRequest(bike_geometry_list)
+
+		# stop() cannot happen between the check and the put, so the thread always gets the request
+		with self._lock:
+			if not self._running:
+				raise RuntimeError("RequestCoalescer is not running, call start() first")
+
+			self._queue.put(pending)
+
+		if not pending.done.wait(self._timeout):
+			# the thread skips it if it has not validated it yet
+			pending.cancelled = True
+			raise TimeoutError("RequestCoalescer did not validate the request within {} seconds".format(self._timeout))
+
+		if pending.error is not None:
+			raise pending.error
+
+		return pending
+
+	def _run(self):
+		"""
+		Main loop of the thread that validates the batches.
+
+		:return: None
+		"""
+		while self._running or not self._queue.empty():
+			first = self._queue.get()
+			if first is None:
+				continue
+
+			batch = [first]
+			batch_size = len(first.geometries)
+			deadline = time.perf_counter() + self._window
+
+			# collect more requests until the window closes or the batch is full
+			while batch_size < self._max_batch_size:
+				remaining = deadline - time.perf_counter()
+				if remaining <= 0:
+					break
+
+				try:
+					pending = self._queue.get(timeout=remaining)
+				except queue.Empty:
+					break
+
+				if pending is None:
+					break
+
+				batch.append(pending)
+				batch_size += len(pending.geometries)
+
+			self._validate_batch(batch)
+
+		# nothing should be left, but no caller must wait forever
+		while not self._queue.empty():
+			pending = self._queue.get()
+			if pending is not None:
+				pending.error = RuntimeError("RequestCoalescer stopped before validating the request")
+				pending.done.set()
+
+	def _validate_batch(self, batch: list):
+		"""
+		Validates a batch of requests with a single call of the handler, giving each request its slice of the result.
+		If the batch fails, each request is validated separately so only the failing ones get the error.
+
+		:param batch: list of _PendingRequest
+		:return: None
+		"""
+		batch = [pending for pending in batch if not pending.cancelled]
+		geometry_list = [geometry for pending in batch for geometry in pending.geometries]
+		logging.debug("RequestCoalescer validating {} geometries from {} requests".format(len(geometry_list), len(batch)))
+
+		self.batch_count += 1
+		self.geometry_count += len(geometry_list)
+
+		# the registry is held for the whole batch, so all its requests use the same version
+		with registry.using_registry() as registry_version:
+			for pending in batch:
+				pending.registry_version = registry_version
+
+			try:
+				result_list = self._handler(geometry_list)
+
+			except Exception as e:
+				logging.warning("RequestCoalescer batch failed, validating its requests separately: {}".format(e))
+				self._validate_requests(batch)
+				return
+
+		start = 0
+		for pending in batch:
+			end = start + len(pending.geometries)
+			pending.result = result_list[start:end]
+			start = end
+			pending.done.set()
+
+	def _validate_requests(self, batch: list):
+		"""
+		Validates each request of a batch separately.
+
+		:param batch: list of _PendingRequest
+		:return: None
+		"""
+		for pending in batch:
+			try:
+				pending.result = self._handler(pending.geometries)
+			except Exception as e:
+				logging.warning("RequestCoalescer request failed: {}".format(e))
+				pending.error = e
+
+			pending.done.set()
+
+
+class _PendingRequest:
+	"""
+	Helper class that holds a request submitted to the RequestCoalescer until its result is ready.
+
+	:param geometries: list of bike geometry dicts
+	"""
+
+	def __init__(self, geometries: list):
+		self.geometries = geometries
+		self.result = None
+		self.registry_version = None
+		self.error = None
+		self.cancelled = False
+		self.done = threading.Event()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+lanes
+----------------------------------
+
+Module with the priority runner of the service layer. It validates the geometries of different priority classes
+(e.g. interactive form validation and bulk crawls) in separate lanes, so bulk jobs do not starve interactive requests.
+
+Jobs are split into geometries and the workers pick the next geometry from the lanes by weight, so a large bulk job is
+preempted between geometries as soon as interactive work arrives. All the geometries of a job are validated with the
+registry in use when it was submitted (see the registry module), whichever worker validates them.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import logging
+import threading
+import collections
+
+from datavalidation import datavalidation
+from datavalidation.validation import registry
+
+
+# priority classes available, from highest to lowest priority
+PRIORITY_CLASSES = ["interactive", "bulk"]
+
+# share of the shared workers that each priority class gets when all of them have work waiting
+DEFAULT_WEIGHTS = {
+	"interactive": 4,
+	"bulk": 1
+}
+
+
+class PriorityRunner:
+	"""
+	A PriorityRunner validates lists of bike geometries with a pool of worker threads, giving each priority class a
+	weighted share of the workers. Some workers can also be dedicated to a priority class, so it always has workers
+	available regardless of the load of the others.
+
+	Example usage::
+
+		>> runner = PriorityRunner(workers=4, dedicated={"interactive": 1})
+		>> runner.start()
+		# from any thread
+		>> runner.submit(bike_geometry_list, priority="bulk")
+		[ ... ]
+
+	:param workers: number of shared worker threads, default is 2
+	:param weights: dict with the weight (a positive number) of each priority class, default is DEFAULT_WEIGHTS
+	:param dedicated: dict with the number of additional workers dedicated to each priority class, default is None
+	:param handler: function that validates one geometry, default is datavalidation.validate_bike_geometry
+	"""
+
+	def __init__(self, workers: int = 2, weights: dict = None, dedicated: dict = None, handler=None):
+		self._workers = workers
+		self._weights = weights if weights is not None else DEFAULT_WEIGHTS
+		self._dedicated = dedicated if dedicated is not None else {}
+		self._handler = handler if handler is not None else datavalidation.validate_bike_geometry
+
+		self._lanes = {priority: collections.deque() for priority in PRIORITY_CLASSES}
+		# geometries served by each lane, used to keep the share of each lane close to its weight
+		self._served = {priority: 0 for priority in PRIORITY_CLASSES}
+
+		self._condition = threading.Condition()
+		self._threads = []
+		self._running = False
+
+	def start(self):
+		"""
+		Starts the worker threads. It does nothing if they are already running.
+
+		:return: None
+		"""
+		with self._condition:
+			if self._running:
+				return
+
+			self._running = True
+			self._threads = [threading.Thread(target=self._run, args=(None, ), name="PriorityRunner-shared", daemon=True)
+				for _ in range(self._workers)]
+
+			for priority, count in self._dedicated.items():
+				self._threads.extend([threading.Thread(target=self._run, args=(priority, ),
+					name="PriorityRunner-" + priority, daemon=True) for _ in range(count)])
+
+		for thread in self._threads:
+			thread.start()
+
+	def stop(self):
+		"""
+		Stops the worker threads after validating the geometries already submitted.
+
+		:return: None
+		"""
+		with self._condition:
+			if not self._running:
+				return
+
+			self._running = False
+			self._condition.notify_all()
+
+		for thread in self._threads:
+			thread.join()
+
+	def submit(self, bike_geometry_list: list, priority: str = "interactive") -> list:
+		"""
+		Submits a list of bike geometries to a lane and waits for the result.
+
+		:param bike_geometry_list: list of bike geometry dicts
+		:param priority: priority class of the geometries, one of PRIORITY_CLASSES (default is "interactive")
+		:return: list of bike geometry dicts validated, all with the same version of the registry
+		:raise ValueError: raised if the priority class is not recognised
+		:raise Exception: raises the first exception raised by the handler when validating these geometries
+		"""
+		if priority not in self._lanes:
+			raise ValueError("Priority class not recognised: '{}', it must be one of {}".format(priority, PRIORITY_CLASSES))
+
+		if not self._running:
+			raise RuntimeError("PriorityRunner is not running, call start() first")
+
+		if len(bike_geometry_list) == 0:
+			return []
+
+		job = _Job(bike_geometry_list, registry.get_registry())
+
+		with self._condition:
+			self._lanes[priority].extend((job, i) for i in range(len(bike_geometry_list)))
+			self._condition.notify_all()
+
+		job.done.wait()
+
+		if job.error is not None:
+			raise job.error
+
+		return job.results
+
+	def request_validate_bike_geometry(self, request_content: dict, priority: str = "interactive") -> dict:
+		"""
+		Prioritised version of datavalidation.request_validate_bike_geometry().
+
+		:param request_content: content of the request as a dict
+		:param priority: priority class of the request, default is "interactive"
+		:return: request response as a dict, with the version of the registry used to validate it ("registry_version")
+		"""
+		logging.info("Received {} validate_bike_geometry request".format(priority))
+
+		# the job gets the registry held here, so all its geometries use the same version
+		with registry.using_registry() as registry_version:
+			request_content['geometries'] = self.submit(request_content['geometries'], priority)
+
+		request_content['registry_version'] = registry_version
+
+		return request_content
+
+	def get_queue_lengths(self) -> dict:
+		"""
+		Gets the number of geometries waiting in each lane.
+
+		:return: dict with the number of geometries waiting for each priority class
+		"""
+		with self._condition:
+			return {priority: len(lane) for priority, lane in self._lanes.items()}
+
+	def _next_task(self, priority: str = None):
+		"""
+		Gets the next geometry to validate, waiting until there is one. Must be called holding the lock.
+
+		:param priority: priority class of a dedicated worker, None for shared workers
+		:return: tuple (job, index) or None if the runner stopped
+		"""
+		while True:
+			if priority is not None:
+				candidates = [priority] if len(self._lanes[priority]) > 0 else []
+			else:
+				candidates = [lane for lane in PRIORITY_CLASSES if len(self._lanes[lane]) > 0]
+
+			if len(candidates) > 0:
+				# pick the lane that has received the lowest share of the workers for its weight
+				lane = min(candidates, key=lambda l: self._served[l] / self._weights.get(l, 1))
+				self._served[lane] += 1
+				return self._lanes[lane].popleft()
+
+			if not self._running:
+				return None
+
+			self._condition.wait()
+
+	def _run(self, priority: str = None):
+		"""
+		Main loop of the worker threads.
+
+		:param priority: priority class of a dedicated worker, None for shared workers
+		:return: None
+		"""
+		while True:
+			with self._condition:
+				task = self._next_task(priority)
+
+				if task is None:
+					return
+
+				# reset the shares when all lanes are empty, so old traffic does not count against a lane
+				if all(len(lane) == 0 for lane in self._lanes.values()):
+					self._served = {lane: 0 for lane in PRIORITY_CLASSES}
+
+			job, index = task
+			job.run(index, self._handler)
+
+
+class _Job:
+	"""
+	Helper class that holds a list of geometries submitted to the PriorityRunner until all of them are validated.
+
+	:param geometries: list of bike geometry dicts
+	:param job_registry: registry to validate them with (see registry.get_registry())
+	"""
+
+	def __init__(self, geometries: list, job_registry: dict):
+		self.geometries = geometries
+		self.registry = job_registry
+		self.results = [None] * len(geometries)
+		self.error = None
+		self.done = threading.Event()
+
+		self._pending = len(geometries)
+		self._lock = threading.Lock()
+
+	def run(self, index: int, handler):
+		"""
+		Validates one geometry of the job, setting the job as done after the last one.
+
+		:param index: index of the geometry in the job
+		:param handler: function that validates one geometry
+		:return: None
+		"""
+		try:
+			if self.error is None:
+				with registry.using_registry(self.registry):
+					self.results[index] = handler(self.geometries[index])
+		except Exception as e:
+			self.error = e
+
+		with self._lock:
+			self._pending -= 1
+			if self._pending == 0:
+				self.done.set()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+cache
+----------------------------------
+
+Module that keeps the global cache of sympy bounded in long-running processes. Each sympy solve with new numeric
+values adds entries to the cache, so a worker validating geometries for days keeps growing until it is killed.
+
+The cache is cleared after a number of validations, when it has too many entries or when the process uses too much
+memory (RSS), as set in the `validation.sympy_cache` section of the config file or with set_cache_policy()::
+
+	"sympy_cache": {
+		"clear_every": 10000,
+		"max_entries": 50000,
+		"max_rss_bytes": null,
+		"check_every": 100
+	}
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import sys
+import logging
+import threading
+
+from sympy.core.cache import CACHE, clear_cache
+
+from datavalidation.core import metrics
+from datavalidation.core.config import read_config_file
+
+
+# default policy, None disables a limit
+DEFAULT_POLICY = {
+	# clear the cache after this number of validations
+	"clear_every": 10000,
+	# clear the cache when it has more entries than this
+	"max_entries": 50000,
+	# clear the cache when the process uses more memory than this
+	"max_rss_bytes": None,
+	# validations between the checks of max_entries and max_rss_bytes
+	"check_every": 100
+}
+
+SYMPY_CACHE_ENTRIES = metrics.get_gauge("datavalidation_sympy_cache_entries", "Entries in the global cache of sympy")
+SYMPY_CACHE_CLEARS = metrics.get_counter("datavalidation_sympy_cache_clears_total",
+	"Times the global cache of sympy was cleared", ["reason"])
+PROCESS_RSS = metrics.get_gauge("datavalidation_process_rss_bytes", "Resident set size of the process")
+
+_policy = dict(DEFAULT_POLICY, **read_config_file().get("validation", {}).get("sympy_cache", {}))
+_validation_count = 0
+_lock = threading.Lock()
+# whether it was logged that max_rss_bytes is ignored, as the current RSS cannot be measured
+_rss_unavailable_logged = False
+
+
+def set_cache_policy(clear_every: int = None, max_entries: int = None, max_rss_bytes: int = None,
+		check_every: int = 100):
+	"""
+	Sets when the global cache of sympy is cleared. Limits set to None are disabled.
+
+	:param clear_every: clear the cache after this number of validations, default is None
+	:param max_entries: clear the cache when it has more entries than this, default is None
+	:param max_rss_bytes: clear the cache when the process uses more memory than this, default is None (ignored where
+		the current RSS cannot be measured, see get_current_rss())
+	:param check_every: validations between the checks of max_entries and max_rss_bytes, default is 100
+	:return: None
+	"""
+	global _policy
+
+	_policy = {
+		"clear_every": clear_every,
+		"max_entries": max_entries,
+		"max_rss_bytes": max_rss_bytes,
+		"check_every": check_every
+	}
+
+
+def get_cache_policy() -> dict:
+	"""
+	Gets the policy of the global cache of sympy.
+
+	:return: dict, see DEFAULT_POLICY
+	"""
+	return dict(_policy)
+
+
+def record_validation():
+	"""
+	Records that a BikeGeometry was validated, clearing the global cache of sympy if the policy says so.
+	It is called at the end of validate_bike_geometry().
+
+	:return: None
+	"""
+	global _validation_count
+
+	with _lock:
+		_validation_count += 1
+		count = _validation_count
+
+	reason = None
+	clear_every = _policy.get("clear_every")
+	check_every = _policy.get("check_every") or 1
+
+	if clear_every and count % clear_every == 0:
+		reason = "validations"
+
+	elif count % check_every == 0:
+		entries = get_sympy_cache_size()
+		SYMPY_CACHE_ENTRIES.set(entries)
+
+		if _policy.get("max_entries") is not None and entries > _policy['max_entries']:
+			reason = "entries"
+
+		elif _policy.get("max_rss_bytes") is not None:
+			# the peak RSS never goes down, so comparing it would clear the cache at every check once it is crossed
+			rss = get_current_rss()
+
+			if rss is None:
+				_log_rss_unavailable()
+
+			else:
+				PROCESS_RSS.set(rss)
+
+				if rss > _policy['max_rss_bytes']:
+					reason = "rss"
+
+	if reason is not None:
+		clear_sympy_cache(reason)
+
+
+def clear_sympy_cache(reason: str = "manual"):
+	"""
+	Clears the global cache of sympy.
+
+	:param reason: reason of the clear, used as label of the metrics, default is "manual"
+	:return: None
+	"""
+	entries = get_sympy_cache_size()
+	clear_cache()
+
+	SYMPY_CACHE_CLEARS.inc(labels=(reason, ))
+	SYMPY_CACHE_ENTRIES.set(0)
+	logging.info("Sympy cache cleared ({} entries, reason: {})".format(entries, reason))
+
+
+def get_sympy_cache_size() -> int:
+	"""
+	Gets the number of entries in the global cache of sympy.
+
+	:return: number of entries
+	"""
+	return sum(function.cache_info().currsize for function in CACHE if hasattr(function, "cache_info"))
+
+
+def get_current_rss() -> int:
+	"""
+	Gets the current resident set size of the process, read from /proc (Linux).
+
+	:return: bytes or None if it cannot be measured
+	"""
+	try:
+		with open("/proc/self/statm") as statm:
+			return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError, IndexError, AttributeError):
+		return None
+
+
+def get_rss() -> int:
+	"""
+	Gets the resident set size of the process. It is the current one from /proc (Linux), elsewhere it is the peak from
+	resource.
+
+	:return: bytes or None if it cannot be measured
+	"""
+	rss = get_current_rss()
+
+	if rss is not None:
+		return rss
+
+	try:
+		import resource
+		# ru_maxrss is in bytes in macOS and in kilobytes elsewhere
+		maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return maxrss if sys.platform == "darwin" else maxrss * 1024
+	except (ImportError, OSError):
+		return None
+
+
+def _log_rss_unavailable():
+	"""
+	Logs once that max_rss_bytes is ignored because the current RSS cannot be measured.
+
+	:return: None
+	"""
+	global _rss_unavailable_logged
+
+	if not _rss_unavailable_logged:
+		_rss_unavailable_logged = True
+		logging.warning("The current RSS cannot be measured on this platform, max_rss_bytes of the sympy cache is ignored")
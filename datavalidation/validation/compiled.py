@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+compiled
+----------------------------------
+
+Module containing the compiled formulae: the equations of VALIDATION_FORMULAE solved symbolically for each of their
+parameters and converted to plain Python code, so a parameter can be calculated by evaluating a few float operations
+instead of calling the sympy solver with every new set of values.
+
+Solving the formulae symbolically is slow (and it never finishes for some parameters), so it is done offline and
+saved in a snapshot (see the snapshot module). Parameters without a compiled solution fall back to the sympy solver.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import math
+import types
+import queue
+import logging
+import itertools
+import multiprocessing
+
+import sympy
+import sympy.solvers
+
+from . import state
+from .formulae import VALIDATION_FORMULAE, SUBS_DICT
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# compiled solutions in use, keyed by (equation string, parameter name), each one a list of Python sources
+state.set_defaults(compiled_solutions={})
+
+# cache of the functions built from the compiled solutions, keyed like the compiled solutions
+_SOLUTION_FUNCTIONS = {}
+# cache of the functions built from the compiled solutions that take NumPy arrays, keyed like the compiled solutions
+_VECTORISED_SOLUTION_FUNCTIONS = {}
+# cache of the residual functions of the formulae, keyed by equation string
+_RESIDUAL_FUNCTIONS = {}
+# cache of the residual functions of the formulae that take NumPy arrays, keyed by equation string
+_VECTORISED_RESIDUAL_FUNCTIONS = {}
+
+# the functions of the math module that the compiled solutions use, with their element-wise NumPy equivalents
+NUMPY_MATH = types.SimpleNamespace(
+	pi=numpy.pi, e=numpy.e, sqrt=numpy.sqrt, exp=numpy.exp, log=numpy.log, sin=numpy.sin, cos=numpy.cos,
+	tan=numpy.tan, asin=numpy.arcsin, acos=numpy.arccos, atan=numpy.arctan, atan2=numpy.arctan2, hypot=numpy.hypot
+) if numpy is not None else None
+
+
+def get_formula_expression(formula: dict):
+	"""
+	Gets the sympy expression of a formula where each GeometryParameter is a positive sympy symbol with its name.
+
+	:param formula: a formula dict with an equation
+	:return: sympy expression
+	"""
+	equation = formula['equation']
+
+	for key, val in SUBS_DICT.items():
+		equation = equation.replace(key, val)
+
+	symbols = {param: sympy.Symbol(param, positive=True) for param in formula['parameters']}
+
+	for param in formula['parameters']:
+		equation = equation.replace("{" + param + "}", param)
+
+	return eval(equation, {"sympy": sympy}, symbols)
+
+
+def get_residual_function(formula: dict):
+	"""
+	Gets the residual function of a formula: a plain Python function that takes the values of all the parameters of
+	the formula (as keyword arguments or in the order of formula['parameters']) and returns the value of the
+	equation, which is 0 when the values are consistent. It is cached, as building it requires sympy.
+
+	:param formula: a formula dict with an equation
+	:return: function
+	"""
+	try:
+		return _RESIDUAL_FUNCTIONS[formula['equation']]
+
+	except KeyError:
+		symbols = [sympy.Symbol(param, positive=True) for param in formula['parameters']]
+		function = sympy.lambdify(symbols, get_formula_expression(formula), "math")
+		_RESIDUAL_FUNCTIONS[formula['equation']] = function
+		return function
+
+
+def get_vectorised_residual_function(formula: dict):
+	"""
+	Gets the residual function of a formula that evaluates NumPy arrays element-wise (see get_residual_function()), so
+	a formula can be evaluated for many values at once. It requires NumPy, which is optional.
+
+	:param formula: a formula dict with an equation
+	:return: function
+	:raise ImportError: raised if NumPy is not installed
+	"""
+	try:
+		return _VECTORISED_RESIDUAL_FUNCTIONS[formula['equation']]
+
+	except KeyError:
+		symbols = [sympy.Symbol(param, positive=True) for param in formula['parameters']]
+		function = sympy.lambdify(symbols, get_formula_expression(formula), "numpy")
+		_VECTORISED_RESIDUAL_FUNCTIONS[formula['equation']] = function
+		return function
+
+
+def presolve_formula(formula: dict, parameter_name: str) -> list:
+	"""
+	Solves a formula symbolically for one of its parameters and returns the solutions as Python sources that only
+	use the math module. Note that this can take a long time (or never finish) for some parameters.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter to solve the formula for
+	:return: list of Python expression sources (str), [] if sympy could not solve it
+	"""
+	expression = get_formula_expression(formula)
+
+	try:
+		solutions = sympy.solvers.solve(expression, sympy.Symbol(parameter_name, positive=True))
+	except Exception as e:
+		logging.error("There was an error presolving the equation for '{}': \n{}\n{}".format(
+			parameter_name, formula['equation'], e))
+		return []
+
+	return [sympy.pycode(solution, fully_qualified_modules=True) for solution in solutions]
+
+
+def presolve_formulae(timeout: float = 60, formula_list: list = None) -> dict:
+	"""
+	Solves symbolically all the formulae for each of their parameters. Each one is solved in a separate process
+	so it can be abandoned if it takes longer than the timeout given.
+
+	:param timeout: maximum time in seconds to solve each formula for each parameter, default is 60
+	:param formula_list: list of formulae to solve, default is VALIDATION_FORMULAE
+	:return: dict with the compiled solutions keyed by (equation string, parameter name)
+	"""
+	formula_list = formula_list if formula_list is not None else VALIDATION_FORMULAE
+	result = {}
+
+	for formula in formula_list:
+		for parameter_name in formula['parameters']:
+			result_queue = multiprocessing.Queue()
+			process = multiprocessing.Process(target=_presolve_worker, args=(formula, parameter_name, result_queue))
+			process.start()
+
+			try:
+				# get the result before joining, the process does not finish until its result is read
+				solutions = result_queue.get(timeout=timeout)
+			except queue.Empty:
+				logging.warning("Presolving the equation for '{}' took longer than {}s, skipping it: {}".format(
+					parameter_name, timeout, formula['equation']))
+				solutions = []
+				process.terminate()
+
+			process.join()
+
+			if len(solutions) > 0:
+				result[(formula['equation'], parameter_name)] = solutions
+
+	return result
+
+
+def set_compiled_solutions(compiled_solutions: dict):
+	"""
+	Sets the compiled solutions used by solve_compiled(), replacing the current ones.
+
+	:param compiled_solutions: dict with lists of Python sources keyed by (equation string, parameter name)
+	:return: None
+	"""
+	_SOLUTION_FUNCTIONS.clear()
+	_VECTORISED_SOLUTION_FUNCTIONS.clear()
+	state.update_state(compiled_solutions=dict(compiled_solutions))
+
+
+def get_compiled_solutions() -> dict:
+	"""
+	Gets the compiled solutions currently in use.
+
+	:return: dict with lists of Python sources keyed by (equation string, parameter name)
+	"""
+	return state.get_state()['compiled_solutions']
+
+
+def has_compiled_solution(formula: dict, parameter_name: str) -> bool:
+	"""
+	Checks if a formula has a compiled solution for a parameter.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter
+	:return: bool, True if it can be solved with solve_compiled()
+	"""
+	return (formula['equation'], parameter_name) in state.get_state()['compiled_solutions']
+
+
+def solve_compiled(formula: dict, parameter_name: str, values: dict) -> list:
+	"""
+	Solves a formula for a parameter using its compiled solutions. Only the real and positive solutions are returned,
+	like the sympy solver does with a positive symbol. If any of the values is a range, the formula is solved for
+	every combination of their values (see solve_ranges()).
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter to solve the formula for
+	:param values: dict with the float values (or lists of floats for ranges) of the rest of the parameters
+	:return: list of float solutions, [] if none
+	"""
+	key = (formula['equation'], parameter_name)
+	source_list = state.get_state()['compiled_solutions'][key]
+
+	if any(isinstance(value, list) for value in values.values()):
+		return solve_ranges(formula, parameter_name, source_list, values)
+
+	if key not in _SOLUTION_FUNCTIONS:
+		_SOLUTION_FUNCTIONS[key] = build_solution_functions(formula, parameter_name, source_list)
+
+	return evaluate_solutions(_SOLUTION_FUNCTIONS[key], values)
+
+
+def solve_ranges(formula: dict, parameter_name: str, source_list: list, values: dict) -> list:
+	"""
+	Solves a formula for a parameter with its compiled solutions for every combination of the values of the ranges
+	(the Cartesian product of their values). With NumPy, each solution is evaluated for all the combinations at once.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter to solve the formula for
+	:param source_list: list of Python sources of the solutions
+	:param values: dict with the float values (or lists of floats for ranges) of the rest of the parameters
+	:return: list of the real and positive float solutions of all the combinations, [] if none
+	"""
+	key = (formula['equation'], parameter_name)
+	member_lists = {param: value if isinstance(value, list) else [value] for param, value in values.items()}
+
+	if numpy is not None:
+		if key not in _VECTORISED_SOLUTION_FUNCTIONS:
+			_VECTORISED_SOLUTION_FUNCTIONS[key] = build_solution_functions(formula, parameter_name, source_list,
+				NUMPY_MATH)
+
+		grids = numpy.meshgrid(*[numpy.array(member_list, dtype=float) for member_list in member_lists.values()],
+			indexing="ij")
+		arguments = {param: grid.ravel() for param, grid in zip(member_lists.keys(), grids)}
+
+		try:
+			return _evaluate_vectorised_solutions(_VECTORISED_SOLUTION_FUNCTIONS[key], arguments)
+		except (AttributeError, TypeError) as e:
+			# a function of the math module without a NumPy equivalent in NUMPY_MATH
+			logging.debug("The solutions for '{}' cannot be vectorised: {}".format(parameter_name, e))
+
+	if key not in _SOLUTION_FUNCTIONS:
+		_SOLUTION_FUNCTIONS[key] = build_solution_functions(formula, parameter_name, source_list)
+
+	results = []
+	for combination in itertools.product(*member_lists.values()):
+		results.extend(evaluate_solutions(_SOLUTION_FUNCTIONS[key], dict(zip(member_lists.keys(), combination))))
+
+	return results
+
+
+def build_solution_functions(formula: dict, parameter_name: str, source_list: list, math_module=math) -> list:
+	"""
+	Builds the functions of the compiled solutions of a formula for a parameter. Each function takes the values of the
+	rest of the parameters of the formula as keyword arguments.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter that the solutions calculate
+	:param source_list: list of Python sources of the solutions
+	:param math_module: module used as `math` by the sources, default is math (NUMPY_MATH takes NumPy arrays)
+	:return: list of functions
+	"""
+	arguments = ", ".join([param for param in formula['parameters'] if param != parameter_name])
+
+	return [eval("lambda " + arguments + ": " + source, {"math": math_module}) for source in source_list]
+
+
+def evaluate_solutions(function_list: list, values: dict) -> list:
+	"""
+	Evaluates the functions of build_solution_functions(). Only the real and positive solutions are returned.
+
+	:param function_list: list of functions
+	:param values: dict with the float values of the parameters
+	:return: list of float solutions, [] if none
+	"""
+	results = []
+	for function in function_list:
+		try:
+			solution = function(**values)
+		except (ValueError, ZeroDivisionError, OverflowError):
+			# e.g. square root of a negative number, there is no real solution
+			continue
+
+		if isinstance(solution, complex):
+			if not math.isclose(solution.imag, 0, abs_tol=1e-9):
+				continue
+			solution = solution.real
+
+		if solution > 0:
+			results.append(solution)
+
+	return results
+
+
+def _evaluate_vectorised_solutions(function_list: list, arguments: dict) -> list:
+	"""
+	Helper function of solve_ranges() that evaluates the vectorised functions of the solutions with NumPy arrays.
+
+	:param function_list: list of functions built with NUMPY_MATH
+	:param arguments: dict with a NumPy array of the values of each parameter, all of them with the same length
+	:return: list of the real and positive float solutions
+	"""
+	results = []
+
+	# square roots of negative numbers are NaN instead of raising ValueError, and they are discarded below
+	with numpy.errstate(all="ignore"):
+		for function in function_list:
+			# the solutions that do not depend on the parameters are a single value
+			solutions = numpy.broadcast_to(function(**arguments), len(next(iter(arguments.values()))))
+
+			if numpy.iscomplexobj(solutions):
+				solutions = solutions[numpy.isclose(solutions.imag, 0, rtol=0, atol=1e-9)].real
+
+			results.extend(solutions[numpy.isfinite(solutions) & (solutions > 0)].tolist())
+
+	return results
+
+
+def _presolve_worker(formula: dict, parameter_name: str, result_queue):
+	"""
+	Helper function of presolve_formulae() that runs in a separate process.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter to solve the formula for
+	:param result_queue: multiprocessing queue where the result is put
+	:return: None
+	"""
+	result_queue.put(presolve_formula(formula, parameter_name))
@@ -16,9 +16,101 @@ import logging
 import operator
 
 from datavalidation.core import BikeGeometry, GeometryParameter
+from datavalidation.core.config import read_config_file
 from datavalidation.core.constants import GEOMETRY_CONSTRAINTS, OPERATORS, GEOMETRY_STATISTICS
+from datavalidation.core.tracing import traced
+from . import scoring, state
+from .geometrystatistics import STATISTICS_FILE, read_statistics_file
+from .scoring import get_deviation
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
+
+def compile_constraints(constraint_dict: dict) -> tuple:
+	"""
+	Compiles geometry constraints into a flat list of (lhs index, operator, rhs index, lhs is smaller) tuples, where the
+	indices are positions in the list of parameters and "lhs is smaller" tells whether the largest lhs value must be
+	compared with the smallest rhs value (< and <=) or the other way round (> and >=), so ranges are checked against
+	every value of the other parameter.
+
+	:param constraint_dict: geometry constraints, like GEOMETRY_CONSTRAINTS
+	:return: tuple (sorted list of the parameters referenced, list of compiled constraints)
+	:raise KeyError: raised if a constraint has an unknown operator
+	"""
+	parameter_list = sorted(set(constraint_dict.keys()) |
+		{constraint[1] for constraint_list in constraint_dict.values() for constraint in constraint_list})
+	index = {param: i for i, param in enumerate(parameter_list)}
+
+	return parameter_list, [(index[param], OPERATORS[constraint[0]], index[constraint[1]], constraint[0] in ["<", "<="])
+		for param, constraint_list in constraint_dict.items() for constraint in constraint_list]
+
+
+def get_constraint_tables(constraint_dict: dict) -> dict:
+	"""
+	Gets the tables of the state (see the state module) built from the geometry constraints.
+
+	:param constraint_dict: geometry constraints, like GEOMETRY_CONSTRAINTS
+	:return: dict with the "constraints", "constraint_parameters" (the parameters referenced, each one is a bit of the
+		violation bitmaps), "constraint_index" (the bit of each parameter) and "compiled_constraints"
+	"""
+	constraint_parameters, compiled_constraints = compile_constraints(constraint_dict)
+
+	return {
+		"constraints": constraint_dict,
+		"constraint_parameters": constraint_parameters,
+		"constraint_index": {param: i for i, param in enumerate(constraint_parameters)},
+		"compiled_constraints": compiled_constraints
+	}
+
+
+state.set_defaults(**get_constraint_tables(dict(GEOMETRY_CONSTRAINTS)))
+
+# version of the statistics file loaded, None if the statistics are those of the constants module
+_statistics_version = None
+
+
+def load_statistics_file(filepath: str = STATISTICS_FILE) -> bool:
+	"""
+	Loads the geometry statistics of a versioned statistics file (see the geometrystatistics module) into
+	GEOMETRY_STATISTICS. The parameters that are not in the file keep their statistics.
+
+	:param filepath: path of the statistics file, default is STATISTICS_FILE
+	:return: bool, True if the file was loaded
+	"""
+	global _statistics_version
+
+	try:
+		statistics_file = read_statistics_file(filepath)
+
+	except FileNotFoundError:
+		logging.debug("Statistics file '{}' not found, using the default geometry statistics".format(filepath))
+		return False
+
+	except Exception as e:
+		logging.warning("Statistics file '{}' could not be loaded: {}".format(filepath, e))
+		return False
+
+	GEOMETRY_STATISTICS.update(statistics_file['statistics'])
+	scoring.load_statistics(dict(GEOMETRY_STATISTICS))
+	_statistics_version = statistics_file['version']
+
+	logging.info("Statistics file '{}' loaded (version {})".format(filepath, _statistics_version))
+	return True
+
+
+def get_statistics_version():
+	"""
+	Gets the version of the statistics file loaded.
+
+	:return: version string or None if no statistics file was loaded
+	"""
+	return _statistics_version
+
+
+@traced()
 def filter_by_constraints(value_list: list, parameter_name: str, bike_geometry: BikeGeometry) -> list:
 	"""
 	Filters a list of values depending on the BikeGeometry constraints and the GeometryParameter they belong to.
@@ -32,13 +124,14 @@ def filter_by_constraints(value_list: list, parameter_name: str, bike_geometry:
 	:return: filtered list of values, it can be empty []
 	"""
 	filtered_result = []
+	constraint_dict = state.get_state()['constraints']
 
 	# check if the parameter has any constraints
-	if parameter_name in GEOMETRY_CONSTRAINTS:
+	if parameter_name in constraint_dict:
 		# for each value in value_list
 		for value in value_list:
 			# check that the value makes the constraints true
-			if _check_constraint_list(value, GEOMETRY_CONSTRAINTS[parameter_name], bike_geometry):
+			if _check_constraint_list(value, constraint_dict[parameter_name], bike_geometry):
 				filtered_result.append(value)
 
 		logging.debug("GeometryParameter('{}') - list of values {} filtered to {} with geometry constraints".format(
@@ -49,7 +142,7 @@ def filter_by_constraints(value_list: list, parameter_name: str, bike_geometry:
 		return value_list
 
 
-def check_parameter_constraints(parameter_name: str, bike_geometry: BikeGeometry) -> bool:
+def check_parameter_constraints(parameter_name: str, bike_geometry: BikeGeometry, violations: int = None) -> bool:
 	"""
 	Checks that the GeometryParameter satisfies all the geometry constraints.
 	It also checks the geometry statistics, so even if the parameter does NOT satisfy the geometry constraints,
@@ -57,9 +150,20 @@ def check_parameter_constraints(parameter_name: str, bike_geometry: BikeGeometry
 
 	:param parameter_name: name of the GeometryParameter
 	:param bike_geometry: BikeGeometry
+	:param violations: bitmap of get_constraint_violations() for the BikeGeometry, default is None to not use it. Only
+		the parameters with violated constraints are checked one by one (with the geometry statistics)
 	:return: bool, True if the GeometryParameter satisfies constraints (or the issue is with another parameter)
 	"""
-	if parameter_name in GEOMETRY_CONSTRAINTS:
+	validation_state = state.get_state()
+	constraint_index = validation_state['constraint_index']
+
+	if violations is not None and parameter_name in constraint_index and \
+			not violations & (1 << constraint_index[parameter_name]):
+		return True
+
+	constraint_dict = validation_state['constraints']
+
+	if parameter_name in constraint_dict:
 		parameter_value = bike_geometry.get_parameter_value(parameter_name)
 
 		if not isinstance(parameter_value, list):
@@ -69,7 +173,7 @@ def check_parameter_constraints(parameter_name: str, bike_geometry: BikeGeometry
 		# for each value in parameter_value list
 		for value in parameter_value:
 			# check that the value makes the constraints true
-			if _check_constraint_list(value, GEOMETRY_CONSTRAINTS[parameter_name], bike_geometry) or \
+			if _check_constraint_list(value, constraint_dict[parameter_name], bike_geometry) or \
 				_check_constraint_statistics(parameter_name, value, bike_geometry):
 				result.append(value)
 
@@ -82,6 +186,107 @@ def check_parameter_constraints(parameter_name: str, bike_geometry: BikeGeometry
 		return True
 
 
+def get_constraint_violations(bike_geometry: BikeGeometry) -> int:
+	"""
+	Checks all the geometry constraints of a BikeGeometry in one pass over the compiled constraints, without the geometry
+	statistics. Constraints with a parameter without a value are satisfied, like in _check_constraint(), while those
+	with a value that is not a number are marked as violated so check_parameter_constraints() checks them one by one.
+
+	The bitmap can be given to check_parameter_constraints() so each parameter does not check its constraints again.
+
+	:param bike_geometry: the BikeGeometry
+	:return: bitmap with the bit of each parameter of get_constraint_parameters() set if any of its constraints is
+		violated
+	"""
+	validation_state = state.get_state()
+	bounds = [_get_value_bounds(bike_geometry.get_parameter_value(param))
+		for param in validation_state['constraint_parameters']]
+	violations = 0
+
+	for lhs, operator_function, rhs, lhs_is_smaller in validation_state['compiled_constraints']:
+		lhs_bounds, rhs_bounds = bounds[lhs], bounds[rhs]
+
+		if lhs_bounds is None or rhs_bounds is None:
+			continue
+
+		if lhs_bounds is False or rhs_bounds is False:
+			satisfied = False
+		elif lhs_is_smaller:
+			satisfied = operator_function(lhs_bounds[1], rhs_bounds[0])
+		else:
+			satisfied = operator_function(lhs_bounds[0], rhs_bounds[1])
+
+		if not satisfied:
+			violations |= 1 << lhs
+
+	return violations
+
+
+def get_constraint_violation_masks(bike_geometry_list: list):
+	"""
+	Checks all the geometry constraints of a batch of BikeGeometries with NumPy, like get_constraint_violations().
+	NumPy is optional, so this raises ImportError if it is not installed.
+
+	:param bike_geometry_list: list of BikeGeometries
+	:return: NumPy boolean array with a row per BikeGeometry and a column per parameter of get_constraint_parameters(),
+		True if any of the constraints of the parameter is violated
+	:raise ImportError: raised if NumPy is not installed
+	"""
+	if numpy is None:
+		raise ImportError("NumPy is required to check the constraints of a batch of BikeGeometries")
+
+	validation_state = state.get_state()
+	constraint_parameters = validation_state['constraint_parameters']
+
+	# lowest and highest value of each parameter of each geometry, NaN if it has no value
+	lows = numpy.full((len(bike_geometry_list), len(constraint_parameters)), numpy.nan)
+	highs = numpy.full(lows.shape, numpy.nan)
+	not_numbers = numpy.zeros(lows.shape, dtype=bool)
+
+	for g, bike_geometry in enumerate(bike_geometry_list):
+		for i, param in enumerate(constraint_parameters):
+			value_bounds = _get_value_bounds(bike_geometry.get_parameter_value(param))
+			if value_bounds is False:
+				not_numbers[g, i] = True
+			elif value_bounds is not None:
+				lows[g, i], highs[g, i] = value_bounds
+
+	masks = numpy.zeros(lows.shape, dtype=bool)
+
+	for lhs, operator_function, rhs, lhs_is_smaller in validation_state['compiled_constraints']:
+		if lhs_is_smaller:
+			lhs_values, rhs_values = highs[:, lhs], lows[:, rhs]
+		else:
+			lhs_values, rhs_values = lows[:, lhs], highs[:, rhs]
+
+		# comparisons with NaN are False, so constraints with missing values are skipped explicitly
+		checked = ~numpy.isnan(lhs_values) & ~numpy.isnan(rhs_values)
+		masks[:, lhs] |= checked & ~operator_function(lhs_values, rhs_values)
+		masks[:, lhs] |= not_numbers[:, lhs] & (not_numbers[:, rhs] | ~numpy.isnan(lows[:, rhs]))
+		masks[:, lhs] |= not_numbers[:, rhs] & ~numpy.isnan(lows[:, lhs])
+
+	return masks
+
+
+def get_violated_parameters(violations: int) -> list:
+	"""
+	Gets the names of the parameters whose bit is set in a bitmap of get_constraint_violations().
+
+	:param violations: bitmap
+	:return: list of parameter names
+	"""
+	return [param for i, param in enumerate(get_constraint_parameters()) if violations & (1 << i)]
+
+
+def get_constraint_parameters() -> list:
+	"""
+	Gets the parameters referenced in the geometry constraints in use, each one is a bit of the violation bitmaps.
+
+	:return: sorted list of parameter names
+	"""
+	return state.get_state()['constraint_parameters']
+
+
 def get_parameter_deviation(parameter: GeometryParameter, invert: bool = False):
 	"""
 	Gets the parameter deviation from the normal geometry statistics.
@@ -91,7 +296,7 @@ def get_parameter_deviation(parameter: GeometryParameter, invert: bool = False):
 	:param invert: bool, give True to calculate the inverted deviation (1 - dev) when dev is not None. False by default
 	:return: float or None
 	"""
-	if parameter.name in GEOMETRY_CONSTRAINTS:
+	if parameter.name in state.get_state()['constraints']:
 		dev = _get_deviation(parameter.name, parameter.value)
 
 		if dev is not None:
@@ -136,6 +341,12 @@ def _check_constraint(value: float, constraint: tuple, bike_geometry: BikeGeomet
 	if bike_param is None or bike_param == "":
 		return True
 
+	bike_bounds = _get_value_bounds(bike_param)
+
+	if bike_bounds:
+		# the value satisfies the constraint with every value of a range if it does with its lowest or highest
+		return OPERATORS[constraint[0]](value, bike_bounds[0] if constraint[0] in ("<", "<=") else bike_bounds[1])
+
 	if not isinstance(bike_param, list):
 		bike_param = [bike_param]
 
@@ -169,7 +380,7 @@ def _check_constraint_statistics(parameter_name: str, value: float, bike_geometr
 	other_deviations = []
 	# note that other_deviations is a list of tuples like ("chainstay", 0.8), although the first value is not used
 
-	for constraint in GEOMETRY_CONSTRAINTS[parameter_name]:
+	for constraint in state.get_state()['constraints'][parameter_name]:
 		other_deviations.append(
 			(constraint[1], _get_deviation(constraint[1], bike_geometry.get_parameter_value(constraint[1])))
 		)
@@ -182,36 +393,33 @@ def _check_constraint_statistics(parameter_name: str, value: float, bike_geometr
 
 def _get_deviation(parameter_name: str, value: float):
 	"""
-	Gets the deviation of a parameter from the normal statistics.
-	This is a number from 0 to 1 where 1 represents that the value is exactly right and 0 where the value
-	is very off from the normal statistics (e.g. a wheelbase of 1150 would give something close to 1, but
-	a wheelbase of 10 would give a deviation close to 0).
-	It averages the similarity of the value to its mean and to its median.
+	Gets the deviation of a parameter from the normal statistics (see scoring.get_deviation()).
 
 	:param parameter_name: name of the GeometryParameter
 	:param value: value for the GeometryParameter
 	:return: float or None (if value is None only)
 	"""
-	if value is None:
-		return None
-	return 1 - (_get_value_similarity(GEOMETRY_STATISTICS[parameter_name]['mean'], value) +
-		_get_value_similarity(GEOMETRY_STATISTICS[parameter_name]['median'], value)) / 2
+	return get_deviation(parameter_name, value)
 
 
-def _get_value_similarity(value1, value2) -> float:
+def _get_value_bounds(value):
 	"""
-	Gets the similarity between two values.
-	The similarity is a number between 0 and 1 as a percentage where 1 means that the values are the same and 0
-	means that the values are completely different.
-	This function is duplicated in the validate module. A common utility file could improve this...
+	Helper function that gets the lowest and highest float values of a parameter value, which can be a range.
 
-	:param value1: value
-	:param value2: value
-	:return: (0 to 1) percentage float of how close value1 is to value2
+	:param value: value of a GeometryParameter
+	:return: tuple (lowest, highest), None if it has no value or False if it is not a number
 	"""
-	if isinstance(value2, list):
-		# if value2 is a list, then return the one with least similarity from the whole similarity list
-		val_list = [_get_value_similarity(value1, x) for x in value2]
-		return sum(val_list) / len(val_list)
+	if value is None or value == "" or value == []:
+		return None
+
+	# strings are not compared as numbers by _check_constraint(), even if they could be casted
+	value_list = value if isinstance(value, list) else [value]
+	if not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in value_list):
+		return False
+
+	value_list = [float(x) for x in value_list]
+
+	return min(value_list), max(value_list)
+
 
-	return float(min([value1, value2])) / float(max([value1, value2]))
+load_statistics_file(read_config_file().get("validation", {}).get("statistics_file") or STATISTICS_FILE)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+corrections
+----------------------------------
+
+Module that suggests corrections for the invalid GeometryParameters of a validated BikeGeometry. Many invalid values
+are typos, e.g. 064 instead of 604 or 110 instead of 101, so the candidate values are the usual edits of the value:
+
+- transposition: two adjacent digits swapped (604 to 064)
+- dropped_digit: a digit was dropped (64 from 604)
+- duplicated_digit: a digit was duplicated (6044 from 604)
+- decimal_shift: the value is 10 or 100 times bigger or smaller (60.4 from 604)
+- inch_mm: the value was given in inches instead of millimetres or the other way round
+
+Each candidate is scored with the residuals of the formulae of the parameter, evaluated with the rest of values of
+the BikeGeometry, and those that satisfy the formulae are suggested from the best to the worst. The formulae are
+evaluated for all the candidates at once with NumPy if it is installed.
+
+The policy is set in the `validation.corrections` section of the config file::
+
+	"corrections": {
+		"enabled": true,
+		"max_suggestions": 3,
+		"tolerance": 0.01
+	}
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import re
+import math
+
+from datavalidation.core import BikeGeometry, GeometryParameter
+from datavalidation.core import metrics
+from datavalidation.core.config import read_config_file
+from datavalidation.core.tracing import traced
+from . import compiled
+from .equations import get_equations
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# default policy
+DEFAULT_POLICY = {
+	# whether to suggest corrections for the invalid parameters
+	"enabled": True,
+	# maximum number of suggestions per parameter
+	"max_suggestions": 3,
+	# maximum residual of the formulae (relative to the size of their values) of a suggestion
+	"tolerance": 0.01
+}
+
+# millimetres in an inch
+INCH = 25.4
+
+SUGGESTIONS = metrics.get_counter("datavalidation_suggestions_total",
+	"Invalid parameters with (found) or without (not_found) suggested corrections", ["result"])
+
+_policy = dict(DEFAULT_POLICY, **read_config_file().get("validation", {}).get("corrections", {}))
+
+
+def set_corrections_policy(enabled: bool = True, max_suggestions: int = 3, tolerance: float = 0.01):
+	"""
+	Sets the policy of the suggested corrections.
+
+	:param enabled: whether to suggest corrections for the invalid parameters, default is True
+	:param max_suggestions: maximum number of suggestions per parameter, default is 3
+	:param tolerance: maximum relative residual of the formulae of a suggestion, default is 0.01
+	:return: None
+	"""
+	global _policy
+
+	_policy = {
+		"enabled": enabled,
+		"max_suggestions": max_suggestions,
+		"tolerance": tolerance
+	}
+
+
+def get_corrections_policy() -> dict:
+	"""
+	Gets the policy of the suggested corrections.
+
+	:return: dict, see DEFAULT_POLICY
+	"""
+	return dict(_policy)
+
+
+@traced()
+@metrics.timed("suggest_corrections")
+def suggest_corrections(bike_geometry: BikeGeometry, parameter_list: list = None) -> dict:
+	"""
+	Suggests corrections for GeometryParameters of a validated BikeGeometry, setting them in each GeometryParameter
+	(see GeometryParameter.suggestions). It does nothing if the corrections are disabled in the policy.
+
+	:param bike_geometry: the BikeGeometry, validated
+	:param parameter_list: list of GeometryParameters to correct, default is None for the invalid ones (those with a
+		confidence below the parameter threshold of the BikeGeometry)
+	:return: dict with the list of suggestions of each parameter corrected
+	"""
+	if not _policy.get("enabled"):
+		return {}
+
+	if parameter_list is None:
+		parameter_list = [param for param in bike_geometry.get_parameter_list() if param.is_number() and
+			param.confidence is not None and param.confidence < bike_geometry.get_parameter_threshold()]
+
+	result = {}
+
+	for parameter in parameter_list:
+		suggestion_list = get_suggestions(parameter, bike_geometry)
+		parameter.set_suggestions(suggestion_list)
+		result[parameter.name] = suggestion_list
+
+		if metrics.is_enabled():
+			SUGGESTIONS.inc(labels=("found" if len(suggestion_list) > 0 else "not_found", ))
+
+	return result
+
+
+def get_suggestions(parameter: GeometryParameter, bike_geometry: BikeGeometry) -> list:
+	"""
+	Gets the suggested corrections of a GeometryParameter, without modifying it.
+
+	:param parameter: GeometryParameter inside the BikeGeometry
+	:param bike_geometry: the BikeGeometry
+	:return: list of dicts with the value ("v"), the kind of edit ("edit") and the residual of the formulae ("residual"),
+		from the best to the worst, [] if none
+	"""
+	value = _get_float(parameter.normalised_value)
+	if value is None:
+		return []
+
+	formula_list = []
+	for formula in get_equations(parameter.name):
+		values = {param: _get_other_value(bike_geometry, param) for param in formula['parameters']
+			if param != parameter.name}
+
+		if all(val is not None for val in values.values()):
+			formula_list.append((formula, values))
+
+	if len(formula_list) == 0:
+		return []
+
+	candidates = generate_candidates(value, parameter.original_value)
+	scores = score_candidates(parameter.name, [value] + [candidate for candidate, _ in candidates], formula_list)
+	tolerance = _policy.get("tolerance", DEFAULT_POLICY['tolerance'])
+
+	suggestion_list = sorted(({"v": candidate, "edit": edit, "residual": score}
+		for (candidate, edit), score in zip(candidates, scores[1:]) if score <= tolerance and score < scores[0]),
+		key=lambda suggestion: suggestion['residual'])
+
+	return suggestion_list[:_policy.get("max_suggestions", DEFAULT_POLICY['max_suggestions'])]
+
+
+def generate_candidates(value: float, original_value=None) -> list:
+	"""
+	Generates the candidate corrections of a value: digit transpositions, dropped and duplicated digits, decimal shifts
+	and inch/mm swaps. The digit edits are made on the value and on the number in the original value given (so the
+	leading zeros of "064" are kept).
+
+	:param value: normalised value
+	:param original_value: value as given in the BikeGeometry, default is None
+	:return: list of tuples (candidate value, edit), without duplicates or the value itself
+	"""
+	texts = [_format_number(value)]
+
+	# the original text goes first, so its edits are the ones reported when several edits give the same value
+	match = re.search(r"\d+(\.\d+)?", str(original_value)) if original_value is not None else None
+	if match is not None and match.group(0) not in texts:
+		texts.insert(0, match.group(0))
+
+	candidates = []
+
+	for text in texts:
+		for i in range(len(text)):
+			if not text[i].isdigit():
+				continue
+
+			if i + 1 < len(text) and text[i + 1].isdigit() and text[i] != text[i + 1]:
+				candidates.append((text[:i] + text[i + 1] + text[i] + text[i + 2:], "transposition"))
+
+			candidates.append((text[:i] + text[i + 1:], "dropped_digit"))
+			candidates.append((text[:i] + text[i] + text[i:], "duplicated_digit"))
+
+	candidates = [(_get_float(candidate), edit) for candidate, edit in candidates]
+	candidates.extend([(value * factor, "decimal_shift") for factor in [10, 100, 0.1, 0.01]])
+	candidates.extend([(value * INCH, "inch_mm"), (value / INCH, "inch_mm")])
+
+	result = []
+	seen = {value}
+
+	for candidate, edit in candidates:
+		if candidate is not None and candidate > 0 and candidate not in seen:
+			seen.add(candidate)
+			result.append((candidate, edit))
+
+	return result
+
+
+def score_candidates(parameter_name: str, candidate_list: list, formula_list: list) -> list:
+	"""
+	Scores candidate values of a parameter with the residuals of its formulae. The score of a candidate is the largest
+	residual of the formulae, relative to the size of the rest of values of each formula, so 0 is a perfect fit.
+
+	The formulae are evaluated for all the candidates at once with NumPy if it is installed.
+
+	:param parameter_name: name of the GeometryParameter
+	:param candidate_list: list of float candidate values
+	:param formula_list: list of tuples (formula, dict with the float values of the rest of parameters)
+	:return: list of scores, one per candidate (infinity if a formula cannot be evaluated with it)
+	"""
+	scores = [0.0] * len(candidate_list)
+
+	for formula, values in formula_list:
+		scale = max(sum(abs(val) for val in values.values()) / len(values), 1.0) if len(values) > 0 else 1.0
+
+		if numpy is not None:
+			residuals = _evaluate_vectorised(formula, parameter_name, candidate_list, values)
+		else:
+			residuals = _evaluate(formula, parameter_name, candidate_list, values)
+
+		scores = [max(score, abs(residual) / scale if math.isfinite(residual) else math.inf)
+			for score, residual in zip(scores, residuals)]
+
+	return scores
+
+
+def _evaluate_vectorised(formula: dict, parameter_name: str, candidate_list: list, values: dict) -> list:
+	"""
+	Helper function that evaluates the residual of a formula for each candidate with NumPy.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter of the candidates
+	:param candidate_list: list of float candidate values
+	:param values: dict with the float values of the rest of parameters of the formula
+	:return: list of residuals, NaN where the formula cannot be evaluated
+	"""
+	function = compiled.get_vectorised_residual_function(formula)
+	candidates = numpy.array(candidate_list, dtype=float)
+
+	with numpy.errstate(all="ignore"):
+		residuals = function(*[candidates if param == parameter_name else values[param]
+			for param in formula['parameters']])
+
+	return numpy.broadcast_to(numpy.asarray(residuals, dtype=float), candidates.shape).tolist()
+
+
+def _evaluate(formula: dict, parameter_name: str, candidate_list: list, values: dict) -> list:
+	"""
+	Helper function that evaluates the residual of a formula for each candidate, one by one.
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the GeometryParameter of the candidates
+	:param candidate_list: list of float candidate values
+	:param values: dict with the float values of the rest of parameters of the formula
+	:return: list of residuals, NaN where the formula cannot be evaluated
+	"""
+	function = compiled.get_residual_function(formula)
+	arguments = [values.get(param) for param in formula['parameters']]
+	position = formula['parameters'].index(parameter_name)
+	residuals = []
+
+	for candidate in candidate_list:
+		arguments[position] = candidate
+
+		try:
+			residuals.append(float(function(*arguments)))
+		except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+			residuals.append(math.nan)
+
+	return residuals
+
+
+def _get_other_value(bike_geometry: BikeGeometry, parameter_name: str):
+	"""
+	Helper function that gets the float value of another parameter to evaluate the formulae: the value given if there
+	is one and it is valid, or its calculated value otherwise (so a typo in another parameter does not decide the
+	corrections of this one).
+
+	:param bike_geometry: the BikeGeometry
+	:param parameter_name: name of the GeometryParameter
+	:return: float or None
+	"""
+	parameter = bike_geometry.get_parameter(parameter_name)
+
+	if parameter is None:
+		return None
+
+	value = _get_float(parameter.normalised_value)
+	calculated_value = _get_float(parameter.calculated_value)
+
+	if value is None or (calculated_value is not None and parameter.confidence is not None and
+			parameter.confidence < bike_geometry.get_parameter_threshold()):
+		return calculated_value
+
+	return value
+
+
+def _get_float(value):
+	"""
+	Helper function that converts a value to float. Ranges use their first value, like in
+	equations.substitute_parameters().
+
+	:param value: value
+	:return: float or None if it is not a number
+	"""
+	try:
+		value = float(value) if not isinstance(value, list) else float(value[0])
+	except (ValueError, TypeError, IndexError):
+		return None
+
+	return value if math.isfinite(value) else None
+
+
+def _format_number(value: float) -> str:
+	"""
+	Helper function that formats a value as its shortest decimal text, e.g. 604.0 as "604" and 60.4 as "60.4".
+
+	:param value: float
+	:return: string
+	"""
+	text = "{:f}".format(value)
+	return text.rstrip("0").rstrip(".") if "." in text else text
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+derived
+----------------------------------
+
+Module with the derived formulae: formulae of VALIDATION_FORMULAE combined offline by eliminating the parameters that
+they share. Many missing parameters can only be calculated by chaining formulae (e.g. reach from one formula, then
+head_angle from reach in another), which takes several passes of calculate_missing_parameters(). A derived formula
+calculates them in one step from the parameters given.
+
+To eliminate a parameter, a formula is solved for it with sympy. If it has a single solution, the solution is
+substituted in another formula with that parameter. The derived formulae are then solved for each of their parameters,
+like the compiled formulae (see the compiled module). Only the parameters with a compiled solution are kept, so the
+validation never calls the sympy solver with a derived formula. This is slow, so it is done offline and saved in a
+versioned file::
+
+	datavalidation derive --eliminations 2 -o datavalidation/derived.json
+
+The derived formulae are only used to calculate missing parameters that no formula of VALIDATION_FORMULAE can
+calculate with the parameters present (see ValidationPlan.get_derived_equations()). They are never used to validate
+parameters, as they repeat the formulae that they were derived from.
+
+The file is loaded at start-up, from `derived_file` in the `validation` section of the config file (null for
+`datavalidation/derived.json`, if it exists). It is ignored if it was derived from other formulae.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import re
+import json
+import queue
+import hashlib
+import logging
+import itertools
+import multiprocessing
+
+import sympy
+import sympy.solvers
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core.config import read_config_file
+from . import compiled, state
+from .constraints import filter_by_constraints
+from .equations import get_formula_values
+from .formulae import VALIDATION_FORMULAE
+
+
+# version of the format of the derived file, change it if the structure of the file changes
+DERIVED_FORMAT = 1
+
+# default location of the derived file, under the root of the package
+DERIVED_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "derived.json")
+
+# sympy functions that can be written back in the equations, with their names in the formulae (see SUBS_DICT)
+EQUATION_FUNCTIONS = {
+	"pi": "PI",
+	"sin": "SIN",
+	"cos": "COS",
+	"tan": "TAN",
+	"atan2": "ATAN2",
+	"sqrt": "SQRT"
+}
+
+# sympy functions that the solutions may have, written with those of EQUATION_FUNCTIONS
+FUNCTION_REWRITES = {
+	sympy.cot: lambda argument: 1 / sympy.tan(argument),
+	sympy.sec: lambda argument: 1 / sympy.cos(argument),
+	sympy.csc: lambda argument: 1 / sympy.sin(argument),
+	sympy.atan: lambda argument: sympy.atan2(argument, 1, evaluate=False)
+}
+
+# content of the derived file loaded, None if none was loaded
+_derived_file = None
+# functions of the compiled solutions of the derived formulae, keyed by (equation string, parameter name)
+_SOLUTION_FUNCTIONS = {}
+
+
+def derive_formula(formula: dict, other: dict, parameter_name: str):
+	"""
+	Derives a formula by eliminating a parameter: the formula is solved for it, and its solution is substituted in the
+	other formula. Note that solving the formula can take a long time (or never finish) for some parameters.
+
+	:param formula: a formula dict with an equation, solved for the parameter
+	:param other: another formula dict with the parameter
+	:param parameter_name: name of the GeometryParameter to eliminate
+	:return: derived formula dict, or None if the parameter does not have a single solution or the result cannot be
+		written as an equation
+	"""
+	try:
+		solutions = sympy.solvers.solve(compiled.get_formula_expression(formula),
+			sympy.Symbol(parameter_name, positive=True))
+	except Exception as e:
+		logging.error("There was an error eliminating '{}' from the equation: \n{}\n{}".format(
+			parameter_name, formula['equation'], e))
+		return None
+
+	# with several solutions, there would be a formula for each one and only one of them would be right
+	if len(solutions) != 1:
+		return None
+
+	expression = compiled.get_formula_expression(other).subs(sympy.Symbol(parameter_name, positive=True), solutions[0])
+	parameter_list = [param for param in other['parameters'] + formula['parameters'] if param != parameter_name]
+	parameter_list = sorted(set(parameter_list), key=parameter_list.index)
+
+	try:
+		equation = get_formula_equation(expression, parameter_list)
+	except ValueError as e:
+		logging.debug("The formula derived by eliminating '{}' cannot be written: {}".format(parameter_name, e))
+		return None
+
+	return {
+		"equation": equation,
+		"parameters": parameter_list,
+		"eliminated": other.get("eliminated", []) + formula.get("eliminated", []) + [parameter_name],
+		"sources": other.get("sources", [other['equation']]) + formula.get("sources", [formula['equation']])
+	}
+
+
+def derive_formulae(formula_list: list = None, eliminations: int = 1, timeout: float = 60) -> list:
+	"""
+	Derives the formulae that eliminate up to the given number of parameters from the formulae, and solves them for
+	each of their parameters. Each step is run in a separate process so it can be abandoned if it takes longer than
+	the timeout given. Note that this can take a long time.
+
+	:param formula_list: list of formulae, default is VALIDATION_FORMULAE
+	:param eliminations: maximum number of parameters eliminated in each derived formula, default is 1
+	:param timeout: maximum time in seconds of each elimination and each solution, default is 60
+	:return: list of derived formula dicts, each one with the compiled "solutions" of its parameters
+	"""
+	formula_list = formula_list if formula_list is not None else VALIDATION_FORMULAE
+	derived_list = []
+	# the same formulae can be derived in different orders, they are kept once
+	known_equations = {formula['equation'] for formula in formula_list}
+	previous_list = list(formula_list)
+
+	for _ in range(eliminations):
+		new_list = []
+
+		for formula, other in itertools.product(formula_list, previous_list):
+			if formula['equation'] in other.get("sources", [other['equation']]):
+				continue
+
+			for parameter_name in other['parameters']:
+				if parameter_name not in formula['parameters']:
+					continue
+
+				derived = _run_worker(derive_formula, (formula, other, parameter_name), timeout)
+
+				if derived is None or derived['equation'] in known_equations:
+					continue
+
+				known_equations.add(derived['equation'])
+				new_list.append(derived)
+
+		derived_list.extend(new_list)
+		previous_list = new_list
+
+	for derived in derived_list:
+		derived['solutions'] = {name: solutions for (_, name), solutions
+			in compiled.presolve_formulae(timeout, [derived]).items()}
+
+	return [derived for derived in derived_list if len(derived['solutions']) > 0]
+
+
+def get_formula_equation(expression, parameter_list: list) -> str:
+	"""
+	Writes a sympy expression as an equation of the formulae, the inverse of compiled.get_formula_expression().
+
+	:param expression: sympy expression
+	:param parameter_list: names of the GeometryParameters in the expression
+	:return: equation string
+	:raise ValueError: raised if the expression has functions or symbols that the formulae cannot have
+	"""
+	def replace_name(match) -> str:
+		name = match.group(0)
+
+		if name in parameter_list:
+			return "{" + name + "}"
+
+		if name in EQUATION_FUNCTIONS:
+			return EQUATION_FUNCTIONS[name]
+
+		raise ValueError("'{}' cannot be written in an equation".format(name))
+
+	for function, rewrite in FUNCTION_REWRITES.items():
+		expression = expression.replace(function, rewrite)
+
+	# the names that are not part of a number (e.g. the exponent in 1.0e-5)
+	return re.sub(r"(?<![\w.])[A-Za-z_]\w*", replace_name, sympy.sstr(expression)).replace("**", "^")
+
+
+def get_formulae_hash(formula_list: list = None) -> str:
+	"""
+	Gets a hash of the formulae, the version that a derived file must have to be used with them.
+
+	:param formula_list: list of formulae, default is VALIDATION_FORMULAE
+	:return: hash string
+	"""
+	formula_list = formula_list if formula_list is not None else VALIDATION_FORMULAE
+	formulae = json.dumps([[formula['equation'], formula['parameters']] for formula in formula_list])
+
+	return hashlib.sha1(formulae.encode("utf-8")).hexdigest()[:12]
+
+
+def build_derived_file(derived_list: list, formula_list: list = None) -> dict:
+	"""
+	Builds the content of a derived file.
+
+	:param derived_list: list of derived formulae from derive_formulae()
+	:param formula_list: list of formulae that they were derived from, default is VALIDATION_FORMULAE
+	:return: dict ready to be serialised as JSON
+	"""
+	return {
+		"format": DERIVED_FORMAT,
+		"version": get_formulae_hash(formula_list),
+		"formulae": derived_list
+	}
+
+
+def save_derived_file(filepath: str, derived_list: list, formula_list: list = None) -> dict:
+	"""
+	Saves the derived formulae to a versioned derived file.
+
+	:param filepath: path of the derived file
+	:param derived_list: list of derived formulae from derive_formulae()
+	:param formula_list: list of formulae that they were derived from, default is VALIDATION_FORMULAE
+	:return: the content of the file saved
+	"""
+	derived_file = build_derived_file(derived_list, formula_list)
+
+	# write and rename, so the file is never read half written
+	with open(filepath + ".tmp", "w") as json_file:
+		json.dump(derived_file, json_file, indent="\t")
+
+	os.replace(filepath + ".tmp", filepath)
+	logging.info("Derived file saved to '{}' (version {})".format(filepath, derived_file['version']))
+	return derived_file
+
+
+def read_derived_file(filepath: str) -> dict:
+	"""
+	Reads and checks a derived file.
+
+	:param filepath: path of the derived file
+	:return: dict with the "format", "version" and "formulae"
+	:raise ValueError: raised if the file is not a valid derived file
+	"""
+	with open(filepath) as json_file:
+		derived_file = json.load(json_file)
+
+	if derived_file.get("format") != DERIVED_FORMAT:
+		raise ValueError("derived file format '{}' is not {}".format(derived_file.get("format"), DERIVED_FORMAT))
+
+	for derived in derived_file.get("formulae", []):
+		if not isinstance(derived.get("solutions"), dict) or \
+				any(name not in derived.get("parameters", []) for name in derived['solutions']):
+			raise ValueError("derived formula without valid solutions: '{}'".format(derived.get("equation")))
+
+	return derived_file
+
+
+def load_derived_file(filepath: str = DERIVED_FILE) -> bool:
+	"""
+	Loads the derived formulae of a derived file and uses them if they were derived from VALIDATION_FORMULAE.
+
+	:param filepath: path of the derived file, default is DERIVED_FILE
+	:return: bool, True if the file was loaded
+	"""
+	global _derived_file
+
+	try:
+		derived_file = read_derived_file(filepath)
+
+	except FileNotFoundError:
+		logging.debug("Derived file '{}' not found, calculating parameters without derived formulae".format(filepath))
+		return False
+
+	except Exception as e:
+		logging.warning("Derived file '{}' could not be loaded: {}".format(filepath, e))
+		return False
+
+	_derived_file = derived_file
+	install_derived_formulae(get_derived_formulae())
+
+	logging.info("Derived file '{}' loaded (version {})".format(filepath, derived_file['version']))
+	return True
+
+
+def get_derived_formulae(formula_list: list = None) -> list:
+	"""
+	Gets the derived formulae of the derived file loaded if they were derived from the formulae given.
+
+	:param formula_list: list of formulae, default is VALIDATION_FORMULAE
+	:return: list of derived formulae, [] if none
+	"""
+	if _derived_file is None or _derived_file['version'] != get_formulae_hash(formula_list):
+		return []
+
+	return list(_derived_file['formulae'])
+
+
+def install_derived_formulae(derived_list: list):
+	"""
+	Sets the derived formulae used to calculate parameters, replacing the current ones.
+
+	:param derived_list: list of derived formulae
+	:return: None
+	"""
+	# the functions are built again when they are first used, and so are the plans that use the derived formulae
+	_SOLUTION_FUNCTIONS.clear()
+	state.update_state(derived_index=get_derived_index(derived_list), plans={})
+
+
+def get_derived_index(derived_list: list) -> dict:
+	"""
+	Gets the index of the derived formulae of the state (see the state module).
+
+	:param derived_list: list of derived formulae
+	:return: dict with the list of derived formulae that calculate each parameter, keyed by parameter name
+	"""
+	derived_index = {}
+	for derived in derived_list:
+		for name in derived['solutions']:
+			derived_index.setdefault(name, []).append(derived)
+
+	return derived_index
+
+
+def get_derived_equations(parameter_name: str, present: set) -> list:
+	"""
+	Gets the derived formulae that calculate a GeometryParameter from the parameters present.
+
+	:param parameter_name: name of the GeometryParameter
+	:param present: names of the GeometryParameters with a value
+	:return: list of derived formulae, [] if none
+	"""
+	return [derived for derived in state.get_state()['derived_index'].get(parameter_name, [])
+		if all(param in present for param in derived['parameters'] if param != parameter_name)]
+
+
+def solve_derived(derived: dict, parameter_name: str, bike_geometry: BikeGeometry) -> list:
+	"""
+	Calculates a GeometryParameter with the compiled solutions of a derived formula. The solutions are filtered by the
+	geometry constraints, like solve_equation() does.
+
+	:param derived: a derived formula of get_derived_equations()
+	:param parameter_name: name of the GeometryParameter to calculate
+	:param bike_geometry: the BikeGeometry
+	:return: list of possible solutions, [] if no solutions found
+	"""
+	values = get_formula_values(derived, parameter_name, bike_geometry)
+
+	if values is None:
+		return []
+
+	key = (derived['equation'], parameter_name)
+
+	if any(isinstance(value, list) for value in values.values()):
+		# ranges are solved for every combination of their values at once
+		results = compiled.solve_ranges(derived, parameter_name, derived['solutions'][parameter_name], values)
+
+	else:
+		if key not in _SOLUTION_FUNCTIONS:
+			_SOLUTION_FUNCTIONS[key] = compiled.build_solution_functions(derived, parameter_name,
+				derived['solutions'][parameter_name])
+
+		results = compiled.evaluate_solutions(_SOLUTION_FUNCTIONS[key], values)
+
+	return filter_by_constraints(results, parameter_name, bike_geometry)
+
+
+def _run_worker(function, args: tuple, timeout: float):
+	"""
+	Helper function that runs a function in a separate process, abandoning it if it takes longer than the timeout.
+
+	:param function: function to run, its result must be picklable
+	:param args: tuple of arguments of the function
+	:param timeout: maximum time in seconds
+	:return: the result of the function, or None if it took too long
+	"""
+	result_queue = multiprocessing.Queue()
+	process = multiprocessing.Process(target=_worker, args=(function, args, result_queue))
+	process.start()
+
+	try:
+		# get the result before joining, the process does not finish until its result is read
+		result = result_queue.get(timeout=timeout)
+	except queue.Empty:
+		logging.warning("{}{} took longer than {}s, skipping it".format(function.__name__, args[2:], timeout))
+		result = None
+		process.terminate()
+
+	process.join()
+	return result
+
+
+def _worker(function, args: tuple, result_queue):
+	"""
+	Helper function of _run_worker() that runs in a separate process.
+
+	:param function: function to run
+	:param args: tuple of arguments of the function
+	:param result_queue: multiprocessing queue where the result is put
+	:return: None
+	"""
+	result_queue.put(function(*args))
+
+
+# derived formulae in use, keyed by the parameter that they calculate
+state.set_defaults(derived_index={})
+
+load_derived_file(read_config_file().get("validation", {}).get("derived_file") or DERIVED_FILE)
@@ -12,11 +12,15 @@ Author: Javier Chiyah, Heriot-Watt University, 2019
 
 
 import re
+import time
 import sympy
 import sympy.solvers
 import logging
 
 from datavalidation.core import BikeGeometry
+from datavalidation.core import metrics
+from datavalidation.core.tracing import traced
+from . import compiled, state
 from .constraints import filter_by_constraints
 from .formulae import VALIDATION_FORMULAE, SUBS_DICT
 
@@ -24,7 +28,26 @@ from .formulae import VALIDATION_FORMULAE, SUBS_DICT
 # this can be anything, but x looks good when solving equations
 UNKNOWN_PARAMETER = "x"
 
-
+state.set_defaults(
+	# formulae in use, a copy of VALIDATION_FORMULAE until a registry is installed
+	formulae=list(VALIDATION_FORMULAE),
+	# cache of the equations that can be solved for each GeometryParameter name, filled by get_equations()
+	equation_index={},
+	# cache of the equation strings with their operators already substituted, keyed by the original equation string
+	compiled_equations={},
+	# labels of the formulae in the metrics (their position in the formulae), keyed by the equation string
+	formula_labels={formula['equation']: str(i) for i, formula in enumerate(VALIDATION_FORMULAE)}
+)
+
+# engines that solve_equation() can use to solve the equations:
+#   - sympy: substitutes the values in the equation and solves it with the sympy solver
+#   - compiled: evaluates the compiled solutions of the formula (see the compiled module), falling back to sympy if
+#   the formula has no compiled solution for the parameter
+SOLVER_ENGINES = ["sympy", "compiled"]
+_solver_engine = "sympy"
+
+
+@traced()
 def get_equations(parameter_name: str, filter_by: list = None) -> list:
 	"""
 	Gets a list of equations for the given GeometryParameter name. If a list of parameters is given as the filter,
@@ -36,12 +59,14 @@ def get_equations(parameter_name: str, filter_by: list = None) -> list:
 	:param filter_by: list of GeometryParameters available that are not empty
 	:return: list of equations, [] if none could be found
 	"""
-	result_list = []
+	validation_state = state.get_state()
+	equation_index = validation_state['equation_index']
 
-	regex = re.compile(r'{' + parameter_name + '}')
-	for formula in VALIDATION_FORMULAE:
-		if parameter_name in formula['parameters'] and len(regex.findall(formula['equation'])) == 1:
-			result_list.append(formula)
+	if parameter_name not in equation_index:
+		equation_index[parameter_name] = find_equations(parameter_name, validation_state['formulae'])
+
+	# return a copy so callers cannot modify the cached list
+	result_list = list(equation_index[parameter_name])
 
 	if filter_by is not None:
 		return filter_equations(result_list, filter_by, parameter_name)
@@ -49,6 +74,20 @@ def get_equations(parameter_name: str, filter_by: list = None) -> list:
 	return result_list
 
 
+def find_equations(parameter_name: str, formula_list: list) -> list:
+	"""
+	Finds the formulae that can be solved for a GeometryParameter: those where it appears exactly once.
+
+	:param parameter_name: name of the GeometryParameter
+	:param formula_list: list of formulae, like VALIDATION_FORMULAE
+	:return: list of formulae
+	"""
+	regex = re.compile(r'{' + parameter_name + '}')
+
+	return [formula for formula in formula_list
+		if parameter_name in formula['parameters'] and len(regex.findall(formula['equation'])) == 1]
+
+
 def filter_equations(equation_list: list, filter_by: list = None, parameter_name: str = None) -> list:
 	"""
 	Filters a list of equations depending on a list of the GeometryParameters available.
@@ -79,7 +118,9 @@ def filter_equations(equation_list: list, filter_by: list = None, parameter_name
 	return result_list
 
 
-def solve_equation(formula, symbol_to_solve: str, bike_geometry: BikeGeometry, force_constraints: bool = True) -> list:
+@traced()
+def solve_equation(formula, symbol_to_solve: str, bike_geometry: BikeGeometry, force_constraints: bool = True,
+		engine: str = None) -> list:
 	"""
 	Solves an equation and returns the possible solutions. This is the main function used to calculate parameter values.
 	Equations with square roots return multiple solutions, increasing exponentially with additional square roots in
@@ -106,9 +147,81 @@ def solve_equation(formula, symbol_to_solve: str, bike_geometry: BikeGeometry, f
 	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
 	:param bike_geometry: the BikeGeometry
 	:param force_constraints: if the solutions returned should enforce geometry constraints, True by default
+	:param engine: name of the engine used to solve the equation (see SOLVER_ENGINES), default is the one set with
+		set_solver_engine(). Formulae with ranges are solved with their compiled solutions if they have them, whatever
+		the engine, so every value of the ranges is used
+	:return: list of possible solutions, [] if no solutions found
+	"""
+	engine = engine if engine is not None else _solver_engine
+	results = None
+	start_time = time.perf_counter() if metrics.is_enabled() else None
+
+	# the sympy solver only uses the first value of the ranges, so they use the compiled solutions with any engine
+	if compiled.has_compiled_solution(formula, symbol_to_solve) and \
+			(engine == "compiled" or _has_ranges(formula, symbol_to_solve, bike_geometry)):
+		results = _solve_equation_compiled(formula, symbol_to_solve, bike_geometry)
+
+	if results is None:
+		results = _solve_equation_sympy(formula, symbol_to_solve, bike_geometry)
+
+	if force_constraints:
+		results = filter_by_constraints(results, symbol_to_solve, bike_geometry)
+
+	if start_time is not None:
+		labels = get_formula_labels(formula, symbol_to_solve)
+		metrics.SOLVE_SECONDS.observe(time.perf_counter() - start_time, labels)
+		metrics.SOLVE_SOLUTIONS.observe(len(results), labels)
+
+	return results
+
+
+def set_solver_engine(engine: str):
+	"""
+	Sets the engine used by default to solve equations in solve_equation().
+
+	:param engine: name of the engine, one of SOLVER_ENGINES
+	:return: None
+	:raise ValueError: raised if the engine is not one of SOLVER_ENGINES
+	"""
+	global _solver_engine
+
+	if engine not in SOLVER_ENGINES:
+		raise ValueError("Solver engine not recognised: '{}', it must be one of {}".format(engine, SOLVER_ENGINES))
+
+	_solver_engine = engine
+	logging.info("Solver engine set to '{}'".format(engine))
+
+
+def get_solver_engine() -> str:
+	"""
+	Gets the engine used by default to solve equations in solve_equation().
+
+	:return: name of the engine
+	"""
+	return _solver_engine
+
+
+def get_formula_labels(formula: dict, symbol_to_solve: str) -> tuple:
+	"""
+	Gets the labels of a formula and the parameter solved in the metrics (see the metrics module).
+
+	:param formula: a formula dict with an equation
+	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
+	:return: tuple (formula, unknown), where formula is its position in the formulae in use or "other"
+	"""
+	return state.get_state()['formula_labels'].get(formula['equation'], "other"), symbol_to_solve
+
+
+def _solve_equation_sympy(formula, symbol_to_solve: str, bike_geometry: BikeGeometry) -> list:
+	"""
+	Solves an equation with the sympy solver. See solve_equation() for more information.
+
+	:param formula: a formula dict with an equation
+	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
+	:param bike_geometry: the BikeGeometry
 	:return: list of possible solutions, [] if no solutions found
 	"""
-	equation = substitute_operators(formula['equation'])
+	equation = compile_equation(formula)
 
 	# replace parameters and the symbol_to_solve by x
 	equation = substitute_parameters(equation, formula['parameters'], symbol_to_solve, bike_geometry)
@@ -129,16 +242,111 @@ def solve_equation(formula, symbol_to_solve: str, bike_geometry: BikeGeometry, f
 	except Exception as e:
 		logging.error("There was an error solving the following equation for '{}': \n{}\n{}".format(
 			symbol_to_solve, equation, e))
+		if metrics.is_enabled():
+			metrics.SOLVE_ERRORS.inc(labels=get_formula_labels(formula, symbol_to_solve))
 		results = []
 
 	# logging.debug("   = " + str(results))
 
-	if force_constraints:
-		results = filter_by_constraints(results, symbol_to_solve, bike_geometry)
-
 	return results
 
 
+def _solve_equation_compiled(formula, symbol_to_solve: str, bike_geometry: BikeGeometry):
+	"""
+	Solves an equation with its compiled solutions. See solve_equation() for more information.
+
+	It returns None if the values of the BikeGeometry cannot be used as floats, so the caller can fall back to the
+	sympy solver.
+
+	:param formula: a formula dict with an equation
+	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
+	:param bike_geometry: the BikeGeometry
+	:return: list of possible solutions ([] if no solutions found) or None
+	"""
+	values = get_formula_values(formula, symbol_to_solve, bike_geometry)
+
+	if values is None:
+		return None
+
+	return compiled.solve_compiled(formula, symbol_to_solve, values)
+
+
+def _has_ranges(formula: dict, symbol_to_solve: str, bike_geometry: BikeGeometry) -> bool:
+	"""
+	Checks if any of the parameters of a formula, except the one to solve, has a range of values in the BikeGeometry.
+
+	:param formula: a formula dict with an equation
+	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
+	:param bike_geometry: the BikeGeometry
+	:return: bool, True if any of them is a range
+	"""
+	return any(isinstance(bike_geometry.get_parameter_value(param), list)
+		for param in formula['parameters'] if param != symbol_to_solve)
+
+
+def get_formula_values(formula: dict, symbol_to_solve: str, bike_geometry: BikeGeometry):
+	"""
+	Gets the float values of the parameters of a formula, except the one to solve, to evaluate its compiled solutions.
+	Ranges are lists with all their values, which the compiled solutions solve at once (see compiled.solve_ranges()).
+
+	:param formula: a formula dict with an equation
+	:param symbol_to_solve: name of the GeometryParameter to solve the equation for
+	:param bike_geometry: the BikeGeometry
+	:return: dict with the values (float or list of floats) keyed by parameter name, or None if a value cannot be used
+		as a float
+	"""
+	values = {}
+
+	for param in formula['parameters']:
+		if param != symbol_to_solve:
+			bike_p = bike_geometry.get_parameter_value(param)
+
+			try:
+				values[param] = float(bike_p) if not isinstance(bike_p, list) else [float(x) for x in bike_p]
+			except (ValueError, TypeError):
+				return None
+
+	return values
+
+
+def build_equation_index() -> dict:
+	"""
+	Builds the caches of the equations module for every GeometryParameter used in the formulae in use.
+	The caches are filled lazily anyway, but building them in advance avoids paying for it in the first request
+	(e.g. when warming up a server before forking its workers).
+
+	:return: dict with the list of equations for each GeometryParameter name
+	"""
+	validation_state = state.get_state()
+
+	for formula in validation_state['formulae']:
+		compile_equation(formula)
+
+		for parameter_name in formula['parameters']:
+			get_equations(parameter_name)
+
+	return validation_state['equation_index']
+
+
+def compile_equation(formula: dict) -> str:
+	"""
+	Gets the equation of a formula with its operators substituted (see substitute_operators()).
+	The result is cached, as the operators of an equation never change.
+
+	:param formula: a formula dict with an equation
+	:return: equation as a string
+	"""
+	compiled_equations = state.get_state()['compiled_equations']
+
+	try:
+		return compiled_equations[formula['equation']]
+
+	except KeyError:
+		equation = substitute_operators(formula['equation'])
+		compiled_equations[formula['equation']] = equation
+		return equation
+
+
 def substitute_operators(equation):
 	"""
 	Substitutes the operators in an equation (e.g. TAN for sympy.tan).
@@ -176,7 +384,9 @@ def substitute_parameters(equation, parameter_list: list, symbol_to_solve: str,
 	else:
 		equation = equation.replace("{" + symbol_to_solve + "}", UNKNOWN_PARAMETER)
 
-		# substitute parameters
+		# substitute parameters, ranges use their first value, as solving the equation for each of their values would
+		# multiply the calls to the sympy solver. solve_equation() only gets here with ranges for the formulae without
+		# compiled solutions, the rest solve all the values at once (see compiled.solve_ranges())
 		for param in parameter_list:
 			bike_p = bike_geometry.get_parameter_value(param)
 			equation = equation.replace("{" + param + "}", str(bike_p) if not isinstance(bike_p, list) else str(bike_p[0]))
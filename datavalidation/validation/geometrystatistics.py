@@ -0,0 +1,547 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+geometrystatistics
+----------------------------------
+
+Module to recompute the geometry statistics (the mean and median of each parameter, see GEOMETRY_STATISTICS) from
+large dumps of bike geometries in one streaming pass with bounded memory. The mean is kept with running moments and
+the median with a KLL quantile sketch, and both can be merged, so the shards of a dump can be processed in parallel
+and merged afterwards.
+
+The statistics are written to a versioned statistics file, which the constraints module loads at start-up::
+
+	datavalidation statistics dump.jsonl -o statistics.json
+
+	# or process the shards in parallel (in several processes or machines), then merge their states
+	datavalidation statistics shard1.jsonl --state shard1.state.json
+	datavalidation statistics shard2.jsonl --state shard2.state.json
+	datavalidation statistics --merge shard1.state.json shard2.state.json -o statistics.json
+
+The dumps are JSON lines files with a geometry per line (as in the requests, with a "parameter_list", or a dict of
+parameters) or CSV files with a column per parameter.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import csv
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import multiprocessing
+
+
+# version of the format of the statistics file, change it if the structure of the file changes
+STATISTICS_FORMAT = 1
+
+# default location of the statistics file, under the root of the package
+STATISTICS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "statistics.json")
+
+# size of the largest compactor of the KLL sketches, the rank error is around 1.7 / K
+SKETCH_K = 200
+
+
+class RunningMoments:
+	"""
+	Count, mean and sum of squared differences from the mean of a stream of values (Welford's algorithm). Two
+	RunningMoments can be merged (Chan et al.).
+	"""
+
+	def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+		self.count = count
+		self.mean = mean
+		self.m2 = m2
+
+	def add(self, value: float):
+		"""
+		Adds a value.
+
+		:param value: float
+		:return: None
+		"""
+		self.count += 1
+		delta = value - self.mean
+		self.mean += delta / self.count
+		self.m2 += delta * (value - self.mean)
+
+	def merge(self, other: "RunningMoments"):
+		"""
+		Merges another RunningMoments into this one.
+
+		:param other: RunningMoments
+		:return: None
+		"""
+		count = self.count + other.count
+
+		if count == 0:
+			return
+
+		delta = other.mean - self.mean
+		self.mean += delta * other.count / count
+		self.m2 += other.m2 + delta * delta * self.count * other.count / count
+		self.count = count
+
+	@property
+	def std(self) -> float:
+		"""
+		Gets the (population) standard deviation of the values.
+
+		:return: float
+		"""
+		return math.sqrt(self.m2 / self.count) if self.count > 0 else 0.0
+
+	def to_dict(self) -> dict:
+		"""
+		Returns the RunningMoments as a dict, ready to be serialised as JSON.
+
+		:return: dict
+		"""
+		return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+	@classmethod
+	def from_dict(cls, json_dict: dict):
+		"""
+		Creates a RunningMoments from a dict of to_dict().
+
+		:param json_dict: dict
+		:return: RunningMoments
+		"""
+		return cls(json_dict['count'], json_dict['mean'], json_dict['m2'])
+
+
+class KLLSketch:
+	"""
+	KLL quantile sketch (Karnin, Lang and Liberty, 2016). It keeps a hierarchy of compactors, where each item of level
+	h stands for 2^h values of the stream. When a level is full, it is sorted and every other item (starting at random)
+	is promoted to the next level. The memory used is O(k) regardless of the number of values and two sketches can be
+	merged level by level.
+
+	:param k: size of the largest compactor, default is SKETCH_K
+	:param seed: seed of the random compactions, default is None
+	"""
+
+	# ratio between the capacities of consecutive levels
+	_C = 2 / 3
+
+	def __init__(self, k: int = SKETCH_K, seed=None):
+		self.k = k
+		self.count = 0
+		self.compactors = [[]]
+		self._size = 0
+		self._max_size = 0
+		self._random = random.Random(seed)
+		self._update_max_size()
+
+	def add(self, value: float):
+		"""
+		Adds a value.
+
+		:param value: float
+		:return: None
+		"""
+		self.compactors[0].append(value)
+		self.count += 1
+		self._size += 1
+
+		if self._size >= self._max_size:
+			self._compress()
+
+	def merge(self, other: "KLLSketch"):
+		"""
+		Merges another KLLSketch into this one.
+
+		:param other: KLLSketch
+		:return: None
+		"""
+		while len(self.compactors) < len(other.compactors):
+			self.compactors.append([])
+
+		self._update_max_size()
+
+		for level, compactor in enumerate(other.compactors):
+			self.compactors[level].extend(compactor)
+
+		self.count += other.count
+		self._size = sum(len(compactor) for compactor in self.compactors)
+
+		while self._size >= self._max_size:
+			self._compress()
+
+	def quantile(self, q: float):
+		"""
+		Gets the approximate quantile of the values.
+
+		:param q: quantile, from 0 to 1 (e.g. 0.5 for the median)
+		:return: float or None if the sketch is empty
+		"""
+		items = sorted((item, 1 << level) for level, compactor in enumerate(self.compactors) for item in compactor)
+
+		if len(items) == 0:
+			return None
+
+		total = sum(weight for _, weight in items)
+		cumulative = 0
+
+		for item, weight in items:
+			cumulative += weight
+			if cumulative >= q * total:
+				return item
+
+		return items[-1][0]
+
+	def to_dict(self) -> dict:
+		"""
+		Returns the KLLSketch as a dict, ready to be serialised as JSON.
+
+		:return: dict
+		"""
+		return {"k": self.k, "count": self.count, "compactors": self.compactors}
+
+	@classmethod
+	def from_dict(cls, json_dict: dict, seed=None):
+		"""
+		Creates a KLLSketch from a dict of to_dict().
+
+		:param json_dict: dict
+		:param seed: seed of the random compactions, default is None
+		:return: KLLSketch
+		"""
+		sketch = cls(json_dict['k'], seed)
+		sketch.count = json_dict['count']
+		sketch.compactors = [list(compactor) for compactor in json_dict['compactors']] or [[]]
+		sketch._size = sum(len(compactor) for compactor in sketch.compactors)
+		sketch._update_max_size()
+		return sketch
+
+	def _capacity(self, level: int) -> int:
+		"""
+		Helper function that gets the capacity of a level, which decreases geometrically from the top level.
+
+		:param level: level of the compactor
+		:return: int
+		"""
+		return max(2, int(math.ceil(self.k * self._C ** (len(self.compactors) - level - 1))))
+
+	def _update_max_size(self):
+		# the sketch is compressed when it holds as many items as all its levels can
+		self._max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+	def _compress(self):
+		"""
+		Helper function that compacts the lowest full level into the next one.
+
+		:return: None
+		"""
+		for level in range(len(self.compactors)):
+			if len(self.compactors[level]) >= self._capacity(level):
+				if level + 1 == len(self.compactors):
+					self.compactors.append([])
+					self._update_max_size()
+
+				compactor = sorted(self.compactors[level])
+				# an odd item out stays in the level
+				self.compactors[level] = [compactor.pop()] if len(compactor) % 2 == 1 else []
+				self.compactors[level + 1].extend(compactor[self._random.randint(0, 1)::2])
+
+				self._size = sum(len(compactor) for compactor in self.compactors)
+				if self._size < self._max_size:
+					break
+
+
+class StatisticsAccumulator:
+	"""
+	Accumulates the running moments and quantile sketch of each parameter of a stream of bike geometries.
+
+	:param parameter_list: names of the parameters to accumulate, default is None for all the numeric ones
+	:param k: size of the KLL sketches, default is SKETCH_K
+	:param seed: seed of the KLL sketches, default is None
+	"""
+
+	def __init__(self, parameter_list: list = None, k: int = SKETCH_K, seed=None):
+		self.parameter_list = set(parameter_list) if parameter_list is not None else None
+		self.k = k
+		self.seed = seed
+		self.moments = {}
+		self.sketches = {}
+		self.geometries = 0
+
+	def add_geometry(self, parameter_dict: dict):
+		"""
+		Adds the values of a bike geometry. Every value of a range is added. Values that are not numbers are ignored.
+
+		:param parameter_dict: dict with the value of each parameter
+		:return: None
+		"""
+		self.geometries += 1
+
+		for name, value in parameter_dict.items():
+			if self.parameter_list is not None and name not in self.parameter_list:
+				continue
+
+			for number in _get_numbers(value):
+				if name not in self.moments:
+					self.moments[name] = RunningMoments()
+					self.sketches[name] = KLLSketch(self.k, self.seed)
+
+				self.moments[name].add(number)
+				self.sketches[name].add(number)
+
+	def merge(self, other: "StatisticsAccumulator"):
+		"""
+		Merges another StatisticsAccumulator into this one (e.g. of another shard of the dump).
+
+		:param other: StatisticsAccumulator
+		:return: None
+		"""
+		self.geometries += other.geometries
+
+		for name in other.moments:
+			if name not in self.moments:
+				self.moments[name] = RunningMoments()
+				self.sketches[name] = KLLSketch(self.k, self.seed)
+
+			self.moments[name].merge(other.moments[name])
+			self.sketches[name].merge(other.sketches[name])
+
+	def get_statistics(self) -> dict:
+		"""
+		Gets the statistics of each parameter, in the format of GEOMETRY_STATISTICS.
+
+		:return: dict with the "mean" and "median" of each parameter
+		"""
+		return {
+			name: {"mean": self.moments[name].mean, "median": self.sketches[name].quantile(0.5)}
+			for name in sorted(self.moments)
+		}
+
+	def to_dict(self) -> dict:
+		"""
+		Returns the state of the StatisticsAccumulator as a dict, ready to be serialised as JSON and merged later.
+
+		:return: dict
+		"""
+		return {
+			"format": STATISTICS_FORMAT,
+			"geometries": self.geometries,
+			"parameters": {
+				name: {"moments": self.moments[name].to_dict(), "sketch": self.sketches[name].to_dict()}
+				for name in sorted(self.moments)
+			}
+		}
+
+	@classmethod
+	def from_dict(cls, json_dict: dict, seed=None):
+		"""
+		Creates a StatisticsAccumulator from a state of to_dict().
+
+		:param json_dict: dict
+		:param seed: seed of the KLL sketches, default is None
+		:return: StatisticsAccumulator
+		:raise ValueError: raised if the state has a different format
+		"""
+		if json_dict.get("format") != STATISTICS_FORMAT:
+			raise ValueError("state format '{}' does not match '{}'".format(json_dict.get("format"), STATISTICS_FORMAT))
+
+		accumulator = cls(seed=seed)
+		accumulator.geometries = json_dict['geometries']
+
+		for name, parameter in json_dict['parameters'].items():
+			accumulator.moments[name] = RunningMoments.from_dict(parameter['moments'])
+			accumulator.sketches[name] = KLLSketch.from_dict(parameter['sketch'], seed)
+			accumulator.k = accumulator.sketches[name].k
+
+		return accumulator
+
+
+def accumulate_file(filepath: str, accumulator: StatisticsAccumulator = None) -> StatisticsAccumulator:
+	"""
+	Accumulates the bike geometries of a dump file, reading it line by line.
+
+	:param filepath: path of a JSON lines or CSV (by its extension) file
+	:param accumulator: StatisticsAccumulator to add the geometries to, default is None for a new one
+	:return: the StatisticsAccumulator
+	"""
+	accumulator = accumulator if accumulator is not None else StatisticsAccumulator()
+
+	for parameter_dict in read_geometries(filepath):
+		accumulator.add_geometry(parameter_dict)
+
+	return accumulator
+
+
+def read_geometries(filepath: str):
+	"""
+	Reads the bike geometries of a dump file one at a time.
+
+	:param filepath: path of a JSON lines or CSV (by its extension) file
+	:return: generator of dicts with the value of each parameter
+	"""
+	with open(filepath, newline="") as dump_file:
+		if filepath.endswith(".csv"):
+			yield from csv.DictReader(dump_file)
+			return
+
+		for line_number, line in enumerate(dump_file, 1):
+			if line.strip() == "":
+				continue
+
+			try:
+				geometry = json.loads(line)
+			except ValueError as e:
+				logging.warning("Line {} of '{}' skipped: {}".format(line_number, filepath, e))
+				continue
+
+			if "parameter_list" in geometry:
+				yield {parameter['p']: parameter.get("v") for parameter in geometry['parameter_list']}
+			else:
+				yield geometry
+
+
+def build_statistics_file(statistics: dict, geometries: int = None) -> dict:
+	"""
+	Builds the content of a versioned statistics file. The version is a hash of the statistics, so the same statistics
+	always get the same version.
+
+	:param statistics: dict with the "mean" and "median" of each parameter
+	:param geometries: number of bike geometries the statistics were computed from, default is None
+	:return: dict, ready to be serialised as JSON
+	"""
+	content = json.dumps(statistics, sort_keys=True)
+
+	return {
+		"format": STATISTICS_FORMAT,
+		"version": hashlib.sha1(content.encode("utf-8")).hexdigest()[:12],
+		"created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+		"geometries": geometries,
+		"statistics": statistics
+	}
+
+
+def save_statistics_file(filepath: str, statistics: dict, geometries: int = None) -> dict:
+	"""
+	Saves the statistics to a versioned statistics file.
+
+	:param filepath: path of the statistics file
+	:param statistics: dict with the "mean" and "median" of each parameter
+	:param geometries: number of bike geometries the statistics were computed from, default is None
+	:return: the content of the file saved
+	"""
+	statistics_file = build_statistics_file(statistics, geometries)
+
+	# write and rename, so a process loading the file never reads half of it
+	temporary_path = filepath + ".tmp"
+	with open(temporary_path, "w") as json_file:
+		json.dump(statistics_file, json_file, indent="\t")
+
+	os.replace(temporary_path, filepath)
+
+	logging.info("Statistics saved to '{}' (version {})".format(filepath, statistics_file['version']))
+	return statistics_file
+
+
+def read_statistics_file(filepath: str = STATISTICS_FILE) -> dict:
+	"""
+	Reads a versioned statistics file.
+
+	:param filepath: path of the statistics file, default is STATISTICS_FILE
+	:return: the content of the file, with its "version" and "statistics"
+	:raise ValueError: raised if the file has a different format or its statistics have no mean or median
+	"""
+	with open(filepath) as json_file:
+		statistics_file = json.load(json_file)
+
+	if statistics_file.get("format") != STATISTICS_FORMAT:
+		raise ValueError("statistics format '{}' does not match '{}'".format(
+			statistics_file.get("format"), STATISTICS_FORMAT))
+
+	for name, parameter_statistics in statistics_file['statistics'].items():
+		if not isinstance(parameter_statistics.get("mean"), (int, float)) or \
+				not isinstance(parameter_statistics.get("median"), (int, float)):
+			raise ValueError("statistics of '{}' have no mean or median".format(name))
+
+	return statistics_file
+
+
+def _get_numbers(value) -> list:
+	"""
+	Helper function that gets the finite float values of a parameter value, which can be a range (a list or a string
+	like "170/175").
+
+	:param value: value of a parameter
+	:return: list of floats, [] if it is not a number
+	"""
+	if isinstance(value, str) and "/" in value:
+		value = value.split("/")
+
+	value_list = value if isinstance(value, list) else [value]
+	numbers = []
+
+	for x in value_list:
+		if isinstance(x, bool):
+			continue
+
+		try:
+			x = float(x)
+		except (ValueError, TypeError):
+			continue
+
+		if math.isfinite(x):
+			numbers.append(x)
+
+	return numbers
+
+
+def compute_statistics(filepath_list: list, output: str = None, state: str = None, merge: bool = False,
+		parameter_list: list = None, workers: int = 1, k: int = SKETCH_K, seed=0) -> StatisticsAccumulator:
+	"""
+	Computes the statistics of dump files, in parallel if more than one worker is given, and saves them.
+
+	:param filepath_list: list of paths of JSON lines or CSV dumps (or of states of accumulators if merge is True)
+	:param output: path of the statistics file to write, default is None for STATISTICS_FILE unless a state is written
+	:param state: path to write the state of the accumulator to merge it later, default is None to not write it
+	:param merge: whether the files are states of accumulators to merge instead of dumps, default is False
+	:param parameter_list: names of the parameters to compute the statistics of, default is None for all of them
+	:param workers: number of processes reading the dumps, default is 1
+	:param k: size of the quantile sketches, default is SKETCH_K
+	:param seed: seed of the quantile sketches, default is 0
+	:return: the StatisticsAccumulator with all the dumps
+	"""
+	if merge:
+		state_list = []
+		for state_path in filepath_list:
+			with open(state_path) as state_file:
+				state_list.append(json.load(state_file))
+
+	elif workers > 1:
+		with multiprocessing.Pool(workers) as pool:
+			state_list = pool.map(_accumulate_file_state,
+				[(filepath, parameter_list, k, seed) for filepath in filepath_list])
+
+	else:
+		state_list = [_accumulate_file_state((filepath, parameter_list, k, seed)) for filepath in filepath_list]
+
+	result = StatisticsAccumulator(parameter_list, k, seed)
+	for accumulator_state in state_list:
+		result.merge(StatisticsAccumulator.from_dict(accumulator_state, seed))
+
+	if state is not None:
+		with open(state, "w") as state_file:
+			json.dump(result.to_dict(), state_file)
+
+	if output is not None or state is None:
+		save_statistics_file(output if output is not None else STATISTICS_FILE, result.get_statistics(),
+			result.geometries)
+
+	return result
+
+
+def _accumulate_file_state(arguments: tuple) -> dict:
+	# helper for the worker processes, the state is returned as a dict as it is pickled back
+	filepath, parameter_list, k, seed = arguments
+	return accumulate_file(filepath, StatisticsAccumulator(parameter_list, k, seed)).to_dict()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+leastsquares
+----------------------------------
+
+Module that fits all the GeometryParameters of a BikeGeometry to VALIDATION_FORMULAE at once, as a single nonlinear
+least-squares problem, instead of solving each formula for each parameter with sympy.
+
+The residuals of the problem are:
+
+- The residual of each formula whose parameters have values (see compiled.get_residual_function()), scaled by the
+  size of its values, so every formula has a similar weight.
+- The adjustment of each parameter given in the BikeGeometry, relative to its value, through a Cauchy loss. The loss
+  grows slowly for large adjustments, so a wrong parameter (e.g. a typo) takes the adjustment instead of spreading it
+  across the rest.
+
+Missing parameters are free, they start from a root of one of their formulae found numerically. The problem is
+minimised with a Levenberg-Marquardt solver written in plain Python, as each geometry has a handful of parameters.
+Inconsistent geometries are fitted again starting from each adjusted parameter recalculated from its formulae, as a
+large error can otherwise end in a local minimum.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import math
+import logging
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core import metrics
+from datavalidation.core.tracing import traced
+from . import compiled, state
+from .constraints import filter_by_constraints
+
+
+# relative size of the formula residuals against the parameter adjustments (smaller gives more weight to the formulae)
+FORMULA_TOLERANCE = 1e-4
+# relative adjustment of a parameter from which the Cauchy loss grows slower than the squared adjustment
+ADJUSTMENT_TOLERANCE = 0.01
+
+# values where the roots of a formula are searched when initialising a missing parameter (geometric grid)
+ROOT_SEARCH_RANGE = (0.1, 5000.0)
+ROOT_SEARCH_POINTS = 400
+ROOT_BISECTIONS = 60
+
+
+@traced()
+@metrics.timed("fit_bike_geometry")
+def fit_bike_geometry(bike_geometry: BikeGeometry, formula_list: list = None) -> dict:
+	"""
+	Fits the parameters of a BikeGeometry to the formulae. It does not modify the BikeGeometry.
+
+	Formulae that cannot be evaluated with the values given (e.g. the square root of a negative number) are not fitted.
+
+	:param bike_geometry: the BikeGeometry, normalised
+	:param formula_list: list of formulae, default is None for the formulae in use
+	:return: dict with the "observed" values of the parameters given, the "fitted" values of every parameter fitted
+		(including the missing ones), the scaled "residuals" of the formulae fitted that use each parameter, the
+		"formulae" fitted, the least-squares "cost" and the "iterations" of the solver
+	"""
+	formula_list = formula_list if formula_list is not None else state.get_state()['formulae']
+	observed = _get_observed_values(bike_geometry, formula_list)
+	values = dict(observed)
+	formula_list = [formula for formula in formula_list if _can_evaluate(formula, values)]
+
+	# initialise the missing parameters of the formulae where they are the only unknown, until no more can be
+	change_flag = True
+	while change_flag:
+		change_flag = False
+
+		for formula in formula_list:
+			unknown_list = [param for param in formula['parameters'] if param not in values]
+
+			if len(unknown_list) == 1:
+				value = _initialise_parameter(formula, unknown_list[0], values, bike_geometry)
+
+				if value is not None:
+					values[unknown_list[0]] = value
+					change_flag = True
+
+	fitted_formulae = [formula for formula in formula_list if all(param in values for param in formula['parameters'])]
+	names = sorted({param for formula in fitted_formulae for param in formula['parameters']})
+
+	result = {
+		"observed": observed,
+		"fitted": {},
+		"residuals": {},
+		"formulae": fitted_formulae,
+		"cost": 0.0,
+		"iterations": 0
+	}
+
+	if len(names) == 0:
+		return result
+
+	# each parameter is fitted as the logarithm of its ratio to its initial value, so it stays positive and its
+	# adjustments are relative, and each formula is scaled by the size of its values
+	scales = [values[name] for name in names]
+	formula_scales = [max(sum(abs(values[param]) for param in formula['parameters']) /
+		len(formula['parameters']), 1.0) for formula in fitted_formulae]
+	functions = [compiled.get_residual_function(formula) for formula in fitted_formulae]
+	indexes = [[names.index(param) for param in formula['parameters']] for formula in fitted_formulae]
+	observed_indexes = [i for i, name in enumerate(names) if name in observed]
+
+	def residual_function(x: list) -> list:
+		residuals = []
+
+		for function, index_list, formula_scale in zip(functions, indexes, formula_scales):
+			residual = function(*[scales[i] * math.exp(x[i]) for i in index_list])
+			residuals.append(residual / formula_scale / FORMULA_TOLERANCE)
+
+		for i in observed_indexes:
+			# the square root of the Cauchy loss, with the sign of the adjustment so it is smooth at 0
+			adjustment = x[i] / ADJUSTMENT_TOLERANCE
+			residuals.append(math.copysign(math.sqrt(math.log1p(adjustment * adjustment)), adjustment))
+
+		return residuals
+
+	x, cost, result['iterations'] = levenberg_marquardt(residual_function, [0.0] * len(names))
+
+	if not math.isfinite(cost):
+		# the formulae cannot be evaluated with the initial values, so nothing is fitted
+		logging.debug("The parameters could not be fitted to {} formulae".format(len(fitted_formulae)))
+		result['formulae'] = []
+		return result
+
+	result['cost'] = cost
+
+	# a large error in a parameter used by several formulae (e.g. a missing digit) can leave the solver in a local
+	# minimum where the rest of parameters take the adjustment, so it is restarted with each adjusted parameter
+	# initialised from a root of its formulae instead, keeping the fit with the lowest cost
+	if any(abs(x[i]) > ADJUSTMENT_TOLERANCE for i in observed_indexes):
+		# the parameters in more inconsistent formulae are more likely to be wrong, so they are tried first
+		inconsistent = [formula for formula, function, index_list, formula_scale in zip(fitted_formulae, functions,
+			indexes, formula_scales) if _get_scaled_residual(function, [scales[i] for i in index_list], formula_scale)
+			> FORMULA_TOLERANCE]
+		candidates = sorted(observed_indexes, key=lambda i: -sum(names[i] in f['parameters'] for f in inconsistent))
+
+		for i in candidates:
+			if not any(names[i] in formula['parameters'] for formula in inconsistent):
+				break
+
+			restart_values = dict(observed)
+			del restart_values[names[i]]
+			# the geometry constraints are not checked, as they use the values that may be wrong
+			root = next((root for root in (_initialise_parameter(formula, names[i], restart_values)
+				for formula in fitted_formulae if names[i] in formula['parameters']) if root is not None), None)
+
+			if root is None or abs(math.log(root / scales[i])) <= ADJUSTMENT_TOLERANCE:
+				continue
+
+			x0 = [0.0] * len(names)
+			x0[i] = math.log(root / scales[i])
+
+			try:
+				restart_x, restart_cost, iterations = levenberg_marquardt(residual_function, x0)
+			except (ValueError, ZeroDivisionError, OverflowError):
+				continue
+
+			result['iterations'] += iterations
+			if restart_cost < result['cost']:
+				x, result['cost'] = restart_x, restart_cost
+
+				# stop when the rest of parameters barely changed, as this parameter explains the inconsistencies
+				if all(abs(x[j]) <= ADJUSTMENT_TOLERANCE for j in observed_indexes if j != i):
+					break
+
+	fitted = [scale * math.exp(value) for scale, value in zip(scales, x)]
+	result['fitted'] = dict(zip(names, fitted))
+
+	for function, index_list, formula_scale, formula in zip(functions, indexes, formula_scales, fitted_formulae):
+		residual = _get_scaled_residual(function, [fitted[i] for i in index_list], formula_scale)
+
+		for param in formula['parameters']:
+			result['residuals'][param] = max(result['residuals'].get(param, 0.0), residual)
+
+	return result
+
+
+def levenberg_marquardt(function, x0: list, max_iterations: int = 100, tolerance: float = 1e-12) -> tuple:
+	"""
+	Minimises the sum of squares of a vector function with the Levenberg-Marquardt algorithm. The Jacobian is
+	approximated with forward differences.
+
+	Steps where the function cannot be evaluated (it raises ValueError, ZeroDivisionError or OverflowError) are
+	rejected as if they increased the cost, and it stops where the Jacobian cannot be approximated. If the function
+	cannot be evaluated at x0, it returns x0 with an infinite cost.
+
+	:param function: function that takes a list of floats and returns a list of float residuals
+	:param x0: initial values
+	:param max_iterations: maximum number of iterations, default is 100
+	:param tolerance: relative decrease of the cost under which it stops, default is 1e-12
+	:return: tuple (list of values, cost, number of iterations)
+	"""
+	x = list(x0)
+
+	try:
+		residuals = function(x)
+		cost = sum(r * r for r in residuals)
+	except (ValueError, ZeroDivisionError, OverflowError):
+		return x, math.inf, 0
+
+	damping = 1e-3
+	iterations = 0
+
+	while iterations < max_iterations and cost > 0:
+		iterations += 1
+
+		try:
+			jacobian = _get_jacobian(function, x, residuals)
+		except (ValueError, ZeroDivisionError, OverflowError):
+			break
+
+		# normal equations: (J^T J + damping * diag(J^T J)) step = -J^T r
+		n = len(x)
+		jtj = [[sum(row[i] * row[j] for row in jacobian) for j in range(n)] for i in range(n)]
+		jtr = [sum(row[i] * r for row, r in zip(jacobian, residuals)) for i in range(n)]
+
+		improved = False
+		while damping < 1e12:
+			matrix = [[jtj[i][j] + (damping * (jtj[i][i] + 1e-9) if i == j else 0) for j in range(n)] for i in range(n)]
+			step = _solve_linear_system(matrix, [-value for value in jtr])
+
+			if step is not None:
+				new_x = [value + delta for value, delta in zip(x, step)]
+
+				try:
+					new_residuals = function(new_x)
+					new_cost = sum(r * r for r in new_residuals)
+				except (ValueError, ZeroDivisionError, OverflowError):
+					new_cost = math.inf
+
+				if new_cost < cost:
+					improved = True
+					damping = max(damping / 10, 1e-12)
+					break
+
+			damping *= 10
+
+		if not improved:
+			break
+
+		decrease = cost - new_cost
+		x, residuals, cost = new_x, new_residuals, new_cost
+
+		if decrease <= tolerance * max(cost, 1e-300):
+			break
+
+	return x, cost, iterations
+
+
+def _get_jacobian(function, x: list, residuals: list) -> list:
+	"""
+	Helper function that approximates the Jacobian of a vector function with forward differences.
+
+	:param function: function that takes a list of floats and returns a list of floats
+	:param x: values where the Jacobian is approximated
+	:param residuals: function(x)
+	:return: Jacobian as a list of rows (one per residual)
+	:raise ValueError: raised (or ZeroDivisionError or OverflowError) if the function cannot be evaluated on either side
+		of a value
+	"""
+	columns = []
+
+	for i in range(len(x)):
+		step = 1e-7 * max(abs(x[i]), 1.0)
+		shifted = list(x)
+		shifted[i] += step
+
+		try:
+			shifted_residuals = function(shifted)
+		except (ValueError, ZeroDivisionError, OverflowError):
+			# e.g. at the edge of a square root, try the other side
+			shifted[i] = x[i] - step
+			step = -step
+			shifted_residuals = function(shifted)
+
+		columns.append([(new - old) / step for new, old in zip(shifted_residuals, residuals)])
+
+	return [list(row) for row in zip(*columns)]
+
+
+def _solve_linear_system(matrix: list, vector: list):
+	"""
+	Helper function that solves a linear system with Gaussian elimination and partial pivoting.
+
+	:param matrix: square matrix as a list of rows, it is modified
+	:param vector: right-hand side
+	:return: list with the solution, None if the matrix is singular
+	"""
+	n = len(vector)
+	augmented = [row + [value] for row, value in zip(matrix, vector)]
+
+	for column in range(n):
+		pivot = max(range(column, n), key=lambda r: abs(augmented[r][column]))
+		if abs(augmented[pivot][column]) < 1e-300:
+			return None
+
+		augmented[column], augmented[pivot] = augmented[pivot], augmented[column]
+
+		for row in range(column + 1, n):
+			factor = augmented[row][column] / augmented[column][column]
+			if factor != 0:
+				for j in range(column, n + 1):
+					augmented[row][j] -= factor * augmented[column][j]
+
+	solution = [0.0] * n
+	for row in reversed(range(n)):
+		solution[row] = (augmented[row][n] - sum(augmented[row][j] * solution[j] for j in range(row + 1, n))) / \
+			augmented[row][row]
+
+	return solution
+
+
+def _get_scaled_residual(function, values: list, formula_scale: float) -> float:
+	"""
+	Helper function that gets the absolute residual of a formula scaled by the size of its values.
+
+	:param function: residual function of the formula (see compiled.get_residual_function())
+	:param values: list of float values of the parameters of the formula
+	:param formula_scale: scale of the formula
+	:return: float, 1.0 if the formula cannot be evaluated with the values given
+	"""
+	try:
+		return abs(function(*values)) / formula_scale
+	except (ValueError, ZeroDivisionError, OverflowError):
+		return 1.0
+
+
+def _get_observed_values(bike_geometry: BikeGeometry, formula_list: list) -> dict:
+	"""
+	Helper function that gets the float values of the parameters of the formulae given in the BikeGeometry.
+	Ranges use their first value, like in equations.substitute_parameters().
+
+	:param bike_geometry: the BikeGeometry
+	:param formula_list: list of formulae
+	:return: dict with the float value of each parameter, those without a value or not a number are skipped
+	"""
+	observed = {}
+
+	for param in {param for formula in formula_list for param in formula['parameters']}:
+		value = bike_geometry.get_parameter_value(param)
+
+		try:
+			value = float(value) if not isinstance(value, list) else float(value[0])
+		except (ValueError, TypeError, IndexError):
+			continue
+
+		if value > 0:
+			observed[param] = value
+
+	return observed
+
+
+def _can_evaluate(formula: dict, values: dict) -> bool:
+	"""
+	Helper function that checks if the residual of a formula can be evaluated with the values given. Formulae with
+	missing values can always be evaluated, as their missing parameters are searched.
+
+	:param formula: a formula dict with an equation
+	:param values: dict with the float values of the parameters
+	:return: bool
+	"""
+	if any(param not in values for param in formula['parameters']):
+		return True
+
+	try:
+		return math.isfinite(compiled.get_residual_function(formula)(*[values[p] for p in formula['parameters']]))
+	except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+		return False
+
+
+def _initialise_parameter(formula: dict, parameter_name: str, values: dict, bike_geometry: BikeGeometry = None):
+	"""
+	Helper function that finds a root of a formula for a missing parameter, searching for sign changes of its residual
+	in a geometric grid and bisecting them. When there are several roots that satisfy the geometry constraints, it
+	takes the closest one to the mean of the parameter in GEOMETRY_STATISTICS (or to the mean of the formula values).
+
+	:param formula: a formula dict with an equation
+	:param parameter_name: name of the missing parameter
+	:param values: dict with the float values of the rest of the parameters of the formula
+	:param bike_geometry: the BikeGeometry, used to check the geometry constraints, default is None to not check them
+	:return: float or None if no root was found
+	"""
+	function = compiled.get_residual_function(formula)
+	position = formula['parameters'].index(parameter_name)
+	arguments = [values.get(param) for param in formula['parameters']]
+
+	def residual(value: float):
+		arguments[position] = value
+		try:
+			result = function(*arguments)
+			return result if isinstance(result, float) and math.isfinite(result) else None
+		except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+			return None
+
+	low, high = ROOT_SEARCH_RANGE
+	ratio = (high / low) ** (1 / (ROOT_SEARCH_POINTS - 1))
+	grid = [low * ratio ** i for i in range(ROOT_SEARCH_POINTS)]
+	roots = []
+	previous_value, previous_residual = None, None
+
+	for value in grid:
+		current_residual = residual(value)
+
+		if current_residual == 0:
+			roots.append(value)
+
+		elif previous_residual is not None and current_residual is not None and \
+				(previous_residual < 0) != (current_residual < 0):
+			a, b, residual_a = previous_value, value, previous_residual
+
+			for _ in range(ROOT_BISECTIONS):
+				middle = (a + b) / 2
+				residual_middle = residual(middle)
+				if residual_middle is None:
+					break
+				if (residual_middle < 0) == (residual_a < 0):
+					a, residual_a = middle, residual_middle
+				else:
+					b = middle
+
+			# skip discontinuities (e.g. TAN), which change sign without a root
+			root = (a + b) / 2
+			root_residual = residual(root)
+			if root_residual is not None and abs(root_residual) <= 1e-6 * max(abs(previous_residual),
+					abs(current_residual), 1.0):
+				roots.append(root)
+
+		previous_value, previous_residual = value, current_residual
+
+	if bike_geometry is not None:
+		roots = filter_by_constraints(roots, parameter_name, bike_geometry)
+
+	if len(roots) == 0:
+		logging.debug("No root found to initialise '{}' with: {}".format(parameter_name, formula['equation']))
+		return None
+
+	statistics = state.get_state()['statistics']
+
+	if parameter_name in statistics:
+		target = statistics[parameter_name]['mean']
+	else:
+		known = [values[param] for param in formula['parameters'] if param != parameter_name]
+		target = sum(known) / len(known)
+
+	return min(roots, key=lambda root: abs(root - target))
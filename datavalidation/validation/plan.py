@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+plan
+----------------------------------
+
+Module with the validation plans. The equations used to calculate or validate each GeometryParameter only depend on
+which parameters of the formulae have a value (see equations.get_equations()), so they are worked out once for each
+combination of present parameters (a bitmask over get_plan_parameters()) and cached. Later BikeGeometries with the same
+shape reuse the cached ValidationPlan instead of filtering the equations again.
+
+Example usage::
+
+	>> validation_plan = get_plan(bike_geometry)
+	>> validation_plan.get_equations("chainstay")
+	[{"equation": "...", "parameters": [...]}]
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import threading
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core import metrics
+from . import derived, state
+from .equations import get_equations
+from .formulae import VALIDATION_FORMULAE
+from ..core.constants import VALIDATABLE_PARAMETER_LIST
+
+
+# key of the plan of BikeGeometries without any parameter, get_equations() does not filter the equations for them
+EMPTY_GEOMETRY = -1
+
+# maximum number of cached plans, the cache is emptied when it is full
+MAX_PLANS = 1024
+
+PLAN_CACHE = metrics.get_counter("datavalidation_plan_cache_total", "Lookups of the validation plans", ["result"])
+
+_lock = threading.Lock()
+
+
+class ValidationPlan(object):
+	"""
+	Equations to calculate and validate each GeometryParameter for a combination of present parameters, in the order
+	that validate_bike_geometry() uses them.
+	"""
+
+	def __init__(self, mask: int):
+		"""
+		Builds the plan of a presence bitmask (see get_presence_mask()).
+
+		:param mask: presence bitmask or EMPTY_GEOMETRY
+		"""
+		validation_state = state.get_state()
+		plan_parameters, parameter_bits = validation_state['plan_parameters'], validation_state['parameter_bits']
+
+		self.mask = mask
+		self.present = frozenset(param for param in plan_parameters
+			if mask != EMPTY_GEOMETRY and mask & parameter_bits[param])
+		self._equations = {param: self._filter_equations(param) for param in plan_parameters}
+		# parameters that no formula can calculate may be calculated in one step by a derived formula
+		self._derived = {param: derived.get_derived_equations(param, self.present) for param in plan_parameters
+			if mask != EMPTY_GEOMETRY and len(self._equations[param]) == 0}
+
+		# steps of the plan: the missing parameters that can be calculated and the present ones that can be validated
+		self.calculations = [(param, self._equations[param]) for param in VALIDATABLE_PARAMETER_LIST
+			if param in self._equations and param not in self.present and len(self._equations[param]) > 0]
+		self.calculations.extend((param, self._derived[param]) for param in VALIDATABLE_PARAMETER_LIST
+			if param not in self.present and len(self._derived.get(param, [])) > 0)
+		self.validations = [(param, self._equations[param]) for param in plan_parameters
+			if param in self.present and len(self._equations[param]) > 0]
+
+	def get_equations(self, parameter_name: str) -> list:
+		"""
+		Gets the equations that can be used to calculate or validate a GeometryParameter with this plan. It returns the
+		same equations as get_equations(parameter_name, bike_geometry.get_parameter_list()).
+
+		:param parameter_name: name of the GeometryParameter
+		:return: list of equations, [] if none could be found
+		"""
+		try:
+			return list(self._equations[parameter_name])
+		except KeyError:
+			# parameters that are not in any formula have no equations
+			return []
+
+	def get_derived_equations(self, parameter_name: str) -> list:
+		"""
+		Gets the derived formulae that can calculate a GeometryParameter with this plan, only if none of its equations
+		can (see the derived module).
+
+		:param parameter_name: name of the GeometryParameter
+		:return: list of derived formulae, [] if none could be found
+		"""
+		return list(self._derived.get(parameter_name, []))
+
+	def _filter_equations(self, parameter_name: str) -> list:
+		"""
+		Filters the equations of a GeometryParameter like equations.filter_equations(), but with the present parameters
+		of the plan.
+
+		:param parameter_name: name of the GeometryParameter
+		:return: list of equations
+		"""
+		equation_list = get_equations(parameter_name)
+
+		if self.mask == EMPTY_GEOMETRY:
+			return equation_list
+
+		return [formula for formula in equation_list
+			if sum(param in self.present and param != parameter_name for param in formula['parameters'])
+			>= len(formula['parameters']) - 1]
+
+
+def get_plan(bike_geometry: BikeGeometry) -> ValidationPlan:
+	"""
+	Gets the validation plan of a BikeGeometry from its present parameters, building it if it is not cached.
+
+	Note that the plan changes when parameters are calculated, so get it again after calculating them.
+
+	:param bike_geometry: the BikeGeometry
+	:return: ValidationPlan
+	"""
+	mask = get_presence_mask(bike_geometry)
+	plans = state.get_state()['plans']
+
+	try:
+		validation_plan = plans[mask]
+		if metrics.is_enabled():
+			PLAN_CACHE.inc(labels=("hit", ))
+		return validation_plan
+
+	except KeyError:
+		validation_plan = ValidationPlan(mask)
+		if metrics.is_enabled():
+			PLAN_CACHE.inc(labels=("miss", ))
+
+		with _lock:
+			if len(plans) >= MAX_PLANS:
+				plans.clear()
+
+			plans[mask] = validation_plan
+
+		return validation_plan
+
+
+def get_presence_mask(bike_geometry: BikeGeometry) -> int:
+	"""
+	Gets the presence bitmask of a BikeGeometry: one bit per parameter of get_plan_parameters() that is not empty.
+
+	:param bike_geometry: the BikeGeometry
+	:return: bitmask, or EMPTY_GEOMETRY if the BikeGeometry has no parameters at all
+	"""
+	parameter_list = bike_geometry.get_parameter_list()
+
+	if len(parameter_list) == 0:
+		return EMPTY_GEOMETRY
+
+	parameter_bits = state.get_state()['parameter_bits']
+
+	mask = 0
+	for param in parameter_list:
+		mask |= parameter_bits.get(param.name, 0)
+
+	return mask
+
+
+def get_cached_plans() -> dict:
+	"""
+	Gets the cached validation plans.
+
+	:return: dict with the ValidationPlan of each presence bitmask
+	"""
+	return dict(state.get_state()['plans'])
+
+
+def clear_plans():
+	"""
+	Empties the cache of validation plans, e.g. after changing the formulae.
+
+	:return: None
+	"""
+	with _lock:
+		state.get_state()['plans'].clear()
+
+
+def get_plan_parameters() -> list:
+	"""
+	Gets the parameters used in the formulae in use, each one is a bit of the presence bitmask.
+
+	:return: sorted list of parameter names
+	"""
+	return state.get_state()['plan_parameters']
+
+
+def get_plan_tables(formula_list: list) -> dict:
+	"""
+	Gets the tables of the state (see the state module) built from the formulae, with an empty cache of plans.
+
+	:param formula_list: list of formulae
+	:return: dict with the "plan_parameters", their "parameter_bits" and the "plans"
+	"""
+	plan_parameters = sorted({param for formula in formula_list for param in formula['parameters']})
+
+	return {
+		"plan_parameters": plan_parameters,
+		"parameter_bits": {param: 1 << i for i, param in enumerate(plan_parameters)},
+		"plans": {}
+	}
+
+
+state.set_defaults(**get_plan_tables(VALIDATION_FORMULAE))
@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+registry
+----------------------------------
+
+Module that loads the definitions of the validation (VALIDATION_FORMULAE, GEOMETRY_CONSTRAINTS and
+GEOMETRY_STATISTICS) from versioned registry files, so they can be changed without editing the package and reloaded
+without restarting the process.
+
+A registry file is a JSON file with any of the definitions (those missing keep their current value)::
+
+	{
+		"format": 1,
+		"version": "2019-07-01",
+		"formulae": [{"equation": "{top_tube} - ... - {reach}", "parameters": ["reach", "stack", ...]}, ...],
+		"constraints": {"chainstay": [["<", "wheelbase"]], ...},
+		"statistics": {"chainstay": {"mean": 430.0, "median": 428.0}, ...}
+	}
+
+Reloading a registry parses, indexes and compiles everything into a new state of the validation (see the state
+module) before touching the one in use, so the slow work happens off the request path. The new state is then swapped
+in at once, without waiting for anything: the geometries being validated (see using_registry()) keep the state they
+started with, and the next ones get the new one. The validated geometries carry the version of the registry they were
+validated with ("registry_version"). The geometries of a request all use the same version.
+
+Example usage::
+
+	>> reload_registry("registry.json")
+	True
+	>> get_registry_version()
+	"2019-07-01"
+
+The registry file loaded at start-up is set in `registry_file` in the `validation` section of the config file (null
+for `datavalidation/registry.json`, if it exists). A RegistryWatcher can reload it whenever it changes, and
+signal_reload() makes the watchers of every process reload it.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import time
+import json
+import hashlib
+import logging
+import threading
+import contextlib
+
+from datavalidation.core import metrics
+from datavalidation.core.config import read_config_file
+from datavalidation.core.constants import GEOMETRY_CONSTRAINTS, GEOMETRY_STATISTICS, OPERATORS
+from . import compiled, constraints, derived, equations, plan, scoring, state
+from .formulae import VALIDATION_FORMULAE
+
+
+# version of the format of the registry file, change it if the structure of the file changes
+REGISTRY_FORMAT = 1
+
+# default location of the registry file, under the root of the package
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "registry.json")
+
+REGISTRY_RELOADS = metrics.get_counter("datavalidation_registry_reloads_total",
+	"Reloads of the registry that were installed (success) or rejected (failure)", ["result"])
+
+
+class RegistryWatcher(object):
+	"""
+	Thread that reloads a registry file whenever its modification time changes.
+
+	Example usage::
+
+		>> watcher = RegistryWatcher("registry.json", interval=5)
+		>> watcher.start()
+
+	:param filepath: path of the registry file, default is None for the one in the config file
+	:param interval: seconds between checks of the file, default is 5
+	:param presolve: whether to presolve the new formulae of the registries (see build_registry()), default is True
+	"""
+
+	def __init__(self, filepath: str = None, interval: float = 5, presolve: bool = True):
+		self._filepath = filepath if filepath is not None else _get_registry_file()
+		self._interval = interval
+		self._presolve = presolve
+		self._modified = _get_modified_time(self._filepath)
+		self._stopped = threading.Event()
+		self._thread = None
+
+	def start(self):
+		"""
+		Starts watching the registry file. It does nothing if it is already running.
+
+		:return: None
+		"""
+		if self._thread is not None and self._thread.is_alive():
+			return
+
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self._run, name="RegistryWatcher", daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		"""
+		Stops watching the registry file.
+
+		:return: None
+		"""
+		self._stopped.set()
+
+		if self._thread is not None:
+			self._thread.join()
+
+	def check(self) -> bool:
+		"""
+		Reloads the registry file if it changed since the last check.
+
+		:return: bool, True if it was reloaded
+		"""
+		modified = _get_modified_time(self._filepath)
+
+		if modified is None or modified == self._modified:
+			return False
+
+		self._modified = modified
+		return reload_registry(self._filepath, self._presolve)
+
+	def _run(self):
+		while not self._stopped.wait(self._interval):
+			self.check()
+
+
+# serialises the installs, so the definitions in use always match the registry installed last
+_install_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def using_registry(registry: dict = None):
+	"""
+	Uses the current version of the registry until the end of the block, e.g. to validate a geometry. Installing a
+	registry does not wait for the block, nor does it change the registry used inside it. Nested blocks use the
+	registry of the outermost one.
+
+	:param registry: registry to use, e.g. one from get_registry() in another thread, default is None for the current
+	:return: version of the registry in use
+	"""
+	with state.holding(registry) as validation_state:
+		yield validation_state['version']
+
+
+def get_registry() -> dict:
+	"""
+	Gets the registry used by the current thread (see using_registry()), or the current one outside the blocks. Give
+	it to using_registry() to use it from another thread.
+
+	:return: registry dict
+	"""
+	return state.get_state()
+
+
+def get_registry_version() -> str:
+	"""
+	Gets the version of the registry in use.
+
+	:return: version string
+	"""
+	return state.get_state()['version']
+
+
+def read_registry_file(filepath: str = REGISTRY_FILE) -> dict:
+	"""
+	Reads and checks a registry file.
+
+	:param filepath: path of the registry file, default is REGISTRY_FILE
+	:return: dict with the definitions of the file and its "version" (a hash of its definitions if it has none)
+	:raise ValueError: raised if the file has a different format or its definitions are not valid
+	"""
+	with open(filepath) as json_file:
+		definitions = json.load(json_file)
+
+	if definitions.get("format") != REGISTRY_FORMAT:
+		raise ValueError("registry format '{}' does not match '{}'".format(definitions.get("format"), REGISTRY_FORMAT))
+
+	for formula in definitions.get("formulae", []):
+		if not isinstance(formula.get("equation"), str) or not isinstance(formula.get("parameters"), list):
+			raise ValueError("formula '{}' has no equation or parameters".format(formula))
+
+		for param in formula['parameters']:
+			if "{" + param + "}" not in formula['equation']:
+				raise ValueError("parameter '{}' is not in the equation '{}'".format(param, formula['equation']))
+
+	for name, constraint_list in definitions.get("constraints", {}).items():
+		for constraint in constraint_list:
+			if len(constraint) != 2 or constraint[0] not in OPERATORS:
+				raise ValueError("constraint '{}' of '{}' is not valid".format(constraint, name))
+
+	for name, parameter_statistics in definitions.get("statistics", {}).items():
+		if not isinstance(parameter_statistics.get("mean"), (int, float)) or \
+				not isinstance(parameter_statistics.get("median"), (int, float)):
+			raise ValueError("statistics of '{}' have no mean or median".format(name))
+
+	if definitions.get("version") is None:
+		definitions['version'] = get_definitions_hash(definitions.get("formulae"), definitions.get("constraints"),
+			definitions.get("statistics"))
+
+	return definitions
+
+
+def build_registry(definitions: dict, presolve: bool = False, timeout: float = 60) -> dict:
+	"""
+	Builds a new state of the validation (see the state module) from the definitions: the equation index, the
+	compiled equations and residual functions, the compiled constraints, the statistics arrays and the derived formulae
+	(those of the derived file, only if they were derived from the same formulae). Nothing in use is modified, so it
+	can run while geometries are being validated.
+
+	The compiled solutions of the formulae that did not change are kept.
+
+	:param definitions: dict with the "version" and any of the "formulae", "constraints" and "statistics"
+	:param presolve: whether to solve the new formulae symbolically for the compiled engine, default is False. Note
+		that it can take several minutes for each new formula
+	:param timeout: maximum time in seconds to solve each formula for each parameter, default is 60
+	:return: registry dict, ready for install_registry()
+	:raise Exception: raised if the formulae cannot be parsed or compiled
+	"""
+	formula_list = [dict(formula) for formula in definitions['formulae']] \
+		if definitions.get("formulae") is not None else list(VALIDATION_FORMULAE)
+	constraint_dict = {name: [tuple(constraint) for constraint in constraint_list]
+		for name, constraint_list in definitions['constraints'].items()} \
+		if definitions.get("constraints") is not None else dict(GEOMETRY_CONSTRAINTS)
+	statistics = {name: dict(parameter_statistics) for name, parameter_statistics in definitions['statistics'].items()} \
+		if definitions.get("statistics") is not None else dict(GEOMETRY_STATISTICS)
+
+	parameter_list = sorted({param for formula in formula_list for param in formula['parameters']})
+
+	# parse and compile every formula now, so broken formulae are rejected before they are installed
+	for formula in formula_list:
+		compiled.get_residual_function(formula)
+
+	equation_list = {formula['equation'] for formula in formula_list}
+	compiled_solutions = {key: solutions for key, solutions in compiled.get_compiled_solutions().items()
+		if key[0] in equation_list}
+
+	if presolve:
+		solved = {key[0] for key in compiled_solutions}
+		compiled_solutions.update(compiled.presolve_formulae(timeout,
+			[formula for formula in formula_list if formula['equation'] not in solved]))
+
+	registry = {
+		"version": definitions['version'],
+		"formulae": formula_list,
+		"equation_index": {param: equations.find_equations(param, formula_list) for param in parameter_list},
+		"compiled_equations": {formula['equation']: equations.substitute_operators(formula['equation'])
+			for formula in formula_list},
+		"formula_labels": {formula['equation']: str(i) for i, formula in enumerate(formula_list)},
+		"compiled_solutions": compiled_solutions,
+		"derived_index": derived.get_derived_index(derived.get_derived_formulae(formula_list))
+	}
+	registry.update(constraints.get_constraint_tables(constraint_dict))
+	registry.update(plan.get_plan_tables(formula_list))
+	registry.update(scoring.get_statistics_tables(statistics))
+
+	return registry
+
+
+def install_registry(registry: dict):
+	"""
+	Installs a registry of build_registry() in the validation. The geometries being validated keep the registry they
+	started with.
+
+	:param registry: registry dict
+	:return: None
+	"""
+	with _install_lock:
+		state.set_state(registry)
+
+		# the definitions in use, e.g. for save_registry_file(), the validation only uses those of the state
+		VALIDATION_FORMULAE[:] = registry['formulae']
+
+		GEOMETRY_CONSTRAINTS.clear()
+		GEOMETRY_CONSTRAINTS.update(registry['constraints'])
+
+		GEOMETRY_STATISTICS.clear()
+		GEOMETRY_STATISTICS.update(registry['statistics'])
+
+	logging.info("Registry version {} installed".format(registry['version']))
+
+
+def reload_registry(filepath: str = None, presolve: bool = True) -> bool:
+	"""
+	Reads, builds and installs a registry file. If anything fails, the registry in use is kept.
+
+	:param filepath: path of the registry file, default is None for the one in the config file
+	:param presolve: whether to presolve the new formulae (see build_registry()), default is True so the compiled
+		engine does not fall back to the sympy solver for them
+	:return: bool, True if the registry was installed
+	"""
+	filepath = filepath if filepath is not None else _get_registry_file()
+
+	try:
+		registry = build_registry(read_registry_file(filepath), presolve)
+
+	except Exception as e:
+		logging.warning("Registry '{}' could not be loaded: {}".format(filepath, e))
+		REGISTRY_RELOADS.inc(labels=("failure", ))
+		return False
+
+	install_registry(registry)
+	REGISTRY_RELOADS.inc(labels=("success", ))
+	return True
+
+
+def signal_reload(filepath: str = None) -> str:
+	"""
+	Checks a registry file and marks it as changed, so the RegistryWatchers of every process (e.g. every worker of a
+	server) reload it on their next check.
+
+	:param filepath: path of the registry file, default is None for the one in the config file
+	:return: version of the registry file
+	:raise ValueError: raised if the file has a different format or its definitions are not valid
+	"""
+	filepath = filepath if filepath is not None else _get_registry_file()
+	definitions = read_registry_file(filepath)
+
+	# a newer modification time than any watcher has seen, even if the file was written within the same tick
+	modified = max(int(time.time() * 1e9), (_get_modified_time(filepath) or 0) + 1)
+	os.utime(filepath, ns=(modified, modified))
+
+	return definitions['version']
+
+
+def save_registry_file(filepath: str, version: str = None) -> dict:
+	"""
+	Saves the definitions in use to a registry file, e.g. to start a new registry from them.
+
+	:param filepath: path of the registry file
+	:param version: version of the registry, default is None for a hash of its definitions
+	:return: the content of the file saved
+	"""
+	definitions = {
+		"format": REGISTRY_FORMAT,
+		"version": version if version is not None else get_definitions_hash(),
+		"formulae": VALIDATION_FORMULAE,
+		"constraints": GEOMETRY_CONSTRAINTS,
+		"statistics": GEOMETRY_STATISTICS
+	}
+
+	# write and rename, so a watcher never reads half of the file
+	with open(filepath + ".tmp", "w") as json_file:
+		json.dump(definitions, json_file, indent="\t")
+
+	os.replace(filepath + ".tmp", filepath)
+	return definitions
+
+
+def get_definitions_hash(formula_list: list = None, constraint_dict: dict = None, statistics: dict = None) -> str:
+	"""
+	Gets a hash of the definitions, used as the version of those without one.
+
+	:param formula_list: formulae, default is None for VALIDATION_FORMULAE
+	:param constraint_dict: geometry constraints, default is None for GEOMETRY_CONSTRAINTS
+	:param statistics: geometry statistics, default is None for GEOMETRY_STATISTICS
+	:return: hash string
+	"""
+	definitions = json.dumps([
+		formula_list if formula_list is not None else VALIDATION_FORMULAE,
+		constraint_dict if constraint_dict is not None else GEOMETRY_CONSTRAINTS,
+		statistics if statistics is not None else GEOMETRY_STATISTICS
+	], sort_keys=True)
+
+	return hashlib.sha1(definitions.encode("utf-8")).hexdigest()[:12]
+
+
+def _get_registry_file() -> str:
+	"""
+	Helper function that gets the path of the registry file in the config file.
+
+	:return: path string
+	"""
+	return read_config_file().get("validation", {}).get("registry_file") or REGISTRY_FILE
+
+
+def _get_modified_time(filepath: str):
+	"""
+	Helper function that gets the modification time of a file.
+
+	:param filepath: path of the file
+	:return: int, in nanoseconds, or None if the file does not exist
+	"""
+	try:
+		return os.stat(filepath).st_mtime_ns
+
+	except OSError:
+		return None
+
+
+# version of the definitions of the package until a registry is installed
+state.update_state(version=get_definitions_hash())
+
+if os.path.isfile(_get_registry_file()):
+	# the compiled solutions of the snapshot are loaded at warm-up, presolving at import would delay every process
+	reload_registry(presolve=False)
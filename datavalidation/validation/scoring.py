@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+scoring
+----------------------------------
+
+Module with the scores shared by the validation: the similarity between two values and the deviation of a parameter
+from the geometry statistics. The statistics are stored as arrays indexed by parameter, and the deviations can be
+calculated for scalars, ranges and batches of values (with NumPy if it is installed). The similarities of the values of
+a range to the solutions of a formula are calculated at once too (see get_range_similarities()).
+
+The deviations of the same values are calculated several times while validating a geometry (checking the constraints
+of each parameter and setting the confidences), so they are memoised inside a memoised() block::
+
+	>> with memoised():
+	..     get_deviation("wheelbase", 1100.0)   # calculated
+	..     get_deviation("wheelbase", 1100.0)   # memoised
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import threading
+import contextlib
+
+from datavalidation.core.constants import GEOMETRY_STATISTICS
+from . import state
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# changes every time the statistics are loaded, so memoised deviations of old statistics are not used
+_version = 0
+
+# deviations memoised in the current thread, None outside memoised() blocks
+_memo = threading.local()
+
+
+def load_statistics(statistics: dict = None):
+	"""
+	Loads the geometry statistics into the arrays indexed by parameter, installing them in the state (see the state
+	module).
+
+	:param statistics: dict with the "mean" and "median" of each parameter, default is None for GEOMETRY_STATISTICS
+	:return: None
+	"""
+	state.update_state(**get_statistics_tables(statistics))
+
+
+def get_statistics_tables(statistics: dict = None) -> dict:
+	"""
+	Gets the tables of the state built from the geometry statistics.
+
+	:param statistics: dict with the "mean" and "median" of each parameter, default is None for GEOMETRY_STATISTICS
+	:return: dict with the "statistics" and the "statistics_arrays", a tuple (parameters, index, means, medians,
+		version) with the names of the parameters with statistics, their index in the arrays, their mean and median
+		and the version of the arrays
+	"""
+	global _version
+
+	statistics = dict(statistics if statistics is not None else GEOMETRY_STATISTICS)
+	parameter_list = sorted(statistics.keys())
+	_version += 1
+
+	return {
+		"statistics": statistics,
+		"statistics_arrays": (
+			parameter_list,
+			{param: i for i, param in enumerate(parameter_list)},
+			[float(statistics[param]['mean']) for param in parameter_list],
+			[float(statistics[param]['median']) for param in parameter_list],
+			_version
+		)
+	}
+
+
+def get_statistics_parameters() -> list:
+	"""
+	Gets the names of the parameters with statistics in use.
+
+	:return: sorted list of parameter names
+	"""
+	return state.get_state()['statistics_arrays'][0]
+
+
+@contextlib.contextmanager
+def memoised():
+	"""
+	Memoises the deviations calculated inside the block in the current thread, e.g. during the validation of a
+	geometry. Nested blocks share the memo of the outermost one. It can also be used as a decorator.
+
+	:return: None
+	"""
+	outermost = getattr(_memo, "deviations", None) is None
+
+	if outermost:
+		_memo.deviations = {}
+
+	try:
+		yield
+
+	finally:
+		if outermost:
+			_memo.deviations = None
+
+
+def get_value_similarity(value1, value2, average: bool = False) -> float:
+	"""
+	Gets the similarity between two values.
+	The similarity is a number between 0 and 1 as a percentage where 1 means that the values are the same and 0
+	means that the values are completely different.
+
+	:param value1: value
+	:param value2: value or range of values (list)
+	:param average: if value2 is a range, True gives the average similarity of its values, while False gives the
+		least similarity (default)
+	:return: (0 to 1) percentage float of how close value1 is to value2
+	"""
+	if isinstance(value2, list):
+		val_list = [get_value_similarity(value1, x) for x in value2]
+		return sum(val_list) / len(val_list) if average else min(val_list)
+
+	value1, value2 = float(value1), float(value2)
+
+	return value1 / value2 if value1 < value2 else value2 / value1
+
+
+def get_range_similarities(value_list: list, solution_list: list) -> tuple:
+	"""
+	Gets the similarity of each value of a range (or a single value in a list) to a list of solutions, e.g. those of a
+	formula for every combination of the ranges of its parameters. With NumPy, all the similarities are calculated at
+	once.
+
+	:param value_list: list of values
+	:param solution_list: list of solutions, not empty
+	:return: tuple (similarities, best), where similarities is a list with the average similarity of each value to the
+		solutions and best is the solution most similar to any of the values
+	"""
+	if numpy is None:
+		similarity_list = [[get_value_similarity(value, solution) for solution in solution_list] for value in value_list]
+		best = max(((similarity, solution) for similarities in similarity_list
+			for similarity, solution in zip(similarities, solution_list)), key=lambda l: l[0])[1]
+
+		return [sum(similarities) / len(similarities) for similarities in similarity_list], best
+
+	values = numpy.array(value_list, dtype=float)[:, numpy.newaxis]
+	solutions = numpy.array(solution_list, dtype=float)[numpy.newaxis, :]
+	similarities = numpy.minimum(values, solutions) / numpy.maximum(values, solutions)
+
+	best = solution_list[int(numpy.argmax(similarities)) % len(solution_list)]
+
+	return similarities.mean(axis=1).tolist(), best
+
+
+def get_deviation(parameter_name: str, value):
+	"""
+	Gets the deviation of a parameter from the normal statistics.
+	This is a number from 0 to 1 where 1 represents that the value is exactly right and 0 where the value
+	is very off from the normal statistics (e.g. a wheelbase of 1150 would give something close to 1, but
+	a wheelbase of 10 would give a deviation close to 0).
+	It averages the similarity of the value to its mean and to its median (and of all the values of a range).
+
+	:param parameter_name: name of the GeometryParameter
+	:param value: value or range of values (list) for the GeometryParameter
+	:return: float or None (if value is None only)
+	:raise KeyError: raised if the parameter has no statistics
+	"""
+	if value is None:
+		return None
+
+	deviations = getattr(_memo, "deviations", None)
+	_, statistics_index, means, medians, version = state.get_state()['statistics_arrays']
+	key = (version, parameter_name, tuple(value) if isinstance(value, list) else value)
+
+	if deviations is not None and key in deviations:
+		return deviations[key]
+
+	i = statistics_index[parameter_name]
+	deviation = 1 - (get_value_similarity(means[i], value, average=True) +
+		get_value_similarity(medians[i], value, average=True)) / 2
+
+	if deviations is not None:
+		deviations[key] = deviation
+
+	return deviation
+
+
+def get_deviations(parameter_name: str, value_list: list) -> list:
+	"""
+	Gets the deviations of a batch of values of a parameter, like get_deviation(). They are calculated at once with
+	NumPy if it is installed.
+
+	:param parameter_name: name of the GeometryParameter
+	:param value_list: list of values or ranges of values (lists)
+	:return: list of floats (or None for the values that are None)
+	:raise KeyError: raised if the parameter has no statistics
+	"""
+	_, statistics_index, means, medians, _ = state.get_state()['statistics_arrays']
+	i = statistics_index[parameter_name]
+
+	if numpy is None:
+		return [get_deviation(parameter_name, value) for value in value_list]
+
+	# flatten the ranges, keeping the position of the value of each member to average them back
+	members, positions = [], []
+	for position, value in enumerate(value_list):
+		if value is not None:
+			value = value if isinstance(value, list) else [value]
+			members.extend(value)
+			positions.extend([position] * len(value))
+
+	members = numpy.array(members, dtype=float)
+	positions = numpy.array(positions, dtype=int)
+
+	with numpy.errstate(divide="raise", invalid="raise"):
+		similarities = (numpy.minimum(members, means[i]) / numpy.maximum(members, means[i]) +
+			numpy.minimum(members, medians[i]) / numpy.maximum(members, medians[i])) / 2
+
+	totals = numpy.bincount(positions, weights=similarities, minlength=len(value_list))
+	counts = numpy.bincount(positions, minlength=len(value_list))
+
+	return [None if value is None else float(1 - totals[position] / counts[position])
+		for position, value in enumerate(value_list)]
+
+
+state.set_defaults(**get_statistics_tables())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+snapshot
+----------------------------------
+
+Module to save and load a snapshot with all the state derived from the formulae and the constraints of the package:
+the equation index, the equations with their operators substituted, the compiled solutions of the formulae and the
+constraint tables.
+
+Deriving the compiled solutions takes minutes of sympy work, so the snapshot is built offline and bundled with the
+deployment (e.g. for AWS Lambda or Cloud Functions), where loading it at init takes a few milliseconds::
+
+	python -m datavalidation.validation.snapshot snapshot.json
+
+	# then, at init time
+	from datavalidation.validation.snapshot import load_snapshot
+	load_snapshot("snapshot.json")
+	# the compiled solutions are only used once the engine is switched explicitly
+	equations.set_solver_engine("compiled")
+
+The warm-up (see datavalidation.warmup) loads the snapshot set in `snapshot_file` in the `validation` section of the
+config file (null for `datavalidation/snapshot.json`, if it exists).
+
+If the snapshot is missing or it was built for a different version of the package or its formulae, the state is
+rebuilt the usual way instead (without the compiled solutions, as those are too slow to derive at init).
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+
+from datavalidation import __version__
+from datavalidation.core.config import read_config_file
+from datavalidation.core.constants import GEOMETRY_CONSTRAINTS, GEOMETRY_STATISTICS
+from . import compiled, constraints, equations, state
+from .formulae import VALIDATION_FORMULAE
+
+
+# version of the format of the snapshot file, change it if the structure of the snapshot changes
+SNAPSHOT_FORMAT = 1
+
+# default location of the snapshot file, under the root of the package
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshot.json")
+
+
+def get_snapshot_version() -> str:
+	"""
+	Gets the version that a snapshot must have to be loaded. It changes with the version of the package, the format
+	of the snapshot and the content of the formulae, constraints and statistics.
+
+	:return: version string
+	"""
+	definitions = json.dumps([VALIDATION_FORMULAE, GEOMETRY_CONSTRAINTS, GEOMETRY_STATISTICS], sort_keys=True)
+
+	return "{}-{}-{}".format(__version__, SNAPSHOT_FORMAT, hashlib.sha1(definitions.encode("utf-8")).hexdigest()[:12])
+
+
+def build_snapshot(presolve: bool = True, timeout: float = 60) -> dict:
+	"""
+	Builds a snapshot with the state derived from the formulae and constraints.
+
+	:param presolve: whether to include the compiled solutions of the formulae, default is True. Note that
+		solving the formulae can take several minutes
+	:param timeout: maximum time in seconds to solve each formula for each parameter, default is 60
+	:return: snapshot dict, ready to be serialised as JSON
+	"""
+	equation_index = equations.build_equation_index()
+	compiled_solutions = compiled.presolve_formulae(timeout) if presolve else compiled.get_compiled_solutions()
+
+	return {
+		"version": get_snapshot_version(),
+		# formulae are referenced by their position in VALIDATION_FORMULAE
+		"equation_index": {
+			name: [VALIDATION_FORMULAE.index(formula) for formula in formula_list]
+			for name, formula_list in equation_index.items()
+		},
+		"compiled_equations": [equations.compile_equation(formula) for formula in VALIDATION_FORMULAE],
+		"compiled_solutions": [
+			[VALIDATION_FORMULAE.index(_get_formula(equation)), name, solutions]
+			for (equation, name), solutions in compiled_solutions.items()
+		],
+		"constraint_table": {
+			name: [list(constraint) for constraint in constraint_list]
+			for name, constraint_list in GEOMETRY_CONSTRAINTS.items()
+		}
+	}
+
+
+def save_snapshot(filepath: str = SNAPSHOT_FILE, snapshot: dict = None) -> dict:
+	"""
+	Saves a snapshot to a file, building it first if none is given.
+
+	:param filepath: path of the snapshot file, default is SNAPSHOT_FILE
+	:param snapshot: snapshot dict from build_snapshot(), default is None to build a new one
+	:return: the snapshot saved
+	"""
+	snapshot = snapshot if snapshot is not None else build_snapshot()
+
+	with open(filepath, "w") as snapshot_file:
+		json.dump(snapshot, snapshot_file)
+
+	logging.info("Snapshot saved to '{}' (version {})".format(filepath, snapshot['version']))
+	return snapshot
+
+
+def load_snapshot(filepath: str = SNAPSHOT_FILE, rebuild: bool = True, use_compiled: bool = False) -> bool:
+	"""
+	Loads a snapshot from a file and installs its state in the validation module.
+
+	If the snapshot is missing, corrupted or its version does not match get_snapshot_version(), it rebuilds the
+	state instead when `rebuild` is True.
+
+	:param filepath: path of the snapshot file, default is SNAPSHOT_FILE
+	:param rebuild: whether to rebuild the state if the snapshot cannot be loaded, default is True
+	:param use_compiled: whether to set the "compiled" solver engine if the snapshot has compiled solutions,
+		default is False to keep the engine in use (see equations.set_solver_engine())
+	:return: bool, True if the snapshot was loaded (False if it was rebuilt or nothing was done)
+	"""
+	start_time = time.perf_counter()
+
+	try:
+		with open(filepath) as snapshot_file:
+			snapshot = json.load(snapshot_file)
+
+		if snapshot.get("version") != get_snapshot_version():
+			raise ValueError("snapshot version '{}' does not match '{}'".format(
+				snapshot.get("version"), get_snapshot_version()))
+
+		install_snapshot(snapshot)
+
+	except Exception as e:
+		logging.warning("Snapshot '{}' could not be loaded: {}".format(filepath, e))
+
+		if rebuild:
+			logging.info("Rebuilding the snapshot state instead")
+			equations.build_equation_index()
+
+		return False
+
+	if use_compiled and len(snapshot['compiled_solutions']) > 0:
+		equations.set_solver_engine("compiled")
+
+	logging.info("Snapshot '{}' loaded in {:.3f}s".format(filepath, time.perf_counter() - start_time))
+	return True
+
+
+def install_snapshot(snapshot: dict):
+	"""
+	Installs the state of a snapshot in the state of the validation (see the state module).
+
+	:param snapshot: snapshot dict
+	:return: None
+	"""
+	validation_state = state.get_state()
+	formula_list = validation_state['formulae']
+
+	equation_index = dict(validation_state['equation_index'])
+	for name, formula_index_list in snapshot['equation_index'].items():
+		equation_index[name] = [formula_list[i] for i in formula_index_list]
+
+	compiled_equations = dict(validation_state['compiled_equations'])
+	for formula, compiled_equation in zip(formula_list, snapshot['compiled_equations']):
+		compiled_equations[formula['equation']] = compiled_equation
+
+	# the constraint table is compiled again, as the operators are functions
+	constraint_dict = {name: [tuple(constraint) for constraint in constraint_list]
+		for name, constraint_list in snapshot['constraint_table'].items()}
+
+	state.update_state(equation_index=equation_index, compiled_equations=compiled_equations,
+		**constraints.get_constraint_tables(constraint_dict))
+
+	compiled.set_compiled_solutions({
+		(formula_list[i]['equation'], name): solutions
+		for i, name, solutions in snapshot['compiled_solutions']
+	})
+
+
+def get_snapshot_file():
+	"""
+	Gets the path of the snapshot file to load at start-up, set in `snapshot_file` in the `validation` section of the
+	config file.
+
+	:return: path string, or None if it is not set and SNAPSHOT_FILE does not exist
+	"""
+	filepath = read_config_file().get("validation", {}).get("snapshot_file")
+
+	if filepath is None and os.path.exists(SNAPSHOT_FILE):
+		filepath = SNAPSHOT_FILE
+
+	return filepath
+
+
+def _get_formula(equation: str) -> dict:
+	"""
+	Gets the formula of VALIDATION_FORMULAE with the given equation.
+
+	:param equation: equation string
+	:return: formula dict
+	"""
+	return next(formula for formula in VALIDATION_FORMULAE if formula['equation'] == equation)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Builds a snapshot of the datavalidation package state")
+	parser.add_argument("filepath", nargs="?", default=SNAPSHOT_FILE, help="path of the snapshot file")
+	parser.add_argument("--timeout", type=float, default=60,
+		help="maximum time in seconds to solve each formula for each parameter")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+	save_snapshot(args.filepath, build_snapshot(timeout=args.timeout))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+state
+----------------------------------
+
+Module that holds the state of the validation: the definitions in use (formulae, constraints and statistics) and
+everything built from them (the equation index, the compiled constraints, the statistics arrays, the cached plans...),
+all in a single dict. The validation modules read their tables from get_state() instead of keeping them in globals.
+
+The state is never modified in place once it is in use. Installing new definitions (see the registry module) builds a
+new dict and swaps the reference at once, without waiting for anything. The validations that hold the old state (see
+holding()) keep using it until they finish, and the next ones get the new state::
+
+	>> with holding() as validation_state:
+	..     validate_bike_geometry(bike_geometry)   # always with validation_state, even if a new one is installed
+
+The lazily filled caches of a state (e.g. the equation index) are filled in place, as they never change its meaning.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import threading
+import contextlib
+
+
+# state in use, filled with the defaults of each module when they are imported
+_state = {}
+# serialises the changes of the state, so two of them do not lose each other's tables
+_lock = threading.Lock()
+# state held by the current thread, None outside holding() blocks
+_held = threading.local()
+
+
+def get_state() -> dict:
+	"""
+	Gets the state held by the current thread (see holding()) or the one in use if it holds none. Do not modify it.
+
+	:return: state dict
+	"""
+	held = getattr(_held, "state", None)
+
+	return held if held is not None else _state
+
+
+@contextlib.contextmanager
+def holding(held_state: dict = None):
+	"""
+	Holds a state in the current thread until the end of the block, so all the validations of the block use it even
+	if a new state is installed meanwhile. Nested blocks keep the state of the outermost one.
+
+	:param held_state: state to hold, e.g. one held by another thread, default is None for the one in use
+	:return: state dict held
+	"""
+	previous = getattr(_held, "state", None)
+
+	if previous is not None:
+		yield previous
+		return
+
+	_held.state = held_state if held_state is not None else _state
+
+	try:
+		yield _held.state
+
+	finally:
+		_held.state = None
+
+
+def set_state(new_state: dict):
+	"""
+	Installs a state, replacing the one in use at once. The validations holding the old state are not affected.
+
+	:param new_state: state dict with all the tables of the validation
+	:return: None
+	"""
+	global _state
+
+	with _lock:
+		_state = new_state
+
+
+def update_state(**tables):
+	"""
+	Installs a copy of the state in use with some of its tables replaced, e.g. after loading a statistics file.
+
+	:param tables: tables to replace, keyed by name
+	:return: None
+	"""
+	global _state
+
+	with _lock:
+		_state = dict(_state, **tables)
+
+
+def set_defaults(**tables):
+	"""
+	Sets the tables of a module in the state in use if they are not there yet. Only used when the modules are
+	imported.
+
+	:param tables: default tables, keyed by name
+	:return: None
+	"""
+	with _lock:
+		for name, table in tables.items():
+			_state.setdefault(name, table)
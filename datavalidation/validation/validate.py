@@ -12,14 +12,42 @@ Author: Javier Chiyah, Heriot-Watt University, 2019
 """
 
 
+import math
 import logging
 
 from ..core import BikeGeometry, GeometryParameter
-from .equations import get_equations, solve_equation
-from .constraints import check_parameter_constraints, get_parameter_deviation
-
-
-def validate_bike_geometry(bike_geometry: BikeGeometry):
+from ..core import metrics
+from ..core.config import read_config_file
+from ..core.tracing import traced
+from . import cache, compiled
+from .derived import solve_derived
+from .leastsquares import fit_bike_geometry
+from .corrections import suggest_corrections
+from .equations import solve_equation
+from .plan import ValidationPlan, get_plan
+from .scoring import get_range_similarities, get_value_similarity, memoised
+from .constraints import check_parameter_constraints, get_constraint_violations, get_parameter_deviation
+
+
+# modes that validate_bike_geometry() can use to validate a BikeGeometry:
+#   - formulae: solves each formula for each parameter and compares the solutions with the values given
+#   - least_squares: fits all the parameters to all the formulae at once (see the leastsquares module)
+VALIDATION_MODES = ["formulae", "least_squares"]
+_validation_mode = read_config_file().get("validation", {}).get("mode", "formulae")
+
+# maximum relative correction implied by the residuals of the formulae for a geometry to be validated by
+# validate_by_residuals() instead of solving the formulae when the fast tier is enabled. It is disabled by default, as
+# its confidences differ from those of the solve path; enable it only after a clean parity report (see the docs)
+RESIDUAL_TOLERANCE = 0.01
+_residual_tolerance = read_config_file().get("validation", {}).get("residual_tolerance")
+
+RESIDUAL_TIER = metrics.get_counter("datavalidation_residual_tier_total",
+	"Geometries validated (hit) or not (miss) from the residuals of their formulae", ["result"])
+
+
+@traced()
+@memoised()
+def validate_bike_geometry(bike_geometry: BikeGeometry, mode: str = None):
 	"""
 	Validates a BikeGeometry. Be careful as it modifies the BikeGeometry in place!
 
@@ -29,34 +57,266 @@ def validate_bike_geometry(bike_geometry: BikeGeometry):
 	- Some GeometryParameters may be deemed invalid due to low confidence values.
 	- Some GeometryParameters may have new calculated values, even if the previous values were valid.
 	- Some GeometryParameters without a value may have a new value calculated by deriving it from others.
+	- Invalid GeometryParameters may have suggested corrections of their values (see the corrections module).
 	- The BikeGeometry can now be queried for a confidence value (get_confidence_score()).
 
 	:param bike_geometry: BikeGeometry object to validate
+	:param mode: name of the mode used to validate the BikeGeometry (see VALIDATION_MODES), default is the one set with
+		set_validation_mode()
 	:return: None
 	"""
+	if (mode if mode is not None else _validation_mode) == "least_squares":
+		validate_bike_geometry_least_squares(bike_geometry)
+		suggest_corrections(bike_geometry)
+		return None
+
+	# geometries whose formulae are already satisfied do not need to solve them (most of them), the parameters
+	# validated here get a calculated value, so they are skipped by the rest of the validation
+	validate_by_residuals(bike_geometry)
+
 	change_flag = True
+	iterations = 0
 
 	# loop as long as the list of parameters is increasing (they are being calculated)
 	while change_flag:
 		missing_len = len(bike_geometry.get_missing_parameter_list())
 
 		calculate_missing_parameters(bike_geometry)
+		iterations += 1
 
 		# set change_flag to False if the list of parameters didn't increase
 		change_flag = missing_len != len(bike_geometry.get_missing_parameter_list())
 
+	if metrics.is_enabled():
+		metrics.FIXED_POINT_ITERATIONS.observe(iterations)
+
+	# no parameters are added from here, so every parameter is validated with the same plan
+	validation_plan = get_plan(bike_geometry)
+
 	# note that this loop can be executed in parallel and it is likely to be the most expensive loop of the package
 	for param in bike_geometry.get_parameter_list():
-		validate_geometry_parameter(param, bike_geometry)
+		validate_geometry_parameter(param, bike_geometry, validation_plan)
 
 	# calculate parameters again to give values to invalid parameters
 	# no need to do this anymore as validate will add the parameter's calculated values by default now
 	# calculate_missing_parameters(bike_geometry)
 
+	# suggest corrections for the invalid parameters (e.g. typos)
+	suggest_corrections(bike_geometry)
+
+	# keep the global cache of sympy bounded in long-running processes
+	cache.record_validation()
+
 	logging.info("BikeGeometry validated")
 
 
-def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: BikeGeometry):
+@traced()
+@metrics.timed("validate_by_residuals")
+def validate_by_residuals(bike_geometry: BikeGeometry, tolerance: float = None) -> bool:
+	"""
+	Validates a complete BikeGeometry from the residuals of its formulae, without solving them. It is the fast tier of
+	validate_bike_geometry(), as evaluating a formula takes a few float operations.
+
+	A formula with all its parameters given evaluates to a residual close to 0 when they are consistent. The residual
+	divided by the derivative of the formula for a parameter gives the correction of the parameter that would make it 0
+	(a Newton step). If no missing parameters can be calculated, no parameters are invalid and the corrections of every
+	formula with all its parameters given are within the tolerance, each parameter gets its corrected value (from its
+	first formula) as calculated value and its similarity to it as confidence, like in validate_geometry_parameter().
+	Otherwise, the BikeGeometry is not modified.
+
+	:param bike_geometry: the BikeGeometry
+	:param tolerance: maximum correction relative to the value of the parameter, default is None for the one set with
+		set_residual_tolerance() or in the config file (the fast tier is disabled if neither is set)
+	:return: bool, True if the BikeGeometry was validated
+	"""
+	tolerance = tolerance if tolerance is not None else _residual_tolerance
+
+	if tolerance is None:
+		return False
+
+	validation_plan = get_plan(bike_geometry)
+
+	if len(validation_plan.calculations) > 0 or len(get_invalid_parameters(bike_geometry)) > 0:
+		if metrics.is_enabled():
+			RESIDUAL_TIER.inc(labels=("miss", ))
+		return False
+
+	values = {}
+	corrections = {}
+	# corrections of every formula with all its parameters given, keyed by (equation string, parameter name)
+	formula_corrections = {}
+
+	try:
+		for parameter_name, equation_list in validation_plan.validations:
+			parameter = bike_geometry.get_parameter(parameter_name)
+
+			if not parameter.is_number() or parameter.calculated_value is not None:
+				continue
+
+			# every formula must be satisfied, not only those that decide the calculated values
+			for formula in equation_list:
+				for param in formula['parameters']:
+					if (formula['equation'], param) not in formula_corrections:
+						formula_corrections[(formula['equation'], param)] = \
+							_get_residual_correction(formula, param, bike_geometry)
+
+			# the first formula decides the calculated value, like in validate_geometry_parameter()
+			values[parameter_name], corrections[parameter_name] = \
+				formula_corrections[(equation_list[0]['equation'], parameter_name)]
+
+	except (ValueError, TypeError, ZeroDivisionError, OverflowError):
+		# e.g. ranges, values that are not numbers or formulae that cannot be evaluated with these values
+		if metrics.is_enabled():
+			RESIDUAL_TIER.inc(labels=("miss", ))
+		return False
+
+	for value, correction in formula_corrections.values():
+		if not math.isfinite(correction) or value <= correction or abs(correction) > tolerance * abs(value):
+			if metrics.is_enabled():
+				RESIDUAL_TIER.inc(labels=("miss", ))
+			return False
+
+	for parameter_name, correction in corrections.items():
+		parameter = bike_geometry.get_parameter(parameter_name)
+		new_value = values[parameter_name] - correction
+
+		parameter.set_confidence(get_value_similarity(values[parameter_name], new_value))
+		parameter.set_calculated_value(new_value, change_confidence=False)
+
+	if metrics.is_enabled():
+		RESIDUAL_TIER.inc(labels=("hit", ))
+	logging.debug("BikeGeometry validated from the residuals of its formulae")
+
+	return True
+
+
+def _get_residual_correction(formula: dict, parameter_name: str, bike_geometry: BikeGeometry) -> tuple:
+	"""
+	Helper function of validate_by_residuals() that gets the correction of a parameter that makes the residual of a
+	formula 0 (a Newton step).
+
+	:param formula: a formula dict with all its parameters given
+	:param parameter_name: name of the GeometryParameter to correct
+	:param bike_geometry: the BikeGeometry
+	:return: tuple (value, correction), the corrected value is value - correction
+	:raise ValueError: raised if the values are not numbers (or TypeError, ZeroDivisionError, OverflowError)
+	"""
+	arguments = [float(bike_geometry.get_parameter_value(param)) for param in formula['parameters']]
+	position = formula['parameters'].index(parameter_name)
+	function = compiled.get_residual_function(formula)
+
+	residual = function(*arguments)
+	step = 1e-6 * max(abs(arguments[position]), 1.0)
+	value = arguments[position]
+	arguments[position] += step
+	derivative = (function(*arguments) - residual) / step
+
+	return value, residual / derivative
+
+
+def set_residual_tolerance(tolerance: float = RESIDUAL_TOLERANCE):
+	"""
+	Sets the tolerance of validate_by_residuals(), the fast tier of validate_bike_geometry().
+
+	:param tolerance: maximum correction relative to the value of a parameter, None disables the fast tier, default
+		is RESIDUAL_TOLERANCE
+	:return: None
+	"""
+	global _residual_tolerance
+
+	_residual_tolerance = tolerance
+
+
+def get_residual_tolerance():
+	"""
+	Gets the tolerance of validate_by_residuals(), the fast tier of validate_bike_geometry().
+
+	:return: float or None if the fast tier is disabled
+	"""
+	return _residual_tolerance
+
+
+@traced()
+@metrics.timed("validate_bike_geometry_least_squares")
+def validate_bike_geometry_least_squares(bike_geometry: BikeGeometry):
+	"""
+	Validates a BikeGeometry fitting all its parameters to all the formulae at once (see fit_bike_geometry()), instead
+	of solving each formula for each parameter. Be careful as it modifies the BikeGeometry in place, like
+	validate_bike_geometry() does:
+
+	- The parameters given that were fitted get the fitted value as calculated value, and a confidence from the
+	  similarity of the fitted value to their value and from the residuals of their formulae.
+	- The missing parameters that were fitted get the fitted value as calculated value.
+	- The rest of parameters get a confidence from their deviation from the geometry statistics.
+
+	:param bike_geometry: BikeGeometry object to validate
+	:return: None
+	"""
+	fit = fit_bike_geometry(bike_geometry)
+
+	for parameter_name, fitted_value in fit['fitted'].items():
+		parameter = bike_geometry.get_parameter(parameter_name)
+
+		if parameter_name not in fit['observed']:
+			# missing parameter, calculated like in calculate_parameter()
+			if parameter is None:
+				parameter = GeometryParameter(parameter_name, None)
+				bike_geometry.set_parameter(parameter)
+
+			_set_confidence_from_deviation(parameter)
+			parameter.set_calculated_value(fitted_value, change_confidence=True)
+
+		elif parameter.is_number() and parameter.calculated_value is None:
+			param_values = parameter.normalised_value
+
+			if not isinstance(param_values, list):
+				param_values = [param_values]
+
+			similarity = sum(get_value_similarity(float(value), fitted_value) for value in param_values) / len(param_values)
+
+			parameter.set_confidence(similarity * max(0.0, 1 - fit['residuals'][parameter_name]))
+			parameter.set_calculated_value(fitted_value, change_confidence=False)
+
+	for param in bike_geometry.get_parameter_list():
+		if param.is_number() and param.calculated_value is None:
+			_set_confidence_from_deviation(param)
+
+	cache.record_validation()
+
+	logging.info("BikeGeometry validated with least squares ({} formulae, {} iterations)".format(
+		len(fit['formulae']), fit['iterations']))
+
+
+def set_validation_mode(mode: str):
+	"""
+	Sets the mode used by default to validate BikeGeometries in validate_bike_geometry().
+
+	:param mode: name of the mode, one of VALIDATION_MODES
+	:return: None
+	:raise ValueError: raised if the mode is not one of VALIDATION_MODES
+	"""
+	global _validation_mode
+
+	if mode not in VALIDATION_MODES:
+		raise ValueError("Validation mode not recognised: '{}', it must be one of {}".format(mode, VALIDATION_MODES))
+
+	_validation_mode = mode
+	logging.info("Validation mode set to '{}'".format(mode))
+
+
+def get_validation_mode() -> str:
+	"""
+	Gets the mode used by default to validate BikeGeometries in validate_bike_geometry().
+
+	:return: name of the mode
+	"""
+	return _validation_mode
+
+
+@traced()
+@metrics.timed("validate_geometry_parameter")
+def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: BikeGeometry,
+		validation_plan: ValidationPlan = None):
 	"""
 	Validates a GeometryParameter of the BikeGeometry. It modifies the GeometryParameter but not the BikeGeometry.
 
@@ -67,6 +327,7 @@ def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: Bik
 
 	:param parameter: GeometryParameter inside the BikeGeometry
 	:param bike_geometry: the BikeGeometry
+	:param validation_plan: ValidationPlan of the BikeGeometry (see the plan module), default is None to get it
 	:return: None
 	"""
 	if not parameter.is_number() or parameter.calculated_value is not None:
@@ -75,7 +336,10 @@ def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: Bik
 		# calculated by the `calculate_missing_parameters()` function
 		return None
 
-	equation_list = get_equations(parameter.name, bike_geometry.get_parameter_list())
+	if validation_plan is None:
+		validation_plan = get_plan(bike_geometry)
+
+	equation_list = validation_plan.get_equations(parameter.name)
 
 	if len(equation_list) > 0:
 		for formula in equation_list:
@@ -95,19 +359,17 @@ def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: Bik
 					if not isinstance(param_values, list):
 						param_values = [param_values]
 
-					# keep a list with similarity
-					similarity_list = []
-					for param_val in param_values:
-						similarity_list.extend([(get_value_similarity(param_val, new_val), new_val) for new_val in new_values])
+					# similarity of each value of the range to the solutions, and the solution closest to any of them
+					similarity_list, best_value = get_range_similarities(param_values, new_values)
 
-					if len(similarity_list) > 0:
-						best_case = max(similarity_list, key=lambda l: l[0])
+					# adjust confidence from the average of the list calculated earlier
+					parameter.set_confidence(sum(similarity_list) / len(similarity_list))
 
-						# adjust confidence from the average of the list calculated earlier
-						parameter.set_confidence(sum(map(lambda l: l[0], similarity_list)) / len(similarity_list))
+					if len(similarity_list) > 1:
+						parameter.set_range_confidence(similarity_list)
 
-						# set the calculated value to be the best value found
-						parameter.set_calculated_value(best_case[1], change_confidence=False)
+					# set the calculated value to be the best value found
+					parameter.set_calculated_value(best_value, change_confidence=False)
 
 			else:
 				# it should never reach this code either
@@ -118,6 +380,8 @@ def validate_geometry_parameter(parameter: GeometryParameter, bike_geometry: Bik
 		_set_confidence_from_deviation(parameter)
 
 
+@traced()
+@metrics.timed("calculate_missing_parameters")
 def calculate_missing_parameters(bike_geometry: BikeGeometry, include_invalid: bool = True):
 	"""
 	Calculates missing GeometryParameters of a BikeGeometry if possible. It modifies the BikeGeometry in place!
@@ -163,14 +427,22 @@ def calculate_parameter(parameter_name: str, bike_geometry: BikeGeometry):
 	# set confidence from deviation first to save previous confidence (if it can be calculated)
 	_set_confidence_from_deviation(parameter)
 
-	equation_list = get_equations(parameter.name, bike_geometry.get_parameter_list())
+	# the plan is got for each parameter, as the parameters calculated before may have changed it
+	validation_plan = get_plan(bike_geometry)
 
-	for formula in equation_list:
+	for formula in validation_plan.get_equations(parameter.name):
 		new_values = solve_equation(formula, parameter.name, bike_geometry)
 
 		if len(new_values) > 0:
 			parameter.set_calculated_value(new_values, change_confidence=True)
 
+	# only if no formula can calculate it from the parameters present (it is [] otherwise)
+	for formula in validation_plan.get_derived_equations(parameter.name):
+		new_values = solve_derived(formula, parameter.name, bike_geometry)
+
+		if len(new_values) > 0:
+			parameter.set_calculated_value(new_values, change_confidence=True)
+
 
 def get_invalid_parameters(bike_geometry: BikeGeometry) -> list:
 	"""
@@ -184,35 +456,18 @@ def get_invalid_parameters(bike_geometry: BikeGeometry) -> list:
 	:return: list of invalid parameters (list of str)
 	"""
 	invalid_params = []
+	# check all the geometry constraints at once, so only the parameters that violate them are checked one by one
+	violations = get_constraint_violations(bike_geometry)
 
 	for param in bike_geometry.get_parameter_list():
-		if param.is_number() and is_parameter_invalid(param, bike_geometry):
+		if param.is_number() and is_parameter_invalid(param, bike_geometry, violations):
 			# this means that the parameter is likely wrong
 			invalid_params.append(param.name)
 
 	return invalid_params
 
 
-def get_value_similarity(value1, value2) -> float:
-	"""
-	Gets the similarity between two values.
-	The similarity is a number between 0 and 1 as a percentage where 1 means that the values are the same and 0
-	means that the values are completely different.
-	This function is duplicated in the constraints module. A common utility file could improve this...
-
-	:param value1: value
-	:param value2: value
-	:return: (0 to 1) percentage float of how close value1 is to value2
-	"""
-	if isinstance(value2, list):
-		# if value2 is a list, then return the one with least similarity from the whole similarity list
-		val_list = [get_value_similarity(value1, x) for x in value2]
-		return min(val_list)
-
-	return float(min([value1, value2])) / float(max([value1, value2]))
-
-
-def is_parameter_invalid(parameter: GeometryParameter, bike_geometry: BikeGeometry) -> bool:
+def is_parameter_invalid(parameter: GeometryParameter, bike_geometry: BikeGeometry, violations: int = None) -> bool:
 	"""
 	Checks if a GeometryParameter is invalid.
 
@@ -227,11 +482,11 @@ def is_parameter_invalid(parameter: GeometryParameter, bike_geometry: BikeGeomet
 
 	:param parameter: GeometryParameter to check
 	:param bike_geometry: BikeGeometry to make the comparison
+	:param violations: bitmap of constraints.get_constraint_violations() for the BikeGeometry, default is None
 	:return: bool, True if the parameter IS invalid
 	"""
-	# TODO: change the access to private member _PARAMETER_THRESHOLD
-	return not check_parameter_constraints(parameter.name, bike_geometry) or (
-		parameter.confidence is not None and parameter.confidence < bike_geometry._PARAMETER_THRESHOLD)
+	return not check_parameter_constraints(parameter.name, bike_geometry, violations) or (
+		parameter.confidence is not None and parameter.confidence < bike_geometry.get_parameter_threshold())
 
 
 def _set_confidence_from_deviation(parameter: GeometryParameter):
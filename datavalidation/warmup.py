@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+warmup
+----------------------------------
+
+Module to warm up the datavalidation package before serving requests.
+
+Importing sympy, building the caches of the validation module and running the first validation takes a while, so
+a server should do it once in its parent process and then fork its workers, which will share the warmed pages
+copy-on-write (see `extra/gunicorn.conf.py`). Until warm_up() finishes, is_warm() returns False. If the throwaway
+validation fails, the package is not reported as warm either, and get_warm_up_error() tells why.
+
+If there is a snapshot file (see datavalidation.validation.snapshot), the caches are loaded from it instead of being
+built. The solver engine is then set from `solver_engine` in the `validation` section of the config file (null keeps
+the one in use), e.g. "compiled" to use the compiled solutions of the snapshot.
+
+The throwaway validation runs with the metrics disabled, so it is not reported with the live requests.
+
+Author: Javier Chiyah, Heriot-Watt University, 2019
+"""
+
+
+import gc
+import time
+import logging
+
+# imported here on purpose, the parent process must pay for importing sympy before forking
+import sympy
+
+from datavalidation import datavalidation
+from datavalidation.core import metrics
+from datavalidation.core.config import read_config_file
+from datavalidation.validation import equations
+from datavalidation.validation.snapshot import load_snapshot, get_snapshot_file
+
+
+# bike geometry used for the throwaway validation of the warm-up
+WARM_UP_GEOMETRY = {
+	"parameter_list": [
+		{"p": "reach", "v": "371"},
+		{"p": "stack", "v": "533"},
+		{"p": "top_tube", "v": "534"},
+		{"p": "seat_angle", "v": "73"},
+		{"p": "head_angle", "v": "71"},
+		{"p": "head_tube", "v": "107"},
+		{"p": "chainstay", "v": "430"},
+		{"p": "wheelbase", "v": "1014"},
+		{"p": "bb_drop", "v": "57.5"}
+	]
+}
+
+# functions that build the caches of the package, called in order by build_caches()
+CACHE_BUILDERS = [
+	equations.build_equation_index
+]
+
+_is_warm = False
+# error of the throwaway validation of the last warm-up, None if it did not fail
+_warm_up_error = None
+
+
+def warm_up(run_validation: bool = True, freeze_gc: bool = True, snapshot_file: str = None) -> float:
+	"""
+	Warms up the package: it loads the snapshot or builds all the caches and runs a throwaway validation so the first
+	real request does not pay for it. It is safe to call it more than once.
+
+	:param run_validation: whether to run a throwaway validation after building the caches, default is True
+	:param freeze_gc: whether to move all the objects created so far to the permanent generation of the garbage
+		collector, so forked workers do not copy those pages when the collector runs. Default is True
+	:param snapshot_file: path of the snapshot file, default is None for the one in the config file (see
+		snapshot.get_snapshot_file())
+	:return: time taken to warm up in seconds
+	"""
+	global _is_warm, _warm_up_error
+
+	start_time = time.perf_counter()
+	logging.info("Warming up the datavalidation package")
+
+	snapshot_file = snapshot_file if snapshot_file is not None else get_snapshot_file()
+
+	if snapshot_file is None or not load_snapshot(snapshot_file, rebuild=False):
+		build_caches()
+
+	# the engine is only switched when it is set explicitly
+	solver_engine = read_config_file().get("validation", {}).get("solver_engine")
+	if solver_engine is not None:
+		equations.set_solver_engine(solver_engine)
+
+	_warm_up_error = None
+
+	if run_validation:
+		metrics_enabled = metrics.is_enabled()
+		metrics.set_enabled(False)
+
+		try:
+			datavalidation.validate_bike_geometry(WARM_UP_GEOMETRY)
+		except Exception as e:
+			# the server still starts, but it is not reported as warm, as the live requests are likely to fail too
+			logging.error("There was an error in the throwaway validation of the warm-up: {}".format(e))
+			_warm_up_error = e
+		finally:
+			metrics.set_enabled(metrics_enabled)
+
+	# gc.freeze() is only available from Python 3.7
+	if freeze_gc and hasattr(gc, "freeze"):
+		gc.collect()
+		gc.freeze()
+
+	_is_warm = _warm_up_error is None
+
+	elapsed = time.perf_counter() - start_time
+	logging.info("datavalidation package warmed up in {:.3f}s".format(elapsed))
+
+	return elapsed
+
+
+def build_caches():
+	"""
+	Builds all the caches of the package (see CACHE_BUILDERS).
+
+	:return: None
+	"""
+	for builder in CACHE_BUILDERS:
+		builder()
+
+
+def is_warm() -> bool:
+	"""
+	Checks if the package has been warmed up with warm_up() and its throwaway validation did not fail.
+
+	:return: bool, True if the package is warm
+	"""
+	return _is_warm
+
+
+def get_warm_up_error():
+	"""
+	Gets the error of the throwaway validation of the last warm-up.
+
+	:return: the exception raised, or None if it did not fail
+	"""
+	return _warm_up_error
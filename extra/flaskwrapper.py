@@ -1,19 +1,164 @@
-
+import os
+import hmac
 
 from flask import jsonify, Flask, request
+from datavalidation.core.config import read_config_file
+from datavalidation.core.metrics import export_prometheus, set_enabled, PROMETHEUS_CONTENT_TYPE
 from datavalidation.datavalidation import request_validate_bike_geometry
+from datavalidation.service import RequestCoalescer, AdmissionController, RequestRejected, PriorityRunner, \
+	PRIORITY_CLASSES, RequestCapture
+from datavalidation.validation.registry import RegistryWatcher, signal_reload, get_registry_version
+from datavalidation.warmup import warm_up, is_warm, get_warm_up_error
+
+
+SERVICE_CONFIG = read_config_file().get("service", {})
+VALIDATION_CONFIG = read_config_file().get("validation", {})
 
 
 application = Flask(__name__)
 
+# record the per-stage metrics of the pipeline unless disabled in the config file
+set_enabled(SERVICE_CONFIG.get("metrics", {}).get("enabled", True))
+
+# warm up when the module is imported, so a server preloading the app (see gunicorn.conf.py) does it only once
+warm_up()
+
+# validate interactive and bulk requests in separate priority lanes if enabled in the config file
+runner = None
+if SERVICE_CONFIG.get("lanes", {}).get("enabled", False):
+	runner = PriorityRunner(
+		workers=SERVICE_CONFIG['lanes'].get("workers", 2),
+		weights=SERVICE_CONFIG['lanes'].get("weights"),
+		dedicated=SERVICE_CONFIG['lanes'].get("dedicated")
+	)
+
+# coalesce concurrent requests into batches if enabled in the config file
+coalescer = None
+if SERVICE_CONFIG.get("coalescer", {}).get("enabled", False):
+	coalescer = RequestCoalescer(
+		window=SERVICE_CONFIG['coalescer'].get("window", 0.002),
+		max_batch_size=SERVICE_CONFIG['coalescer'].get("max_batch_size", 32),
+		timeout=SERVICE_CONFIG['coalescer'].get("timeout", 30),
+		# with priority lanes, the batches go through the interactive lane
+		handler=(lambda geometry_list: runner.submit(geometry_list, "interactive")) if runner is not None else None
+	)
+
+# limit the size and concurrency of the requests if enabled in the config file
+admission = None
+if SERVICE_CONFIG.get("admission", {}).get("enabled", False):
+	admission = AdmissionController(**{key: val for key, val in SERVICE_CONFIG['admission'].items() if key != "enabled"})
+
+# record a sample of the requests to be replayed later if enabled in the config file (see benchmarks.replay)
+capture = None
+if SERVICE_CONFIG.get("capture", {}).get("enabled", False):
+	capture = RequestCapture(**{key: val for key, val in SERVICE_CONFIG['capture'].items() if key != "enabled"})
+
+# reload the formulae, constraints and statistics when the registry file changes if enabled in the config file
+watcher = None
+if VALIDATION_CONFIG.get("registry_watch_interval") is not None:
+	watcher = RegistryWatcher(interval=VALIDATION_CONFIG['registry_watch_interval'])
+
+# token of POST /registry/reload, which is disabled if it is not set
+RELOAD_TOKEN = os.environ.get("DATAVALIDATION_RELOAD_TOKEN") or None
+
+
+def validate_request_content(content: dict, priority: str = "interactive") -> dict:
+		if capture is not None:
+			capture.sample(content)
+
+		# threads are started here, in the worker, as they do not survive forking the preloaded app
+		if runner is not None:
+			runner.start()
+
+		if watcher is not None:
+			watcher.start()
+
+		if coalescer is not None and priority == "interactive":
+			coalescer.start()
+			return coalescer.request_validate_bike_geometry(content)
+
+		if runner is not None:
+			return runner.request_validate_bike_geometry(content, priority)
+
+		return request_validate_bike_geometry(content)
+
+
+def get_request_priority() -> str:
+		# clients send the priority class in the X-Priority header, interactive by default
+		priority = request.headers.get("X-Priority", "interactive").lower()
+		return priority if priority in PRIORITY_CLASSES else "interactive"
+
 
 @application.route('/validation', methods=['POST'])
 def json_handler():
-		content = request.get_json(force=True)
-		valid_bike = request_validate_bike_geometry(content)
+		if admission is None:
+			return jsonify(validate_request_content(request.get_json(force=True), get_request_priority()))
+
+		try:
+			# shed load before parsing the body or building any BikeGeometry
+			admission.check_request_size(request.content_length)
+			content = request.get_json(force=True)
+
+			with admission.admit(len(content.get('geometries', []))):
+				valid_bike = validate_request_content(content, get_request_priority())
+
+		except RequestRejected as e:
+			response = jsonify({"error": str(e)})
+			response.status_code = e.status_code
+			if e.retry_after is not None:
+				response.headers['Retry-After'] = str(e.retry_after)
+			return response
 
 		return jsonify(valid_bike)
 
 
+@application.route('/metrics', methods=['GET'])
+def metrics_handler():
+		# Prometheus text format, see the metrics module
+		return application.response_class(export_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@application.route('/metrics/admission', methods=['GET'])
+def admission_metrics_handler():
+		return jsonify(admission.get_metrics() if admission is not None else {})
+
+
+@application.route('/registry', methods=['GET'])
+def registry_handler():
+		return jsonify({"version": get_registry_version()})
+
+
+@application.route('/registry/reload', methods=['POST'])
+def registry_reload_handler():
+		# only callers with the reload token, and only if it is set in the environment
+		if RELOAD_TOKEN is None or not hmac.compare_digest(request.headers.get("Authorization", ""),
+				"Bearer " + RELOAD_TOKEN):
+			return jsonify({"error": "forbidden"}), 403
+
+		# every worker must reload it, which only their watchers can do
+		if watcher is None:
+			return jsonify({"error": "set registry_watch_interval in the config file to reload the registry"}), 409
+
+		# marks the registry file as changed for the watchers, the registry in use is kept if it cannot be loaded
+		try:
+			version = signal_reload()
+		except (OSError, ValueError) as e:
+			return jsonify({"error": str(e), "version": get_registry_version()}), 500
+
+		return jsonify({"reloading": version, "version": get_registry_version()}), 202
+
+
+@application.route('/health/ready', methods=['GET'])
+def readiness_handler():
+		# only healthy once the package has been warmed up without errors
+		if is_warm():
+			return jsonify({"status": "ready"}), 200
+
+		if get_warm_up_error() is not None:
+			return jsonify({"status": "degraded", "error": str(get_warm_up_error())}), 503
+
+		return jsonify({"status": "warming up"}), 503
+
+
 if __name__ == '__main__':
 	application.run(debug=True, host='0.0.0.0')
@@ -0,0 +1,33 @@
+"""
+gunicorn configuration for the flask wrapper.
+
+The app is preloaded in the parent process, which imports sympy, builds the caches and runs a throwaway validation
+(see datavalidation.warmup) before forking the workers. The workers then share those pages copy-on-write instead
+of each one paying for the warm-up on its first live request.
+
+Usage::
+
+	cd extra
+	gunicorn -c gunicorn.conf.py flaskwrapper:application
+
+Environment variables:
+
+- DATAVALIDATION_BIND: address to bind, default is 0.0.0.0:5000
+- DATAVALIDATION_WORKERS: number of workers to fork, default is the number of CPUs
+- DATAVALIDATION_THREADS: number of threads per worker, default is 1. Use more than 1 when the request coalescer is
+  enabled in the config file, so concurrent requests can be batched together
+- DATAVALIDATION_RELOAD_TOKEN: token that the callers of POST /registry/reload must send as
+  `Authorization: Bearer <token>`, the route is disabled if it is not set
+"""
+
+
+import os
+import multiprocessing
+
+
+bind = os.environ.get("DATAVALIDATION_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("DATAVALIDATION_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("DATAVALIDATION_THREADS", 1))
+
+# import (and warm up) the app before forking the workers
+preload_app = True
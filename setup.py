@@ -33,6 +33,11 @@ setup(
                  'datavalidation'},
     include_package_data=True,
     install_requires=requirements,
+    entry_points={
+        'console_scripts': [
+            'datavalidation=datavalidation.__main__:main',
+        ],
+    },
     license="GNU Affero General Public License v3",
     zip_safe=False,
     keywords='datavalidation',
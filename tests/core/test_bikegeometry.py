@@ -83,3 +83,8 @@ def test_bike_get_missing_parameter_list():
 
 	assert bike._is_parameter_empty("front_centre")
 	assert "front_centre" in bike.get_missing_parameter_list()
+
+
+def test_bike_get_parameter_threshold():
+	assert BikeGeometry(wrong_json).get_parameter_threshold() == 0.7
+	assert BikeGeometry({"parameter_threshold": 0.5, "parameter_list": []}).get_parameter_threshold() == 0.5
@@ -80,3 +80,18 @@ def test_geometry_parameter_not_normalised():
 	parameter.set_normalised_value([190, 170])
 
 	assert parameter.value == [190, 170]
+
+
+def test_geometry_parameter_range_confidence():
+	parameter = GeometryParameter("head_tube", "190")
+	parameter.set_range_confidence([0.9, 1.2])
+
+	assert parameter.range_confidence == [0.9, 1]
+	assert parameter.to_dict()['range_confidence'] == [0.9, 1]
+
+	# like the confidence, it is not changed once there is a calculated value
+	parameter.set_calculated_value(195, change_confidence=False)
+	parameter.set_range_confidence([0.5, 0.5])
+
+	assert parameter.range_confidence == [0.9, 1]
+	assert "range_confidence" not in GeometryParameter("head_tube", "190").to_dict()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `metrics` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import pytest
+
+from datavalidation.core import metrics, BikeGeometry
+from datavalidation.validation.equations import solve_equation
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+@pytest.fixture
+def enabled_metrics():
+	# the metrics of the pipeline are disabled by default
+	metrics.set_enabled(True)
+	yield
+	metrics.set_enabled(False)
+
+
+def test_disabled_by_default():
+	assert not metrics.is_enabled()
+
+
+def test_counter():
+	counter = metrics.get_counter("test_counter_total", "Test counter", ["status"])
+
+	counter.inc(labels=("ok", ))
+	counter.inc(2, labels=("ok", ))
+	counter.inc(labels=("error", ))
+
+	assert counter.get(("ok", )) == 3
+	assert counter.get(("missing", )) == 0
+	assert metrics.get_counter("test_counter_total", "Test counter", ["status"]) is counter
+
+	lines = counter.export()
+	assert "# TYPE test_counter_total counter" in lines
+	assert 'test_counter_total{status="ok"} 3' in lines
+
+	with pytest.raises(ValueError):
+		metrics.get_histogram("test_counter_total", "Test counter")
+
+
+def test_histogram():
+	histogram = metrics.get_histogram("test_histogram_seconds", "Test histogram", buckets=(0.1, 1))
+
+	histogram.observe(0.05)
+	histogram.observe(0.1)
+	histogram.observe(5)
+
+	assert histogram.get_count() == 3
+	assert histogram.get_sum() == pytest.approx(5.15)
+
+	lines = histogram.export()
+	# buckets are cumulative and their upper bound is inclusive
+	assert 'test_histogram_seconds_bucket{le="0.1"} 2' in lines
+	assert 'test_histogram_seconds_bucket{le="1"} 2' in lines
+	assert 'test_histogram_seconds_bucket{le="+Inf"} 3' in lines
+	assert "test_histogram_seconds_count 3" in lines
+
+	histogram.reset()
+	assert histogram.get_count() == 0
+
+
+def test_timed(enabled_metrics):
+	metrics.STAGE_SECONDS.reset()
+
+	@metrics.timed("test_stage")
+	def stage(value):
+		return value * 2
+
+	assert stage(2) == 4
+	assert metrics.STAGE_SECONDS.get_count(("test_stage", )) == 1
+
+	metrics.set_enabled(False)
+	try:
+		assert stage(3) == 6
+		assert metrics.STAGE_SECONDS.get_count(("test_stage", )) == 1
+	finally:
+		metrics.set_enabled(True)
+
+	assert 'datavalidation_stage_seconds_count{stage="test_stage"} 1' in metrics.export_prometheus()
+
+
+def test_solve_equation_metrics(enabled_metrics):
+	metrics.SOLVE_SECONDS.reset()
+	metrics.SOLVE_SOLUTIONS.reset()
+
+	formula = VALIDATION_FORMULAE[0]
+	bike_geometry = BikeGeometry({"parameter_list": [{"p": name, "v": "1"} for name in formula['parameters']]})
+	solutions = solve_equation(formula, "reach", bike_geometry, force_constraints=False)
+
+	labels = ("0", "reach")
+	assert metrics.SOLVE_SECONDS.get_count(labels) == 1
+	assert metrics.SOLVE_SOLUTIONS.get_sum(labels) == len(solutions)
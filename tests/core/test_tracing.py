@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `tracing` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import json
+import pytest
+
+from datavalidation.core import tracing, BikeGeometry
+from datavalidation.validation.equations import get_equations, solve_equation
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+def test_traced():
+	@tracing.traced("double")
+	def double(value):
+		return value * 2
+
+	assert double(2) == 4
+	assert not tracing.is_tracing()
+
+	with tracing.tracing() as tracer:
+		assert tracing.is_tracing()
+		assert double(3) == 6
+
+		with pytest.raises(RuntimeError):
+			with tracing.tracing():
+				pass
+
+	assert not tracing.is_tracing()
+	assert len(tracer.events) == 1
+	assert tracer.events[0]['name'] == "double"
+	assert tracer.events[0]['args'] == {"value": "3", "result": "6"}
+
+
+def test_tracing_pipeline(tmp_path):
+	formula = VALIDATION_FORMULAE[0]
+	bike_geometry = BikeGeometry({"parameter_list": [{"p": name, "v": "1"} for name in formula['parameters']]})
+	trace_file = str(tmp_path / "trace.json")
+
+	with tracing.tracing(trace_file):
+		get_equations("reach")
+		solve_equation(formula, "reach", bike_geometry)
+
+	with open(trace_file) as f:
+		trace = json.load(f)
+
+	names = [event['name'] for event in trace['traceEvents']]
+	assert names == ["equations.get_equations", "equations.solve_equation", "constraints.filter_by_constraints"]
+
+	# filter_by_constraints() is nested inside solve_equation()
+	solve, constraints = trace['traceEvents'][1:]
+	assert solve['ts'] <= constraints['ts'] and constraints['ts'] + constraints['dur'] <= solve['ts'] + solve['dur']
+	assert solve['args']['symbol_to_solve'] == "'reach'"
+	assert solve['args']['formula'].startswith(formula['equation'][:50])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `admission` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import threading
+import pytest
+
+from datavalidation.service import AdmissionController, RequestRejected
+
+
+def test_check_request_size():
+	admission = AdmissionController(max_request_bytes=100)
+
+	admission.check_request_size(100)
+	admission.check_request_size(None)
+
+	with pytest.raises(RequestRejected) as e:
+		admission.check_request_size(101)
+
+	assert e.value.status_code == 413 and e.value.retry_after is None
+
+
+def test_admit():
+	admission = AdmissionController(max_geometries_per_request=5, max_in_flight_geometries=4, max_queue_depth=1,
+		queue_timeout=0.05, retry_after=2)
+
+	with pytest.raises(RequestRejected) as e:
+		with admission.admit(6):
+			pass
+	assert e.value.status_code == 413
+
+	with admission.admit(3):
+		assert admission.get_metrics()['in_flight_geometries'] == 3
+
+		# waits in the queue and times out
+		with pytest.raises(RequestRejected) as e:
+			with admission.admit(2):
+				pass
+		assert e.value.status_code == 503 and e.value.retry_after == 2
+
+		# fits in the remaining room
+		with admission.admit(1):
+			assert admission.get_metrics()['in_flight_geometries'] == 4
+
+	# a request larger than the in-flight limit is admitted alone
+	with admission.admit(5):
+		assert admission.get_metrics()['in_flight_geometries'] == 4
+
+	metrics = admission.get_metrics()
+	assert metrics['in_flight_geometries'] == 0
+	assert metrics['admitted'] == 3
+	assert metrics['rejected'] == {413: 1, 429: 0, 503: 1}
+	assert metrics['queue_wait_seconds_count'] == 3
+
+
+def test_admit_queue_full():
+	admission = AdmissionController(max_in_flight_geometries=1, max_queue_depth=1, queue_timeout=1)
+	waiting = threading.Event()
+	release = threading.Event()
+	results = []
+
+	def waiting_request():
+		waiting.set()
+		with admission.admit(1):
+			results.append("admitted")
+
+	with admission.admit(1):
+		thread = threading.Thread(target=waiting_request)
+		thread.start()
+		waiting.wait()
+
+		# wait until the other request is in the queue
+		while admission.get_metrics()['queue_depth'] == 0:
+			release.wait(0.001)
+
+		with pytest.raises(RequestRejected) as e:
+			with admission.admit(1):
+				pass
+		assert e.value.status_code == 429
+
+	thread.join()
+	assert results == ["admitted"]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `capture` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import os
+
+from datavalidation.service import RequestCapture, read_capture
+from datavalidation.service.capture import get_capture_path
+
+
+def test_sample(tmp_path):
+	capture = RequestCapture(str(tmp_path), sample_rate=0)
+	assert not capture.sample({"geometries": []})
+
+	capture = RequestCapture(str(tmp_path), sample_rate=1)
+	request = {"geometries": [{"parameter_list": [{"p": "reach", "v": "371"}]}]}
+	assert capture.sample(request)
+
+	# the request is serialised when sampled, so later changes are not recorded
+	request['geometries'] = []
+	capture.close()
+
+	assert list(read_capture(str(tmp_path))) == [{"geometries": [{"parameter_list": [{"p": "reach", "v": "371"}]}]}]
+
+
+def test_rotation(tmp_path):
+	capture = RequestCapture(str(tmp_path), sample_rate=1, max_bytes=200, backup_count=2)
+
+	for i in range(20):
+		capture.sample({"geometries": [], "index": i})
+	capture.close()
+
+	process_directory = os.path.join(str(tmp_path), str(os.getpid()))
+	assert os.path.exists(get_capture_path(process_directory, 2))
+	assert not os.path.exists(get_capture_path(process_directory, 3))
+
+	# the oldest requests were deleted, the rest are read in order
+	indices = [request['index'] for request in read_capture(str(tmp_path))]
+	assert 0 < len(indices) < 20
+	assert indices == list(range(20 - len(indices), 20))
+
+
+def test_sample_per_process(tmp_path, monkeypatch):
+	capture = RequestCapture(str(tmp_path), sample_rate=0.5, seed=1)
+	parent_random = capture._get_random()
+	assert capture._get_random() is parent_random
+
+	# a forked worker gets its own generator, even with the same seed
+	monkeypatch.setattr(os, "getpid", lambda: -1)
+	worker_random = capture._get_random()
+
+	assert worker_random is not parent_random
+	assert [worker_random.random() for _ in range(5)] != [parent_random.random() for _ in range(5)]
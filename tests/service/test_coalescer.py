@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `coalescer` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import threading
+import pytest
+
+from datavalidation.core.config import set_up_logging
+
+# set logging before importing datavalidation to override test file
+set_up_logging(use_test_config=True)
+
+
+from datavalidation.service import RequestCoalescer
+from datavalidation.validation import registry
+
+
+def _fake_validate(geometry_list):
+	# returns the geometries tagged, failing if any of them is marked as wrong
+	if any(geometry.get("wrong", False) for geometry in geometry_list):
+		raise ValueError("wrong geometry")
+
+	return [{**geometry, "validated": True} for geometry in geometry_list]
+
+
+def test_coalescer_batches():
+	batches = []
+
+	def handler(geometry_list):
+		batches.append(len(geometry_list))
+		return _fake_validate(geometry_list)
+
+	coalescer = RequestCoalescer(window=0.2, max_batch_size=6, handler=handler)
+	coalescer.start()
+
+	results = {}
+
+	def caller(index):
+		results[index] = coalescer.submit([{"id": index}, {"id": index}])
+
+	threads = [threading.Thread(target=caller, args=(i, )) for i in range(3)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	coalescer.stop()
+
+	# the 3 requests fill the batch, so they are validated together in a single call
+	assert coalescer.batch_count == 1 and coalescer.geometry_count == 6
+	assert batches == [6]
+	for index, result in results.items():
+		assert result == [{"id": index, "validated": True}, {"id": index, "validated": True}]
+
+
+def test_coalescer_failing_request():
+	validated = []
+
+	def handler(geometry_list):
+		validated.append(len(geometry_list))
+		return _fake_validate(geometry_list)
+
+	coalescer = RequestCoalescer(window=0.2, max_batch_size=2, handler=handler)
+	coalescer.start()
+
+	results = {}
+
+	def caller(index, geometry):
+		try:
+			results[index] = coalescer.submit([geometry])
+		except ValueError as e:
+			results[index] = e
+
+	threads = [threading.Thread(target=caller, args=(0, {"id": 0})),
+		threading.Thread(target=caller, args=(1, {"id": 1, "wrong": True}))]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	coalescer.stop()
+
+	# the batch fails, so each request is validated again and only the wrong one gets the error
+	assert results[0] == [{"id": 0, "validated": True}]
+	assert isinstance(results[1], ValueError)
+	assert validated == [2, 1, 1]
+
+
+def test_coalescer_request():
+	coalescer = RequestCoalescer(window=0, handler=_fake_validate)
+
+	with pytest.raises(RuntimeError):
+		coalescer.submit([])
+
+	coalescer.start()
+	response = coalescer.request_validate_bike_geometry({"geometries": [{"id": 0}], "extra": 1})
+	coalescer.stop()
+
+	assert response == {"geometries": [{"id": 0, "validated": True}], "extra": 1,
+		"registry_version": registry.get_registry_version()}
+	assert coalescer.batch_count == 1 and coalescer.geometry_count == 1
+
+
+def test_coalescer_timeout():
+	release = threading.Event()
+
+	def handler(geometry_list):
+		release.wait()
+		return _fake_validate(geometry_list)
+
+	coalescer = RequestCoalescer(window=0, handler=handler, timeout=0.05)
+	coalescer.start()
+
+	with pytest.raises(TimeoutError):
+		coalescer.submit([{"id": 0}])
+
+	release.set()
+	coalescer.stop()
+
+	with pytest.raises(RuntimeError):
+		coalescer.submit([{"id": 1}])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `lanes` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import time
+import threading
+import pytest
+
+from datavalidation.core.config import set_up_logging
+
+# set logging before importing datavalidation to override test file
+set_up_logging(use_test_config=True)
+
+
+from datavalidation.service import PriorityRunner
+from datavalidation.validation import registry
+
+
+def test_priority_runner_preemption():
+	order = []
+	started = threading.Event()
+	release = threading.Event()
+
+	def handler(geometry):
+		order.append(geometry['id'])
+		started.set()
+		release.wait()
+		return {**geometry, "validated": True}
+
+	runner = PriorityRunner(workers=1, handler=handler)
+	runner.start()
+
+	results = {}
+	bulk_thread = threading.Thread(target=lambda: results.update(
+		bulk=runner.submit([{"id": "b" + str(i)} for i in range(4)], priority="bulk")))
+	bulk_thread.start()
+	started.wait()
+
+	interactive_thread = threading.Thread(target=lambda: results.update(
+		interactive=runner.submit([{"id": "i0"}, {"id": "i1"}], priority="interactive")))
+	interactive_thread.start()
+
+	while runner.get_queue_lengths()['interactive'] < 2:
+		time.sleep(0.001)
+	release.set()
+
+	bulk_thread.join()
+	interactive_thread.join()
+	runner.stop()
+
+	# the bulk job is preempted after its first geometry
+	assert order == ["b0", "i0", "i1", "b1", "b2", "b3"]
+	assert [geometry['id'] for geometry in results['bulk']] == ["b0", "b1", "b2", "b3"]
+	assert results['interactive'] == [{"id": "i0", "validated": True}, {"id": "i1", "validated": True}]
+
+
+def test_priority_runner_dedicated():
+	runner = PriorityRunner(workers=0, dedicated={"interactive": 1}, handler=lambda geometry: geometry)
+	runner.start()
+
+	assert runner.submit([{"id": 0}]) == [{"id": 0}]
+	assert runner.request_validate_bike_geometry({"geometries": [{"id": 1}]}) == {"geometries": [{"id": 1}],
+		"registry_version": registry.get_registry_version()}
+
+	with pytest.raises(ValueError):
+		runner.submit([{"id": 0}], priority="unknown")
+
+	runner.stop()
+
+
+def test_priority_runner_error():
+	def handler(geometry):
+		if geometry.get("wrong", False):
+			raise KeyError("wrong geometry")
+		return geometry
+
+	runner = PriorityRunner(workers=2, handler=handler)
+	runner.start()
+
+	with pytest.raises(KeyError):
+		runner.submit([{"id": 0}, {"id": 1, "wrong": True}, {"id": 2}], priority="bulk")
+
+	assert runner.submit([]) == []
+	runner.stop()
+
+
+def test_priority_runner_registry():
+	runner = PriorityRunner(workers=2, handler=lambda geometry: registry.get_registry_version())
+	runner.start()
+
+	# the workers validate the geometries with the registry held by the caller
+	with registry.using_registry(dict(registry.get_registry(), version="held")):
+		results = runner.submit([{"id": i} for i in range(4)], priority="bulk")
+
+	runner.stop()
+
+	assert results == ["held"] * 4
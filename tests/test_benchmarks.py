@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the `benchmarks` package
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import io
+import json
+import random
+import pytest
+
+from benchmarks import generator, baseline, memory, parity
+from benchmarks.data import generate_geometries, load_fixture_geometries
+from benchmarks.replay import replay, diff_responses, summarise_replay, compare_with_baseline
+from benchmarks.runner import run_benchmark, get_percentile, format_results
+from datavalidation.validation import compiled, validate
+from datavalidation.validation.compiled import get_residual_function
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+from datavalidation.validation.registry import get_registry_version
+
+
+def test_get_percentile():
+	values = [5, 1, 4, 2, 3]
+
+	assert get_percentile(values, 50) == 3
+	assert get_percentile(values, 0) == 1
+	assert get_percentile(values, 99) == 5
+
+
+def test_run_benchmark():
+	result = run_benchmark("sum", sum, lambda: ([1, 2, 3], ), repeat=5)
+
+	assert result['calls'] == 5 and result['errors'] == 0
+	assert result['p50'] <= result['p95'] <= result['max']
+	assert "alloc_peak_bytes" in result
+
+	result = run_benchmark("error", lambda: 1 / 0, repeat=2, measure_memory=False)
+	assert result['errors'] == 2 and "alloc_peak_bytes" not in result
+
+	assert "sum" in format_results([result, run_benchmark("sum", sum, lambda: ([1], ), repeat=1)])
+
+
+def test_generate_geometries(tmp_path):
+	geometry_list = generate_geometries(5, seed=1)
+
+	assert len(geometry_list) == 5
+	assert geometry_list == generate_geometries(5, seed=1)
+	assert all(len(geometry['parameter_list']) > 0 for geometry in geometry_list)
+
+	assert load_fixture_geometries(str(tmp_path / "missing")) == []
+
+
+def test_generate_consistent_parameters():
+	random_generator = random.Random(0)
+
+	for _ in range(20):
+		values = generator.generate_consistent_parameters(random_generator)
+
+		for formula in VALIDATION_FORMULAE:
+			residual = get_residual_function(formula)(**{param: values[param] for param in formula['parameters']})
+			assert residual == pytest.approx(0, abs=1e-6)
+
+
+def test_inject_fault():
+	random_generator = random.Random(0)
+
+	assert generator.inject_fault(604, "front_centre", "digit_swap", random_generator) in ["064", "640"]
+	assert generator.inject_fault(508, "front_centre", "inches", random_generator) == "20.00"
+	assert generator.inject_fault(57.5, "bb_drop", "comma_decimal", random_generator) == "57,5"
+	assert generator.inject_fault(170, "reach", "range", random_generator).startswith("170/")
+	assert generator.inject_fault(170, "reach", "missing", random_generator) == ""
+
+	with pytest.raises(ValueError):
+		generator.inject_fault(170, "reach", "unknown", random_generator)
+
+
+def test_write_geometries():
+	geometry_list = list(generator.generate_geometries(3, seed=2, fault_rate=1, missing_rate=0))
+
+	for geometry in geometry_list:
+		assert len(geometry['ground_truth']['faults']) == len(geometry['parameter_list'])
+
+	output = io.StringIO()
+	assert generator.write_geometries(output, geometry_list, "json") == 3
+	assert json.loads(output.getvalue()) == {"geometries": geometry_list}
+
+	output = io.StringIO()
+	generator.write_geometries(output, geometry_list, "ndjson")
+	assert [json.loads(line) for line in output.getvalue().splitlines()] == geometry_list
+
+
+def test_diff_responses():
+	baseline = {"geometries": [{"confidence": 0.5, "parameter_list": [{"p": "reach", "v": 371}]}]}
+
+	assert diff_responses(baseline, baseline) == []
+	assert diff_responses({"geometries": [{"confidence": 0.5 + 1e-9, "parameter_list": [{"p": "reach", "v": 371}]}]},
+		baseline) == []
+
+	differences = diff_responses({"geometries": [{"confidence": 0.6, "parameter_list": []}]}, baseline)
+	assert differences == ["geometries[0].confidence: 0.6 != 0.5", "geometries[0].parameter_list: length 0 != 1"]
+
+
+def test_replay():
+	request_list = [{"geometries": []}, {"geometries": []}]
+	result_list, elapsed = replay(request_list, concurrency=2)
+
+	assert [result['response'] for result in result_list] == [dict(request, registry_version=get_registry_version())
+		for request in request_list]
+	assert summarise_replay(request_list, result_list, elapsed)['requests'] == 2
+
+	comparison = compare_with_baseline(result_list, [{"response": dict(result_list[0]['response'], geometries=[1]),
+		"error": None}, result_list[1]])
+	assert comparison['compared'] == 2 and comparison['different'] == 1
+	assert comparison['differences'] == {0: ["response.geometries: length 0 != 1"]}
+
+
+def test_baseline(tmp_path):
+	filepath = str(tmp_path / "baselines.json")
+	fingerprint = baseline.get_machine_fingerprint()
+	other_machine = dict(fingerprint, key="other")
+
+	assert baseline.get_machine_fingerprint() == fingerprint
+	assert baseline.load_baseline(filepath) is None
+
+	result_list = [
+		{"name": "solve_equation[3:chainstay]", "p50": 0.010, "ops_per_second": 100},
+		{"name": "request_validate_bike_geometry", "p50": 0.100, "ops_per_second": 10}
+	]
+	baseline.save_baseline(result_list, filepath)
+	baseline.save_baseline([], filepath, other_machine)
+
+	saved = baseline.load_baseline(filepath)
+	assert saved['results']['request_validate_bike_geometry']['p50'] == 0.100
+	assert baseline.load_baseline(filepath, other_machine)['results'] == {}
+
+	new_result_list = [
+		{"name": "solve_equation[3:chainstay]", "p50": 0.012, "ops_per_second": 80},
+		{"name": "request_validate_bike_geometry", "p50": 0.095, "ops_per_second": 10.5}
+	]
+	comparison_list = baseline.compare_results(new_result_list, saved, threshold=0.1)
+
+	assert [(c['name'], c['metric'], c['regressed']) for c in comparison_list] == [
+		("solve_equation[3:chainstay]", "p50", True),
+		("request_validate_bike_geometry", "p50", False),
+		("request_validate_bike_geometry", "ops_per_second", False)
+	]
+
+	comparison_list = baseline.compare_results(new_result_list, saved, [("*", "ops_per_second")], threshold=0.1)
+	assert [c['regressed'] for c in comparison_list] == [True, False]
+
+	# failing benchmarks always regress
+	failing_result_list = [
+		{"name": "solve_equation[3:chainstay]", "p50": float("nan"), "errors": 0},
+		{"name": "request_validate_bike_geometry", "p50": 0.095, "errors": 2}
+	]
+	comparison_list = baseline.compare_results(failing_result_list, saved, threshold=0.1)
+	assert [c['regressed'] for c in comparison_list] == [True, True]
+	assert "(2 errors)" in baseline.format_comparison(comparison_list)
+
+
+def test_measure_geometry_memory():
+	geometry = generate_geometries(1, seed=3)[0]
+	stages = memory.measure_geometry_memory(geometry)
+
+	assert list(stages.keys()) == ["BikeGeometry", "normalise_bike_geometry", "validate_bike_geometry", "to_dict"]
+	assert stages['BikeGeometry']['retained_bytes'] > 0
+	assert stages['BikeGeometry']['peak_bytes'] >= stages['BikeGeometry']['retained_bytes']
+	assert stages['BikeGeometry']['retained_by_group']['GeometryParameter'] > 0
+
+
+def test_measure_growth():
+	growth = memory.measure_growth([generate_geometries(1, seed=3)[0]], count=2, sample_every=1, trace=False)
+
+	assert [sample['validations'] for sample in growth['samples']] == [0, 1, 2]
+	assert growth['samples'][0]['traced_bytes'] is None and growth['growth_per_1000']['traced_bytes'] is None
+	assert growth['samples'][-1]['class_dicts']['GeometryParameter._extra_values'] == 0
+
+
+def test_parity():
+	formula = VALIDATION_FORMULAE[0]
+	compiled.set_compiled_solutions({(formula['equation'], "reach"): compiled.presolve_formula(formula, "reach")})
+
+	try:
+		geometry_list = [generator.generate_geometry(random.Random(seed), fault_rate=0, missing_rate=0)
+			for seed in range(3)]
+		rows = parity.compare_formulae(geometry_list, ["compiled"], only=["0:reach"])
+
+		assert len(rows) == 1
+		assert rows[0]['compiled'] and rows[0]['cases'] == 3
+		assert rows[0]['mismatches'] == 0 and rows[0]['max_rel_diff'] < 1e-9
+
+		validation_rows = parity.compare_validations(geometry_list[:1], ["compiled"])
+		assert validation_rows[0]['geometries'] == 1 and validation_rows[0]['invalid_mismatches'] == 0
+		assert "0:reach" in parity.format_report(rows, validation_rows)
+
+		# the fast residual tier against solving the formulae, which is left disabled afterwards
+		tier_rows = parity.compare_residual_tier(geometry_list[:1])
+		assert tier_rows[0]['engine'] == "residuals" and tier_rows[0]['geometries'] == 1
+		assert tier_rows[0]['error_mismatches'] == 0
+		assert validate.get_residual_tolerance() is None
+	finally:
+		compiled.set_compiled_solutions({})
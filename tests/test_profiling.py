@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `profiling` module and the `profile` command
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import os
+import json
+import pstats
+import collections
+
+from datavalidation import profiling
+from datavalidation.__main__ import main
+
+
+def test_get_function_group():
+	assert profiling.get_function_group(os.path.join("x", "datavalidation", "core", "bikegeometry.py")) == "core"
+	assert profiling.get_function_group(os.path.join("x", "datavalidation", "validation", "validate.py")) == \
+		"validation"
+	assert profiling.get_function_group(os.path.join("x", "datavalidation", "datavalidation.py")) == "datavalidation"
+	assert profiling.get_function_group(os.path.join("x", "sympy", "core", "basic.py")) == "sympy"
+	assert profiling.get_function_group("~") == "other"
+
+
+def test_profile_request():
+	request = {"geometries": []}
+	stats, errors = profiling.profile_request(request, repeat=3)
+
+	assert errors == [] and request == {"geometries": []}
+
+	groups = profiling.group_functions(stats)
+	calls = {function: calls for function, calls, _, _ in groups['datavalidation']}
+	assert any(function.endswith("(request_validate_bike_geometry)") and count == 3
+		for function, count in calls.items())
+	assert "datavalidation - " in profiling.format_groups(groups)
+
+
+def test_save_collapsed_stacks(tmp_path):
+	filepath = str(tmp_path / "profile.collapsed")
+	profiling.save_collapsed_stacks(filepath, collections.Counter({"a;b": 2, "a;c": 1}))
+
+	with open(filepath) as f:
+		assert f.read() == "a;b 2\na;c 1\n"
+
+
+def test_profile_command(tmp_path):
+	request_file = str(tmp_path / "request.json")
+	with open(request_file, "w") as f:
+		json.dump({"geometries": []}, f)
+
+	pstats_file = str(tmp_path / "profile.pstats")
+	collapsed_file = str(tmp_path / "profile.collapsed")
+
+	assert main(["profile", request_file, "--repeat", "2", "--pstats", pstats_file, "--collapsed", collapsed_file]) == 0
+	assert pstats.Stats(pstats_file).total_calls > 0
+	assert os.path.exists(collapsed_file)
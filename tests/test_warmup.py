@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `warmup` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+from datavalidation.core.config import set_up_logging
+
+# set logging before importing datavalidation to override test file
+set_up_logging(use_test_config=True)
+
+
+from datavalidation import warmup
+from datavalidation.core import metrics
+from datavalidation.validation import equations, state
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+def test_build_caches():
+	warmup.build_caches()
+	validation_state = state.get_state()
+
+	for formula in VALIDATION_FORMULAE:
+		assert formula['equation'] in validation_state['compiled_equations']
+
+		for parameter_name in formula['parameters']:
+			assert validation_state['equation_index'][parameter_name] == equations.get_equations(parameter_name)
+
+
+def test_warm_up():
+	metrics.set_enabled(True)
+	validations = metrics.STAGE_SECONDS.get_count(("validate_bike_geometry", ))
+
+	try:
+		elapsed = warmup.warm_up(freeze_gc=False)
+
+		# the throwaway validation is not recorded
+		assert metrics.is_enabled()
+		assert metrics.STAGE_SECONDS.get_count(("validate_bike_geometry", )) == validations
+	finally:
+		metrics.set_enabled(False)
+
+	assert elapsed >= 0
+	assert warmup.is_warm() == (warmup.get_warm_up_error() is None)
+
+
+def test_warm_up_error(monkeypatch):
+	def failing_validation(bike_geometry_dict):
+		raise KeyError("reach")
+
+	monkeypatch.setattr(warmup.datavalidation, "validate_bike_geometry", failing_validation)
+
+	# the server can start, but it is not reported as warm
+	warmup.warm_up(freeze_gc=False)
+	assert not warmup.is_warm()
+	assert isinstance(warmup.get_warm_up_error(), KeyError)
+
+	monkeypatch.undo()
+	warmup.warm_up(run_validation=False, freeze_gc=False)
+	assert warmup.is_warm()
+	assert warmup.get_warm_up_error() is None
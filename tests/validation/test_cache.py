@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `cache` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import sympy
+import pytest
+
+from datavalidation.validation import cache
+
+
+@pytest.fixture
+def policy():
+	previous_policy = cache.get_cache_policy()
+	yield
+	cache.set_cache_policy(**previous_policy)
+
+
+def _fill_sympy_cache():
+	x = sympy.Symbol("x", positive=True)
+	sympy.solvers.solve(sympy.sqrt(x ** 2 + 3) - 7, x)
+
+
+def test_clear_every(policy):
+	cache.set_cache_policy(clear_every=3)
+	clears = cache.SYMPY_CACHE_CLEARS.get(("validations", ))
+	cache.clear_sympy_cache()
+
+	for _ in range(3):
+		_fill_sympy_cache()
+		cache.record_validation()
+
+	# validations are counted since the process started, so the cache is cleared once every 3
+	assert cache.SYMPY_CACHE_CLEARS.get(("validations", )) == clears + 1
+
+
+def test_max_entries(policy):
+	cache.set_cache_policy(max_entries=1, check_every=1)
+	_fill_sympy_cache()
+	assert cache.get_sympy_cache_size() > 1
+
+	cache.record_validation()
+
+	assert cache.get_sympy_cache_size() == 0
+	assert cache.SYMPY_CACHE_CLEARS.get(("entries", )) >= 1
+
+	cache.set_cache_policy(max_entries=None, max_rss_bytes=1, check_every=1)
+	_fill_sympy_cache()
+	cache.record_validation()
+
+	assert cache.get_sympy_cache_size() == 0
+	assert cache.PROCESS_RSS.get() > 0
+
+
+def test_get_rss():
+	assert cache.get_rss() > 0
+
+
+def test_max_rss_bytes_without_current_rss(policy, monkeypatch, caplog):
+	# e.g. macOS, where only the peak RSS is available
+	monkeypatch.setattr(cache, "get_current_rss", lambda: None)
+	monkeypatch.setattr(cache, "_rss_unavailable_logged", False)
+	cache.set_cache_policy(max_rss_bytes=1, check_every=1)
+	clears = cache.SYMPY_CACHE_CLEARS.get(("rss", ))
+
+	for _ in range(3):
+		_fill_sympy_cache()
+		cache.record_validation()
+
+	assert cache.get_sympy_cache_size() > 0
+	assert cache.SYMPY_CACHE_CLEARS.get(("rss", )) == clears
+	assert len([record for record in caplog.records if "max_rss_bytes" in record.getMessage()]) == 1
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the compiled constraints of the `constraints` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import pytest
+
+from datavalidation.core import BikeGeometry
+from datavalidation.validation.constraints import check_parameter_constraints, get_constraint_violations, \
+	get_violated_parameters, get_constraint_violation_masks, get_constraint_parameters
+
+
+def _get_number_geometry(values: dict) -> BikeGeometry:
+	bike = BikeGeometry.from_parameter_dict(values)
+	for name, value in values.items():
+		bike.get_parameter(name)._value = value
+
+	return bike
+
+
+def test_get_constraint_violations():
+	bike = _get_number_geometry({"chainstay": 425, "front_centre": 600, "wheelbase": 1100})
+
+	assert get_constraint_violations(bike) == 0
+	# the bitmap skips the per-value checks of the parameters without violations
+	assert check_parameter_constraints("chainstay", bike, get_constraint_violations(bike))
+
+	bike.get_parameter("front_centre")._value = 5000
+	violations = get_constraint_violations(bike)
+
+	# wheelbase has the inverse constraint
+	assert get_violated_parameters(violations) == ["front_centre", "wheelbase"]
+	assert check_parameter_constraints("chainstay", bike, violations)
+
+	# ranges must satisfy the constraints with all their values
+	bike = _get_number_geometry({"seat_tube_length": [400, 520], "seat_tube_length_eff": 500})
+
+	assert get_violated_parameters(get_constraint_violations(bike)) == ["seat_tube_length", "seat_tube_length_eff"]
+
+
+def test_get_constraint_violation_masks():
+	# NumPy is optional
+	pytest.importorskip("numpy")
+
+	bike_list = [
+		_get_number_geometry({"chainstay": 425, "front_centre": 600, "wheelbase": 1100}),
+		_get_number_geometry({"chainstay": 425, "front_centre": 5000, "wheelbase": 1100}),
+		_get_number_geometry({"top_tube": 550, "top_tube_actual": 560})
+	]
+	masks = get_constraint_violation_masks(bike_list)
+
+	assert masks.shape == (3, len(get_constraint_parameters()))
+	for bike, mask in zip(bike_list, masks):
+		assert [param for param, violated in zip(get_constraint_parameters(), mask) if violated] == \
+			get_violated_parameters(get_constraint_violations(bike))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `corrections` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import math
+
+import pytest
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core.constants import GEOMETRY_PARAMETERS
+from datavalidation.validation import corrections
+
+
+# values that satisfy the formulae that only use these parameters
+VALUES = {
+	"reach": 400.0,
+	"stack": 600.0,
+	"seat_angle": 74.0,
+	"top_tube": 600.0 * math.tan(16 / 180 * math.pi) + 400.0,
+	"seat_tube_length_eff": 600.0 / math.cos(16 / 180 * math.pi)
+}
+
+
+@pytest.fixture
+def float_parameters():
+	# the parameters must be numbers to be corrected
+	missing = [name for name in VALUES if name not in GEOMETRY_PARAMETERS]
+	GEOMETRY_PARAMETERS.update({name: float for name in missing})
+	yield
+	for name in missing:
+		del GEOMETRY_PARAMETERS[name]
+
+
+def _get_bike_geometry(reach) -> BikeGeometry:
+	return BikeGeometry({"parameter_list": [{"p": name, "v": value if name != "reach" else reach}
+		for name, value in VALUES.items()]})
+
+
+def test_generate_candidates():
+	candidates = dict(corrections.generate_candidates(64.0, "064"))
+
+	assert candidates[604.0] == "transposition"
+	assert candidates[6.4] == "decimal_shift"
+	assert 64.0 * corrections.INCH in candidates
+
+	candidates = dict(corrections.generate_candidates(110.0))
+
+	assert candidates[101.0] == "transposition"
+	assert candidates[10.0] == "dropped_digit"
+	assert candidates[1110.0] == "duplicated_digit"
+	assert 110.0 not in candidates
+
+
+@pytest.mark.parametrize("reach, edit", [
+	("040", "transposition"),
+	("4400", "dropped_digit"),
+	("40", "duplicated_digit"),
+	("4", "decimal_shift"),
+	(str(400 / 25.4), "inch_mm")
+])
+def test_get_suggestions(float_parameters, reach, edit):
+	bike_geometry = _get_bike_geometry(reach)
+	suggestion_list = corrections.get_suggestions(bike_geometry.get_parameter("reach"), bike_geometry)
+
+	assert len(suggestion_list) > 0
+	assert suggestion_list[0]['v'] == pytest.approx(400.0)
+	assert suggestion_list[0]['edit'] == edit
+	assert suggestion_list[0]['residual'] < 1e-6
+
+
+def test_score_candidates_without_numpy(float_parameters, monkeypatch):
+	bike_geometry = _get_bike_geometry("040")
+	suggestion_list = corrections.get_suggestions(bike_geometry.get_parameter("reach"), bike_geometry)
+
+	monkeypatch.setattr(corrections, "numpy", None)
+
+	assert corrections.get_suggestions(bike_geometry.get_parameter("reach"), bike_geometry) == suggestion_list
+
+
+def test_suggest_corrections(float_parameters):
+	bike_geometry = _get_bike_geometry("040")
+	bike_geometry.get_parameter("reach").set_confidence(0.1)
+
+	result = corrections.suggest_corrections(bike_geometry)
+
+	assert list(result.keys()) == ["reach"]
+	parameter_dict = bike_geometry.get_parameter("reach").to_dict()
+	assert parameter_dict['suggestions'][0]['v'] == "400"
+
+	# valid parameters are not corrected
+	assert "suggestions" not in bike_geometry.get_parameter("stack").to_dict()
+
+
+def test_get_suggestions_invalid_other_parameter(float_parameters):
+	for confidence, found in [(0.1, True), (0.9, False)]:
+		bike_geometry = BikeGeometry({"parameter_list": [{"p": name, "v": value if name != "reach" else "040"}
+			for name, value in dict(VALUES, stack=6000.0).items()]})
+		stack = bike_geometry.get_parameter("stack")
+		stack.set_confidence(confidence)
+		stack.set_calculated_value(600.0, change_confidence=False)
+
+		# an invalid stack is replaced by its calculated value, a valid one is used as given
+		suggestion_list = corrections.get_suggestions(bike_geometry.get_parameter("reach"), bike_geometry)
+		assert (len(suggestion_list) > 0 and suggestion_list[0]['v'] == pytest.approx(400.0)) == found
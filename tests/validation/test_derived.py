@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `derived` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import json
+import math
+
+import pytest
+import sympy
+
+from datavalidation.core import BikeGeometry
+from datavalidation.validation import compiled, derived, plan
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+from datavalidation.validation.validate import calculate_parameter
+
+
+# stack / COS((90 - seat_angle) / 180 * PI) - seat_tube_length_eff, solved for the stack
+SEAT_TUBE_FORMULA = VALIDATION_FORMULAE[4]
+# top_tube - stack * TAN((90 - seat_angle) / 180 * PI) - reach
+TOP_TUBE_FORMULA = VALIDATION_FORMULAE[0]
+
+
+@pytest.fixture
+def derived_reach():
+	# reach calculated from the seat tube without the stack
+	formula = derived.derive_formula(SEAT_TUBE_FORMULA, TOP_TUBE_FORMULA, "stack")
+	formula['solutions'] = {"reach": compiled.presolve_formula(formula, "reach")}
+
+	derived.install_derived_formulae([formula])
+	plan.clear_plans()
+	yield formula
+	derived.install_derived_formulae(derived.get_derived_formulae())
+	plan.clear_plans()
+
+
+def test_get_formula_equation():
+	parameter_list = ["stack", "seat_angle", "reach"]
+	formula = {"equation": derived.get_formula_equation(
+		sympy.sqrt(sympy.Symbol("stack", positive=True) ** 2 + 1.5e-5) +
+		sympy.cot(sympy.pi * sympy.Symbol("seat_angle", positive=True) / 180) -
+		sympy.atan2(sympy.Symbol("reach", positive=True), 2), parameter_list), "parameters": parameter_list}
+
+	assert "COT" not in formula['equation'] and "^" in formula['equation']
+	assert compiled.get_residual_function(formula)(600, 74, 400) == pytest.approx(
+		math.sqrt(600 ** 2 + 1.5e-5) + 1 / math.tan(math.pi * 74 / 180) - math.atan2(400, 2))
+
+	with pytest.raises(ValueError):
+		derived.get_formula_equation(sympy.exp(sympy.Symbol("stack", positive=True)), parameter_list)
+
+	with pytest.raises(ValueError):
+		derived.get_formula_equation(sympy.Symbol("wheelbase", positive=True), parameter_list)
+
+
+def test_derive_formula():
+	formula = derived.derive_formula(SEAT_TUBE_FORMULA, TOP_TUBE_FORMULA, "stack")
+
+	assert sorted(formula['parameters']) == ["reach", "seat_angle", "seat_tube_length_eff", "top_tube"]
+	assert formula['eliminated'] == ["stack"]
+	assert formula['sources'] == [TOP_TUBE_FORMULA['equation'], SEAT_TUBE_FORMULA['equation']]
+
+	# the values of a consistent geometry satisfy it
+	stack = 600 * math.cos((90 - 74) / 180 * math.pi)
+	reach = 560 - stack * math.tan((90 - 74) / 180 * math.pi)
+	assert compiled.get_residual_function(formula)(
+		reach=reach, seat_angle=74, top_tube=560, seat_tube_length_eff=600) == pytest.approx(0, abs=1e-9)
+
+	# the seat angle has two solutions in the seat tube formula
+	assert derived.derive_formula(SEAT_TUBE_FORMULA, TOP_TUBE_FORMULA, "seat_angle") is None
+
+
+def test_derive_formulae():
+	formula_list = [
+		{"equation": "{top_tube} - {reach} - {stack}", "parameters": ["top_tube", "reach", "stack"]},
+		{"equation": "{stack} - 2 * {bb_drop}", "parameters": ["stack", "bb_drop"]}
+	]
+
+	derived_list = derived.derive_formulae(formula_list, timeout=30)
+
+	# eliminating the stack from either formula derives the same formula
+	assert len(derived_list) == 1
+	assert sorted(derived_list[0]['solutions'].keys()) == ["bb_drop", "reach", "top_tube"]
+
+	function = compiled.build_solution_functions(derived_list[0], "reach", derived_list[0]['solutions']['reach'])[0]
+	assert function(top_tube=560, bb_drop=70) == pytest.approx(420)
+
+
+def test_derived_file(tmp_path):
+	filepath = str(tmp_path / "derived.json")
+	formula = dict(derived.derive_formula(SEAT_TUBE_FORMULA, TOP_TUBE_FORMULA, "stack"), solutions={"reach": []})
+
+	saved = derived.save_derived_file(filepath, [formula])
+	assert derived.read_derived_file(filepath) == saved
+	assert saved['version'] == derived.get_formulae_hash()
+
+	# derived from other formulae
+	assert derived.build_derived_file([formula], VALIDATION_FORMULAE[:3])['version'] != saved['version']
+
+	with open(filepath, "w") as json_file:
+		json.dump(dict(saved, formulae=[dict(formula, solutions={"wheelbase": []})]), json_file)
+
+	with pytest.raises(ValueError):
+		derived.read_derived_file(filepath)
+
+	assert not derived.load_derived_file(filepath)
+	assert not derived.load_derived_file(str(tmp_path / "missing.json"))
+
+
+def test_calculate_parameter(derived_reach):
+	values = {"seat_angle": 74, "top_tube": 560, "seat_tube_length_eff": 600}
+	bike_geometry = BikeGeometry({"parameter_list": [{"p": name, "v": value} for name, value in values.items()]})
+	validation_plan = plan.get_plan(bike_geometry)
+
+	# no formula calculates the reach without the stack
+	assert validation_plan.get_equations("reach") == []
+	assert validation_plan.get_derived_equations("reach") == [derived_reach]
+	assert validation_plan.get_derived_equations("seat_angle") == []
+	assert "reach" in [name for name, _ in validation_plan.calculations]
+
+	calculate_parameter("reach", bike_geometry)
+
+	stack = 600 * math.cos((90 - 74) / 180 * math.pi)
+	assert float(bike_geometry.get_parameter("reach").calculated_value) == pytest.approx(
+		560 - stack * math.tan((90 - 74) / 180 * math.pi))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `geometrystatistics` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import json
+import random
+import statistics
+
+import pytest
+
+from datavalidation.core.constants import GEOMETRY_STATISTICS
+from datavalidation.validation import constraints, geometrystatistics, scoring
+from datavalidation.validation.geometrystatistics import RunningMoments, KLLSketch, StatisticsAccumulator
+
+
+def _get_values(count: int, seed: int = 0) -> list:
+	generator = random.Random(seed)
+	return [generator.gauss(1100, 50) for _ in range(count)]
+
+
+def test_running_moments():
+	values = _get_values(1000)
+	moments, first, second = RunningMoments(), RunningMoments(), RunningMoments()
+
+	for value in values:
+		moments.add(value)
+	for value in values[:300]:
+		first.add(value)
+	for value in values[300:]:
+		second.add(value)
+
+	first.merge(second)
+
+	for result in [moments, first]:
+		assert result.count == 1000
+		assert result.mean == pytest.approx(statistics.fmean(values))
+		assert result.std == pytest.approx(statistics.pstdev(values))
+
+
+def test_kll_sketch():
+	values = _get_values(50000)
+	sketch = KLLSketch(seed=0)
+
+	for value in values:
+		sketch.add(value)
+
+	# the memory is bounded
+	assert sum(len(compactor) for compactor in sketch.compactors) < 1000
+	assert sketch.count == len(values)
+
+	# the rank error is small
+	ordered = sorted(values)
+	for q in [0.1, 0.5, 0.9]:
+		rank = ordered.index(sketch.quantile(q)) / len(values)
+		assert rank == pytest.approx(q, abs=0.02)
+
+
+def test_kll_sketch_merge():
+	values = _get_values(20000)
+	sketch_list = [KLLSketch(seed=i) for i in range(4)]
+
+	for i, value in enumerate(values):
+		sketch_list[i % 4].add(value)
+
+	sketch = KLLSketch.from_dict(json.loads(json.dumps(sketch_list[0].to_dict())))
+	for other in sketch_list[1:]:
+		sketch.merge(other)
+
+	assert sketch.count == len(values)
+	assert sorted(values).index(sketch.quantile(0.5)) / len(values) == pytest.approx(0.5, abs=0.02)
+
+
+def test_accumulate_file(tmp_path):
+	jsonl_path = tmp_path / "dump.jsonl"
+	csv_path = tmp_path / "dump.csv"
+
+	with open(jsonl_path, "w") as dump_file:
+		dump_file.write(json.dumps({"parameter_list": [{"p": "chainstay", "v": "420"}, {"p": "size", "v": "M"}]}) + "\n")
+		dump_file.write(json.dumps({"chainstay": 430, "wheelbase": "1100/1120"}) + "\n")
+		dump_file.write("not json\n")
+
+	with open(csv_path, "w") as dump_file:
+		dump_file.write("chainstay,wheelbase\n440,1140\n,\n")
+
+	accumulator = geometrystatistics.accumulate_file(str(jsonl_path))
+	other = StatisticsAccumulator.from_dict(geometrystatistics.accumulate_file(str(csv_path)).to_dict())
+	accumulator.merge(other)
+
+	assert accumulator.geometries == 4
+	assert accumulator.get_statistics() == {
+		"chainstay": {"mean": pytest.approx(430), "median": 430},
+		"wheelbase": {"mean": pytest.approx(1120), "median": 1120}
+	}
+
+	# only the parameters given
+	accumulator = geometrystatistics.accumulate_file(str(jsonl_path), StatisticsAccumulator(["wheelbase"]))
+	assert list(accumulator.get_statistics().keys()) == ["wheelbase"]
+
+
+def test_statistics_file(tmp_path):
+	filepath = str(tmp_path / "statistics.json")
+	saved = geometrystatistics.save_statistics_file(filepath, {"chainstay": {"mean": 430.0, "median": 425.0}}, 10)
+
+	assert geometrystatistics.read_statistics_file(filepath) == saved
+	# the version depends only on the statistics
+	assert geometrystatistics.build_statistics_file({"chainstay": {"mean": 430.0, "median": 425.0}})['version'] == \
+		saved['version']
+
+	previous_statistics = dict(GEOMETRY_STATISTICS)
+
+	try:
+		assert constraints.load_statistics_file(filepath)
+		assert constraints.get_statistics_version() == saved['version']
+		assert GEOMETRY_STATISTICS['chainstay'] == {"mean": 430.0, "median": 425.0}
+		assert scoring.get_deviation("chainstay", 430.0) == pytest.approx(1 - (1 + 425 / 430) / 2)
+
+	finally:
+		GEOMETRY_STATISTICS.clear()
+		GEOMETRY_STATISTICS.update(previous_statistics)
+		scoring.load_statistics()
+		constraints._statistics_version = None
+
+	assert not constraints.load_statistics_file(str(tmp_path / "missing.json"))
+
+	with open(filepath, "w") as json_file:
+		json.dump({"format": geometrystatistics.STATISTICS_FORMAT, "statistics": {"chainstay": {"mean": 1}}}, json_file)
+
+	with pytest.raises(ValueError):
+		geometrystatistics.read_statistics_file(filepath)
+
+
+def test_compute_statistics(tmp_path):
+	state_list = []
+
+	for i, value_list in enumerate([_get_values(500, 1), _get_values(500, 2)]):
+		dump_path = tmp_path / "dump{}.jsonl".format(i)
+		with open(dump_path, "w") as dump_file:
+			dump_file.writelines(json.dumps({"wheelbase": value}) + "\n" for value in value_list)
+
+		state_list.append(str(tmp_path / "state{}.json".format(i)))
+		geometrystatistics.compute_statistics([str(dump_path)], state=state_list[-1])
+
+	# the states of the shards merged are the same as all the dumps at once
+	merged = geometrystatistics.compute_statistics(state_list, str(tmp_path / "merged.json"), merge=True)
+	result = geometrystatistics.compute_statistics([str(tmp_path / "dump0.jsonl"), str(tmp_path / "dump1.jsonl")],
+		str(tmp_path / "statistics.json"))
+
+	assert merged.geometries == result.geometries == 1000
+	assert merged.get_statistics() == result.get_statistics()
+	assert geometrystatistics.read_statistics_file(str(tmp_path / "statistics.json"))['statistics'] == \
+		result.get_statistics()
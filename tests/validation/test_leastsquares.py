@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `leastsquares` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import math
+
+import pytest
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core.constants import GEOMETRY_PARAMETERS
+from datavalidation.validation import leastsquares
+from datavalidation.validation.validate import validate_bike_geometry, set_validation_mode, get_validation_mode
+
+
+# values that satisfy the formulae that only use these parameters
+VALUES = {
+	"reach": 400.0,
+	"stack": 600.0,
+	"seat_angle": 74.0,
+	"top_tube": 600.0 * math.tan(16 / 180 * math.pi) + 400.0,
+	"seat_tube_length_eff": 600.0 / math.cos(16 / 180 * math.pi)
+}
+
+
+@pytest.fixture
+def float_parameters():
+	# the parameters must be numbers to be validated
+	missing = [name for name in VALUES if name not in GEOMETRY_PARAMETERS]
+	GEOMETRY_PARAMETERS.update({name: float for name in missing})
+	yield
+	for name in missing:
+		del GEOMETRY_PARAMETERS[name]
+
+
+def _get_bike_geometry(values: dict) -> BikeGeometry:
+	return BikeGeometry({"parameter_list": [{"p": name, "v": value} for name, value in values.items()]})
+
+
+def test_levenberg_marquardt():
+	# Rosenbrock function as residuals
+	x, cost, iterations = leastsquares.levenberg_marquardt(lambda x: [10 * (x[1] - x[0] ** 2), 1 - x[0]], [-1.2, 1])
+
+	assert x == pytest.approx([1, 1], abs=1e-6)
+	assert cost == pytest.approx(0, abs=1e-12)
+	assert iterations > 0
+
+
+def test_levenberg_marquardt_errors():
+	def only_at_zero(x):
+		if x[0] != 0:
+			raise ValueError("math domain error")
+		return [1.0]
+
+	# the function cannot be evaluated at the initial values
+	assert leastsquares.levenberg_marquardt(lambda x: [math.sqrt(x[0])], [-1.0]) == ([-1.0], math.inf, 0)
+	# nor around them, so the Jacobian cannot be approximated
+	assert leastsquares.levenberg_marquardt(only_at_zero, [0.0]) == ([0.0], 1.0, 1)
+
+
+def test_fit_consistent():
+	fit = leastsquares.fit_bike_geometry(_get_bike_geometry(VALUES))
+
+	assert len(fit['formulae']) == 3
+	for name, value in VALUES.items():
+		assert fit['fitted'][name] == pytest.approx(value, rel=1e-4)
+		assert fit['residuals'][name] < 1e-6
+
+
+def test_fit_missing():
+	values = dict(VALUES)
+	del values['reach']
+	fit = leastsquares.fit_bike_geometry(_get_bike_geometry(values))
+
+	assert "reach" not in fit['observed']
+	assert fit['fitted']['reach'] == pytest.approx(VALUES['reach'], rel=1e-4)
+
+
+def test_fit_typo():
+	values = dict(VALUES, reach=40.0)
+	fit = leastsquares.fit_bike_geometry(_get_bike_geometry(values))
+
+	assert fit['fitted']['reach'] == pytest.approx(VALUES['reach'], rel=1e-3)
+	assert fit['fitted']['stack'] == pytest.approx(VALUES['stack'], rel=1e-3)
+	assert fit['residuals']['reach'] < 1e-3
+
+
+def test_validate_least_squares(float_parameters):
+	previous_mode = get_validation_mode()
+
+	try:
+		set_validation_mode("least_squares")
+
+		bike_geometry = _get_bike_geometry(VALUES)
+		validate_bike_geometry(bike_geometry)
+
+		for name in VALUES:
+			assert bike_geometry.get_parameter(name).confidence == pytest.approx(1, abs=1e-3)
+
+		bike_geometry = _get_bike_geometry(dict(VALUES, reach=40.0))
+		validate_bike_geometry(bike_geometry)
+
+		assert bike_geometry.get_parameter("reach").confidence < 0.2
+		assert bike_geometry.get_parameter("stack").confidence == pytest.approx(1, abs=1e-2)
+
+		with pytest.raises(ValueError):
+			set_validation_mode("unknown")
+
+	finally:
+		set_validation_mode(previous_mode)
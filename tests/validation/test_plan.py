@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `plan` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import random
+
+from datavalidation.core import BikeGeometry, metrics
+from datavalidation.validation import plan
+from datavalidation.validation.equations import get_equations
+
+
+def _get_bike_geometry(parameter_names: list) -> BikeGeometry:
+	return BikeGeometry({"parameter_list": [{"p": name, "v": 100} for name in parameter_names]})
+
+
+def test_get_equations():
+	rng = random.Random(0)
+
+	for _ in range(20):
+		names = [name for name in plan.get_plan_parameters() if rng.random() < 0.6]
+		bike_geometry = _get_bike_geometry(names)
+		validation_plan = plan.get_plan(bike_geometry)
+
+		for name in plan.get_plan_parameters() + ["year"]:
+			assert validation_plan.get_equations(name) == get_equations(name, bike_geometry.get_parameter_list())
+
+
+def test_get_plan_cached():
+	plan.clear_plans()
+	hits = plan.PLAN_CACHE.get(("hit", ))
+	metrics.set_enabled(True)
+
+	try:
+		first_plan = plan.get_plan(_get_bike_geometry(["reach", "stack"]))
+		# other parameters and values do not change the shape of the geometry
+		second_plan = plan.get_plan(BikeGeometry({"parameter_list": [
+			{"p": "stack", "v": 600}, {"p": "reach", "v": 400}, {"p": "year", "v": 2019}]}))
+	finally:
+		metrics.set_enabled(False)
+
+	assert first_plan is second_plan
+	assert plan.PLAN_CACHE.get(("hit", )) == hits + 1
+	assert len(plan.get_cached_plans()) == 1
+	assert first_plan.present == {"reach", "stack"}
+
+	assert plan.get_plan(_get_bike_geometry(["reach"])) is not first_plan
+
+
+def test_empty_geometry():
+	validation_plan = plan.get_plan(_get_bike_geometry([]))
+
+	assert validation_plan.mask == plan.EMPTY_GEOMETRY
+	assert validation_plan.get_equations("reach") == get_equations("reach")
+
+
+def test_steps():
+	validation_plan = plan.get_plan(_get_bike_geometry(["top_tube", "stack", "seat_angle"]))
+
+	assert "reach" in [name for name, _ in validation_plan.calculations]
+	assert all(name in validation_plan.present for name, _ in validation_plan.validations)
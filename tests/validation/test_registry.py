@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `registry` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import os
+import json
+import time
+import threading
+
+import pytest
+
+from datavalidation.core.constants import GEOMETRY_CONSTRAINTS
+from datavalidation.validation import registry, equations, constraints, plan
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+NEW_FORMULA = {
+	"equation": "{wheelbase} - {front_centre} - {rear_centre}",
+	"parameters": ["wheelbase", "front_centre", "rear_centre"]
+}
+
+
+@pytest.fixture
+def builtin_registry():
+	# reinstall the definitions of the package after each test
+	definitions = {
+		"version": registry.get_registry_version(),
+		"formulae": [dict(formula) for formula in VALIDATION_FORMULAE],
+		"constraints": {name: list(constraint_list) for name, constraint_list in GEOMETRY_CONSTRAINTS.items()},
+		"statistics": None
+	}
+	yield
+	registry.install_registry(registry.build_registry(definitions))
+
+
+def _write_registry(filepath, **definitions) -> str:
+	with open(filepath, "w") as json_file:
+		json.dump(dict({"format": registry.REGISTRY_FORMAT}, **definitions), json_file)
+
+	return str(filepath)
+
+
+def test_reload_registry(builtin_registry, tmp_path):
+	filepath = _write_registry(tmp_path / "registry.json", version="test-1",
+		formulae=VALIDATION_FORMULAE + [NEW_FORMULA], constraints={"chainstay": [["<", "front_centre"]]})
+
+	assert registry.reload_registry(filepath)
+	assert registry.get_registry_version() == "test-1"
+
+	assert len(VALIDATION_FORMULAE) == len(registry.read_registry_file(filepath)['formulae'])
+	assert equations.get_equations("rear_centre") == [NEW_FORMULA]
+	assert "rear_centre" in plan.get_plan_parameters()
+	assert constraints.get_constraint_parameters() == ["chainstay", "front_centre"]
+	assert GEOMETRY_CONSTRAINTS == {"chainstay": [("<", "front_centre")]}
+
+
+def test_reload_invalid_registry(builtin_registry, tmp_path):
+	version = registry.get_registry_version()
+	formula_list = list(VALIDATION_FORMULAE)
+
+	invalid_list = [
+		_write_registry(tmp_path / "format.json", format=0),
+		_write_registry(tmp_path / "parameters.json", formulae=[dict(NEW_FORMULA, parameters=["reach"])]),
+		_write_registry(tmp_path / "equation.json", formulae=[dict(NEW_FORMULA, equation="{wheelbase} - (")]),
+		_write_registry(tmp_path / "constraint.json", constraints={"chainstay": [["!=", "wheelbase"]]}),
+		str(tmp_path / "missing.json")
+	]
+
+	for filepath in invalid_list:
+		assert not registry.reload_registry(filepath)
+
+	# the registry in use is kept
+	assert registry.get_registry_version() == version
+	assert VALIDATION_FORMULAE == formula_list
+
+
+def test_version_hash(builtin_registry, tmp_path):
+	filepath = _write_registry(tmp_path / "registry.json", formulae=VALIDATION_FORMULAE)
+
+	# the same definitions get the same version
+	assert registry.read_registry_file(filepath)['version'] == registry.get_definitions_hash()
+
+	registry.save_registry_file(str(tmp_path / "saved.json"), "saved")
+
+	assert registry.reload_registry(str(tmp_path / "saved.json"))
+	assert registry.get_registry_version() == "saved"
+
+
+def test_install_does_not_wait_for_readers(builtin_registry, tmp_path):
+	filepath = _write_registry(tmp_path / "registry.json", version="test-2", formulae=VALIDATION_FORMULAE)
+	new_registry = registry.build_registry(registry.read_registry_file(filepath))
+	thread = threading.Thread(target=registry.install_registry, args=(new_registry, ))
+	versions = []
+
+	with registry.using_registry() as version:
+		thread.start()
+		thread.join(5)
+
+		# the new registry is installed at once, but the geometry being validated keeps the old version
+		assert not thread.is_alive()
+		assert registry.get_registry_version() == version
+
+		other_thread = threading.Thread(target=lambda: versions.append(registry.get_registry_version()))
+		other_thread.start()
+		other_thread.join()
+
+	assert versions == ["test-2"]
+
+	with registry.using_registry() as version:
+		assert version == "test-2"
+
+
+def test_registry_watcher(builtin_registry, tmp_path):
+	filepath = _write_registry(tmp_path / "registry.json", version="test-3", formulae=VALIDATION_FORMULAE)
+	watcher = registry.RegistryWatcher(filepath)
+
+	assert not watcher.check()
+
+	_write_registry(tmp_path / "registry.json", version="test-4", formulae=VALIDATION_FORMULAE)
+	modified = int(time.time() * 1e9) + 10 ** 9
+	os.utime(filepath, ns=(modified, modified))
+
+	assert watcher.check()
+	assert registry.get_registry_version() == "test-4"
+
+
+def test_signal_reload(builtin_registry, tmp_path):
+	filepath = _write_registry(tmp_path / "registry.json", version="test-5", formulae=VALIDATION_FORMULAE)
+	watcher = registry.RegistryWatcher(filepath)
+
+	# the watcher reloads it even if it was not written again
+	assert registry.signal_reload(filepath) == "test-5"
+	assert watcher.check()
+	assert registry.get_registry_version() == "test-5"
+
+	_write_registry(tmp_path / "registry.json", version="test-6", formulae=[{"equation": "{reach}"}])
+
+	with pytest.raises(ValueError):
+		registry.signal_reload(filepath)
+
+
+def test_request_uses_one_version(monkeypatch):
+	from datavalidation import datavalidation
+
+	holds = []
+	using_registry = registry.using_registry
+
+	def counted_using_registry():
+		holds.append(1)
+		return using_registry()
+
+	monkeypatch.setattr(registry, "using_registry", counted_using_registry)
+	monkeypatch.setattr(datavalidation, "_validate_bike_geometry",
+		lambda geometry, registry_version: dict(geometry, registry_version=registry_version))
+
+	response = datavalidation.request_validate_bike_geometry({"geometries": [
+		{"parameter_list": [{"p": "reach", "v": "400"}]}, {"parameter_list": [{"p": "stack", "v": "600"}]}]})
+
+	# the registry is held once for the whole request
+	assert len(holds) == 1
+	assert response['registry_version'] == registry.get_registry_version()
+	assert all(geometry['registry_version'] == response['registry_version'] for geometry in response['geometries'])
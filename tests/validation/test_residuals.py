@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the residual tier of the `validate` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import math
+
+import pytest
+
+from datavalidation.core import BikeGeometry, metrics
+from datavalidation.core.constants import GEOMETRY_CONSTRAINTS, GEOMETRY_PARAMETERS
+from datavalidation.validation import registry
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+from datavalidation.validation.validate import validate_by_residuals, RESIDUAL_TIER
+
+
+# values that satisfy the formulae that only use these parameters
+VALUES = {
+	"reach": 400.0,
+	"stack": 600.0,
+	"seat_angle": 74.0,
+	"top_tube": 600.0 * math.tan(16 / 180 * math.pi) + 400.0,
+	"seat_tube_length_eff": 600.0 / math.cos(16 / 180 * math.pi)
+}
+
+
+@pytest.fixture
+def float_parameters():
+	# the parameters must be numbers to be validated
+	missing = [name for name in VALUES if name not in GEOMETRY_PARAMETERS]
+	GEOMETRY_PARAMETERS.update({name: float for name in missing})
+	yield
+	for name in missing:
+		del GEOMETRY_PARAMETERS[name]
+
+
+@pytest.fixture
+def extra_formula():
+	# a formula after the others, so it is never the first formula of its parameters, and violated by VALUES
+	definitions = {
+		"version": registry.get_registry_version(),
+		"formulae": [dict(formula) for formula in VALIDATION_FORMULAE],
+		"constraints": {name: list(constraint_list) for name, constraint_list in GEOMETRY_CONSTRAINTS.items()},
+		"statistics": None
+	}
+	registry.install_registry(registry.build_registry(dict(definitions, formulae=definitions['formulae'] + [
+		{"equation": "{stack} - {reach} - 150", "parameters": ["stack", "reach"]}])))
+	yield
+	registry.install_registry(registry.build_registry(definitions))
+
+
+def _get_bike_geometry(values: dict) -> BikeGeometry:
+	return BikeGeometry({"parameter_list": [{"p": name, "v": value} for name, value in values.items()]})
+
+
+def test_validate_by_residuals(float_parameters):
+	bike_geometry = _get_bike_geometry(VALUES)
+	hits = RESIDUAL_TIER.get(("hit", ))
+	metrics.set_enabled(True)
+
+	try:
+		assert validate_by_residuals(bike_geometry, 0.01)
+		assert RESIDUAL_TIER.get(("hit", )) == hits + 1
+	finally:
+		metrics.set_enabled(False)
+
+	for name, value in VALUES.items():
+		assert bike_geometry.get_parameter(name).confidence > 0.999
+		assert bike_geometry.get_parameter(name).calculated_value == pytest.approx(value, rel=1e-4)
+
+
+def test_validate_by_residuals_fall_through(float_parameters):
+	# a typo falls through to the formulae and does not modify the geometry
+	bike_geometry = _get_bike_geometry(dict(VALUES, reach=40.0))
+
+	assert not validate_by_residuals(bike_geometry, 0.01)
+	assert all(param.confidence is None for param in bike_geometry.get_parameter_list())
+
+	# missing parameters fall through too
+	assert not validate_by_residuals(_get_bike_geometry({name: value for name, value in VALUES.items()
+		if name != "reach"}), 0.01)
+
+	# disabled by default
+	assert not validate_by_residuals(_get_bike_geometry(VALUES))
+
+
+def test_validate_by_residuals_every_formula(float_parameters, extra_formula):
+	bike_geometry = _get_bike_geometry(VALUES)
+
+	assert not validate_by_residuals(bike_geometry, 0.01)
+	assert all(param.confidence is None for param in bike_geometry.get_parameter_list())
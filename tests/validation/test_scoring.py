@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `scoring` module
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import pytest
+
+from datavalidation.validation import scoring
+
+
+STATISTICS = {
+	"wheelbase": {"mean": 1100.0, "median": 1000.0},
+	"chainstay": {"mean": 430.0, "median": 430.0}
+}
+
+
+@pytest.fixture
+def statistics():
+	scoring.load_statistics(STATISTICS)
+	yield
+	scoring.load_statistics()
+
+
+def test_get_value_similarity():
+	assert scoring.get_value_similarity(100, 100) == 1
+	assert scoring.get_value_similarity(50, 100) == 0.5
+	assert scoring.get_value_similarity(100, 50) == 0.5
+	# ranges give the least or the average similarity of their values
+	assert scoring.get_value_similarity(100, [100, 50]) == 0.5
+	assert scoring.get_value_similarity(100, [100, 50], average=True) == 0.75
+
+
+def test_get_deviation(statistics):
+	assert scoring.get_statistics_parameters() == ["chainstay", "wheelbase"]
+	assert scoring.get_deviation("chainstay", 430) == 0
+	assert scoring.get_deviation("wheelbase", 1000) == pytest.approx(1 - (1000 / 1100 + 1) / 2)
+	assert scoring.get_deviation("chainstay", [430, 215]) == pytest.approx(0.25)
+	assert scoring.get_deviation("chainstay", None) is None
+
+	with pytest.raises(KeyError):
+		scoring.get_deviation("reach", 400)
+
+
+def test_get_deviations(statistics, monkeypatch):
+	value_list = [430, [430, 215], None, 860]
+	deviations = scoring.get_deviations("chainstay", value_list)
+
+	assert deviations == pytest.approx([scoring.get_deviation("chainstay", value) for value in value_list])
+
+	monkeypatch.setattr(scoring, "numpy", None)
+
+	assert scoring.get_deviations("chainstay", value_list) == pytest.approx(deviations)
+
+
+def test_memoised(statistics):
+	with scoring.memoised():
+		deviation = scoring.get_deviation("chainstay", 215)
+
+		with scoring.memoised():
+			assert len(scoring._memo.deviations) == 1
+			assert scoring.get_deviation("chainstay", 215) == deviation
+
+		# new statistics are not mixed with the memoised deviations
+		scoring.load_statistics({"chainstay": {"mean": 215.0, "median": 215.0}})
+		assert scoring.get_deviation("chainstay", 215) == 0
+
+	assert scoring._memo.deviations is None
+
+
+def test_get_range_similarities(monkeypatch):
+	similarities, best = scoring.get_range_similarities([100, 50], [100, 200, 60])
+
+	assert similarities == pytest.approx([(1 + 0.5 + 0.6) / 3, (0.5 + 0.25 + 50 / 60) / 3])
+	assert best == 100
+
+	monkeypatch.setattr(scoring, "numpy", None)
+
+	assert scoring.get_range_similarities([100, 50], [100, 200, 60]) == (pytest.approx(similarities), 100)
+	assert scoring.get_range_similarities([50], [60, 40]) == (pytest.approx([(50 / 60 + 0.8) / 2]), 60)
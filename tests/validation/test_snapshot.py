@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `snapshot` and `compiled` modules
+
+Author: Javier Chiyah
+		Heriot-Watt University
+"""
+
+
+import json
+import itertools
+
+import pytest
+
+from datavalidation.core import BikeGeometry
+from datavalidation.core.constants import GEOMETRY_CONSTRAINTS
+from datavalidation.validation import compiled, constraints, equations
+from datavalidation.validation.snapshot import build_snapshot, save_snapshot, load_snapshot
+from datavalidation.validation.formulae import VALIDATION_FORMULAE
+
+
+TEST_GEOMETRY = {
+	"reach": "400",
+	"stack": "600",
+	"seat_angle": "74",
+	"top_tube": "571.1"
+}
+
+
+@pytest.fixture
+def reach_solution():
+	# compile only the reach of the first formula, presolving all of them takes minutes
+	formula = VALIDATION_FORMULAE[0]
+	compiled.set_compiled_solutions({(formula['equation'], "reach"): compiled.presolve_formula(formula, "reach")})
+
+	yield formula
+
+	compiled.set_compiled_solutions({})
+	equations.set_solver_engine("sympy")
+
+
+def test_solve_compiled(reach_solution):
+	bike = BikeGeometry.from_parameter_dict(TEST_GEOMETRY)
+
+	assert compiled.has_compiled_solution(reach_solution, "reach")
+	assert not compiled.has_compiled_solution(reach_solution, "stack")
+
+	sympy_results = equations.solve_equation(reach_solution, "reach", bike, engine="sympy")
+	compiled_results = equations.solve_equation(reach_solution, "reach", bike, engine="compiled")
+
+	assert len(sympy_results) == len(compiled_results) == 1
+	assert compiled_results[0] == pytest.approx(float(sympy_results[0]))
+
+	# falls back to sympy if there is no compiled solution
+	assert equations.solve_equation(reach_solution, "stack", bike, engine="compiled") == \
+		equations.solve_equation(reach_solution, "stack", bike, engine="sympy")
+
+	with pytest.raises(ValueError):
+		equations.set_solver_engine("unknown")
+
+
+def test_solve_ranges(reach_solution, monkeypatch):
+	values = {"stack": [600, 610, 620], "seat_angle": [73, 74], "top_tube": 571.1}
+	# the reach of every combination, solved one by one
+	expected = [solution for combination in itertools.product(values['stack'], values['seat_angle'])
+		for solution in compiled.solve_compiled(reach_solution, "reach",
+			{"stack": combination[0], "seat_angle": combination[1], "top_tube": 571.1})]
+
+	assert len(expected) == 6
+	assert sorted(compiled.solve_compiled(reach_solution, "reach", values)) == pytest.approx(sorted(expected))
+
+	# the solutions that are not positive are discarded
+	assert compiled.solve_compiled(reach_solution, "reach", dict(values, top_tube=[100, 571.1])) == \
+		pytest.approx(compiled.solve_compiled(reach_solution, "reach", values))
+
+	monkeypatch.setattr(compiled, "numpy", None)
+
+	assert sorted(compiled.solve_compiled(reach_solution, "reach", values)) == pytest.approx(sorted(expected))
+
+	bike = BikeGeometry.from_parameter_dict(TEST_GEOMETRY)
+	bike.get_parameter("stack").set_normalised_value([600, 610])
+	assert len(equations.solve_equation(reach_solution, "reach", bike, force_constraints=False, engine="compiled")) == 2
+	# the ranges use the compiled solutions with the sympy engine too
+	assert len(equations.solve_equation(reach_solution, "reach", bike, force_constraints=False, engine="sympy")) == 2
+
+
+def test_save_load_snapshot(reach_solution, tmp_path):
+	filepath = str(tmp_path / "snapshot.json")
+	snapshot = save_snapshot(filepath, build_snapshot(presolve=False))
+
+	assert len(snapshot['compiled_solutions']) == 1
+
+	compiled.set_compiled_solutions({})
+	assert load_snapshot(filepath)
+	assert compiled.has_compiled_solution(reach_solution, "reach")
+	# the engine is only switched explicitly
+	assert equations.get_solver_engine() == "sympy"
+
+	assert load_snapshot(filepath, use_compiled=True)
+	assert equations.get_solver_engine() == "compiled"
+
+
+def test_load_snapshot_constraints(tmp_path):
+	filepath = str(tmp_path / "snapshot.json")
+	snapshot = build_snapshot(presolve=False)
+	save_snapshot(filepath, dict(snapshot, constraint_table={"chainstay": [["<", "wheelbase"]]}))
+
+	try:
+		# the constraint table of the snapshot is installed
+		assert load_snapshot(filepath)
+		assert constraints.get_constraint_parameters() == ["chainstay", "wheelbase"]
+	finally:
+		save_snapshot(filepath, snapshot)
+		assert load_snapshot(filepath)
+
+	assert constraints.get_constraint_parameters() == constraints.compile_constraints(GEOMETRY_CONSTRAINTS)[0]
+
+
+def test_load_snapshot_fallback(tmp_path):
+	assert not load_snapshot(str(tmp_path / "missing.json"))
+
+	filepath = str(tmp_path / "old_snapshot.json")
+	with open(filepath, "w") as snapshot_file:
+		json.dump({**build_snapshot(presolve=False), "version": "0.0.0"}, snapshot_file)
+
+	assert not load_snapshot(filepath)
+	assert equations.get_solver_engine() == "sympy"
+
+
+def test_warm_up_snapshot(reach_solution, tmp_path):
+	from datavalidation import warmup
+
+	filepath = str(tmp_path / "snapshot.json")
+	save_snapshot(filepath, build_snapshot(presolve=False))
+	compiled.set_compiled_solutions({})
+
+	warmup.warm_up(run_validation=False, freeze_gc=False, snapshot_file=filepath)
+
+	assert compiled.has_compiled_solution(reach_solution, "reach")
+	assert equations.get_solver_engine() == "sympy"